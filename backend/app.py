@@ -46,7 +46,16 @@ def create_app():
     # Initialize extensions with app
     db.init_app(app)
     jwt.init_app(app)
-    
+
+    # orjson-backed jsonify()/get_json() when orjson is installed (see utils/json_provider.py)
+    from utils.json_provider import init_json_provider
+    init_json_provider(app)
+
+    # Optional SQL capture for the index advisor (see utils/query_log.py)
+    if os.environ.get('QUERY_LOG_PATH'):
+        from utils.query_log import enable_query_log
+        enable_query_log(os.environ['QUERY_LOG_PATH'])
+
     # Import models (must be after db initialization)
     from models import User, Doctor, Patient, Department, Appointment, Treatment
     
@@ -58,6 +67,9 @@ def create_app():
     from routes.patient_routes import patient_bp
     from routes.history_routes import history_bp
     from routes.export_routes import export_bp
+    from routes.suggest_routes import suggest_bp
+    from routes.live_routes import live_bp
+    from routes.batch_routes import batch_bp
     
     app.register_blueprint(auth_bp)
     app.register_blueprint(dashboard_bp)
@@ -66,6 +78,17 @@ def create_app():
     app.register_blueprint(patient_bp)
     app.register_blueprint(history_bp)
     app.register_blueprint(export_bp)
+    app.register_blueprint(suggest_bp)
+    app.register_blueprint(live_bp)
+    app.register_blueprint(batch_bp)
+    
+    # Per-user/route token buckets and a concurrency cap for expensive routes (see utils/admission.py)
+    from utils.admission import init_admission_control
+    init_admission_control(app)
+
+    # gzip/brotli for large and streamed responses (see utils/compression.py)
+    from utils.compression import init_compression
+    init_compression(app)
     
     # Error handlers for JWT
     @jwt.expired_token_loader
@@ -96,8 +119,10 @@ def create_app():
     
     return app
 
-# Create app instance
-app = create_app()
+# Create app instance (not when the password hashing pool's spawned workers
+# re-import this file as __mp_main__: they only hash and need no app)
+if __name__ != '__mp_main__':
+    app = create_app()
 
 # Create database tables
 def create_tables():
@@ -0,0 +1,53 @@
+from app import app
+from database import db
+from models import Patient, Export
+from tasks.export_tasks import _file_checksum
+from datetime import datetime
+import os
+import re
+
+# Matches files written by tasks/export_tasks.py
+EXPORT_FILENAME_PATTERN = re.compile(r'^patient_(\d+)_treatment_history_\d{8}_\d{6}(?:_[0-9a-f]{8})?\.(pdf|csv)$')
+
+def backfill_export_catalog():
+    """Register export files created before the export catalog existed"""
+    with app.app_context():
+        db.create_all()
+        exports_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'exports')
+        
+        if not os.path.exists(exports_dir):
+            print("[INFO] No exports directory found. Nothing to backfill.")
+            return
+        
+        known = {filename for (filename,) in db.session.query(Export.filename).all()}
+        added = 0
+        
+        for filename in sorted(os.listdir(exports_dir)):
+            match = EXPORT_FILENAME_PATTERN.match(filename)
+            if not match or filename in known:
+                continue
+            
+            patient_id = int(match.group(1))
+            if not Patient.query.get(patient_id):
+                print(f"[INFO] Skipping {filename}: patient {patient_id} not found")
+                continue
+            
+            filepath = os.path.join(exports_dir, filename)
+            file_stat = os.stat(filepath)
+            db.session.add(Export(
+                patient_id=patient_id,
+                format=match.group(2),
+                filename=filename,
+                filepath=filepath,
+                size=file_stat.st_size,
+                checksum=_file_checksum(filepath),
+                status='completed',
+                created_at=datetime.utcfromtimestamp(file_stat.st_mtime)
+            ))
+            added += 1
+        
+        db.session.commit()
+        print(f"[OK] Registered {added} existing export file(s) in the catalog.")
+
+if __name__ == '__main__':
+    backfill_export_catalog()
@@ -0,0 +1,95 @@
+"""
+Benchmark: response compression, bytes on the wire and CPU per request
+
+Serves appointment-list JSON bodies of several sizes (--rows) through the
+app's JSON provider and the compression hook in utils/compression.py, with
+a Flask test client sending different Accept-Encoding headers:
+- identity: no compression
+- gzip / br: compressed per request (br only when brotli is installed)
+- cached gzip: the pre-compressed cache entry served as stored, as for a
+  doctor search cache hit (the Redis read itself is not timed)
+Reports bytes per response and process CPU time per request (serializing,
+compressing and Werkzeug overhead), averaged over --requests requests.
+
+Usage: python benchmarks/bench_compression.py [--rows 10 100 1000 10000] [--requests 200]
+"""
+import argparse
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+def appointment(i):
+    return {
+        'id': i,
+        'patient_id': i % 997,
+        'doctor_id': i % 53,
+        'patient_name': f'Patient {i % 997}',
+        'doctor_name': f'Doctor {i % 53}',
+        'appointment_date': f'2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}',
+        'appointment_time': f'{9 + i % 8:02d}:{30 * (i % 2):02d}',
+        'visit_type': 'In-person',
+        'status': ('Completed', 'Booked', 'Cancelled')[i % 3],
+        'reason': 'Follow-up visit for recurring symptoms',
+        'has_treatment': i % 3 == 0,
+        'created_at': '2024-01-01T10:00:00',
+        'updated_at': '2024-01-02T10:00:00',
+    }
+
+
+def cpu_per_request(client, path, headers, requests):
+    response = client.get(path, headers=headers)  # Warm up
+    size = len(response.get_data())
+    start = time.process_time()
+    for _ in range(requests):
+        client.get(path, headers=headers).get_data()
+    return size, (time.process_time() - start) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10, 100, 1000, 10000])
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    from flask import Flask, jsonify
+    from utils.compression import ENCODINGS, COMPRESS_MIN_SIZE, compress_for_cache, compress_response, \
+        precompressed_response
+    from utils.json_provider import init_json_provider
+
+    app = Flask(__name__)
+    init_json_provider(app)
+    app.after_request(compress_response)
+    payloads, cached = {}, {}
+
+    @app.route('/list/<int:rows>')
+    def list_view(rows):
+        return jsonify(payloads[rows])
+
+    @app.route('/cached/<int:rows>')
+    def cached_view(rows):
+        return precompressed_response(cached[rows])
+
+    modes = [('identity', '/list', 'identity')] + [(encoding, '/list', encoding) for encoding in ENCODINGS]
+    modes.append(('cached gzip', '/cached', 'gzip'))
+    print(f"{type(app.json).__name__}, COMPRESS_MIN_SIZE={COMPRESS_MIN_SIZE}, {args.requests} requests per row\n")
+    print(f"{'rows':>7}  {'mode':<12}{'bytes':>11}{'ratio':>8}{'CPU ms/req':>12}")
+
+    client = app.test_client()
+    with app.app_context():
+        for rows in args.rows:
+            payloads[rows] = {'appointments': [appointment(i) for i in range(rows)], 'count': rows}
+            cached[rows] = compress_for_cache(payloads[rows])
+            plain = None
+            for label, prefix, encoding in modes:
+                size, cpu = cpu_per_request(client, f'{prefix}/{rows}', {'Accept-Encoding': encoding}, args.requests)
+                plain = plain or size
+                print(f"{rows:>7}  {label:<12}{size:>11,}{plain / size:>7.1f}x{cpu * 1000:>12.3f}")
+            print()
+
+
+if __name__ == '__main__':
+    main()
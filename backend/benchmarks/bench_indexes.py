@@ -0,0 +1,148 @@
+"""
+Benchmark: hot queries before and after the partial/covering indexes
+
+Builds a throwaway SQLite database with N appointments (default 1,000,000)
+spread over two years, plus doctors, patients, availability slots and
+treatments. Times every statement in index_advisor.HOT_QUERIES with only the
+original indexes, then again after creating index_advisor.HOT_QUERY_INDEXES and
+running ANALYZE, and prints the index each plan uses.
+
+Usage: python benchmarks/bench_indexes.py [--appointments 1000000] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+STATUSES = ['Completed'] * 6 + ['Cancelled'] * 2 + ['Booked'] * 2
+SLOT_TIMES = [f'{hour:02d}:{minute:02d}:00.000000' for hour in range(9, 17) for minute in (0, 30)]
+
+
+def timed(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--appointments', type=int, default=1_000_000)
+    parser.add_argument('--doctors', type=int, default=500)
+    parser.add_argument('--patients', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='hms-bench-'), 'bench.db')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + db_path
+
+    from app import app
+    from database import db
+    from sqlalchemy import text
+    from index_advisor import HOT_QUERIES, HOT_QUERY_INDEXES, hot_query_params, explain
+
+    random.seed(42)
+    today = date.today()
+    with app.app_context():
+        db.create_all()
+        with db.engine.begin() as conn:
+            for table_name, index_name in HOT_QUERY_INDEXES:
+                conn.execute(text(f'DROP INDEX IF EXISTS "{index_name}"'))
+
+        print(f"Generating {args.appointments:,} appointments in {db_path} ...")
+        start = time.perf_counter()
+        batch = 50_000
+        with db.engine.begin() as conn:
+            conn.execute(text("INSERT INTO departments (id, name) VALUES " +
+                              ', '.join(f"({i}, 'Dept {i}')" for i in range(1, 21))))
+            conn.execute(text(
+                "INSERT INTO users (id, username, email, password_hash, role, is_active) "
+                "VALUES (:id, :username, :email, 'x', :role, 1)"
+            ), [{'id': i, 'username': f'user{i}', 'email': f'user{i}@example.com',
+                 'role': 'doctor' if i <= args.doctors else 'patient'}
+                for i in range(1, args.doctors + args.patients + 1)])
+            conn.execute(text(
+                "INSERT INTO doctors (id, user_id, first_name, last_name, specialization_id, is_active) "
+                "VALUES (:id, :id, 'Doc', :last, :spec, :active)"
+            ), [{'id': i, 'last': f'D{i}', 'spec': random.randint(1, 20), 'active': int(random.random() > 0.1)}
+                for i in range(1, args.doctors + 1)])
+            conn.execute(text(
+                "INSERT INTO patients (id, user_id, first_name, last_name, is_active) "
+                "VALUES (:id, :user_id, 'Pat', :last, 1)"
+            ), [{'id': i, 'user_id': args.doctors + i, 'last': f'P{i}'} for i in range(1, args.patients + 1)])
+
+            slots = []
+            for doctor_id in range(1, args.doctors + 1):
+                for offset in range(-30, 30):
+                    for hour in (9, 11, 14, 16):
+                        slots.append({'doctor_id': doctor_id, 'date': (today + timedelta(days=offset)).isoformat(),
+                                      'start': f'{hour:02d}:00:00.000000', 'end': f'{hour + 2:02d}:00:00.000000',
+                                      'open': int(random.random() > 0.3)})
+            conn.execute(text(
+                "INSERT INTO doctor_availability (doctor_id, date, start_time, end_time, is_available) "
+                "VALUES (:doctor_id, :date, :start, :end, :open)"
+            ), slots)
+
+            for offset in range(0, args.appointments, batch):
+                rows = []
+                for i in range(offset + 1, min(offset + batch, args.appointments) + 1):
+                    day = today + timedelta(days=random.randint(-700, 30))
+                    status = random.choice(STATUSES) if day < today else random.choice(['Booked'] * 9 + ['Cancelled'])
+                    rows.append({'id': i, 'patient_id': random.randint(1, args.patients),
+                                 'doctor_id': random.randint(1, args.doctors), 'date': day.isoformat(),
+                                 'time': random.choice(SLOT_TIMES), 'status': status})
+                conn.execute(text(
+                    "INSERT INTO appointments (id, patient_id, doctor_id, appointment_date, appointment_time, status) "
+                    "VALUES (:id, :patient_id, :doctor_id, :date, :time, :status)"
+                ), rows)
+            conn.execute(text(
+                "INSERT INTO treatments (appointment_id, diagnosis) "
+                "SELECT id, 'Checkup' FROM appointments WHERE status = 'Completed'"
+            ))
+            conn.execute(text("ANALYZE"))
+        print(f"  generated in {time.perf_counter() - start:.1f}s\n")
+
+        params = hot_query_params()
+
+        def run_all():
+            results = {}
+            with db.engine.connect() as conn:
+                for label, sql in HOT_QUERIES:
+                    elapsed = timed(lambda: conn.execute(text(sql), params).fetchall(), args.repeat)
+                    plan = ' / '.join(explain(conn, sql, params))
+                    results[label] = (elapsed, plan)
+            return results
+
+        before = run_all()
+        start = time.perf_counter()
+        with db.engine.begin() as conn:
+            for table_name, index_name in HOT_QUERY_INDEXES:
+                index = next(i for i in db.metadata.tables[table_name].indexes if i.name == index_name)
+                index.create(bind=conn)
+            conn.execute(text("ANALYZE"))
+        print(f"Created {len(HOT_QUERY_INDEXES)} indexes in {time.perf_counter() - start:.1f}s\n")
+        after = run_all()
+
+        print(f"{'query':<44}{'before ms':>11}{'after ms':>11}{'speedup':>10}")
+        for label, _ in HOT_QUERIES:
+            before_time, before_plan = before[label]
+            after_time, after_plan = after[label]
+            print(f"{label:<44}{before_time * 1000:>11.2f}{after_time * 1000:>11.2f}"
+                  f"{before_time / after_time if after_time else float('inf'):>9.1f}x")
+            print(f"    before: {before_plan}")
+            print(f"    after:  {after_plan}")
+
+    print(f"\nDatabase left at {db_path} (delete when done)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+Benchmark: appointment list serialization, ORM + to_dict() vs Core rows vs orjson
+
+Builds a throwaway SQLite database with one doctor who has N appointments
+(default 20,000) across --patients patients, 60% of them with a treatment,
+then times the body of GET /api/doctor/appointments three ways:
+- orm: Appointment objects, to_dict() (lazy loading patient, doctor and
+  treatment per row) and Flask's default JSON provider
+- core: utils.appointment_rows (one Core statement, row tuples shaped into
+  the same dicts) and the default provider
+- core+orjson: the same rows through utils.json_provider.OrjsonProvider
+Reports the best of --repeat runs for building the list and for serializing
+it, and checks that all three produce the same JSON.
+
+Usage: python benchmarks/bench_json.py [--appointments 20000] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+STATUSES = ['Completed'] * 6 + ['Cancelled'] * 2 + ['Booked'] * 2
+SLOT_TIMES = [f'{hour:02d}:{minute:02d}:00.000000' for hour in range(9, 17) for minute in (0, 30)]
+
+
+def timed(fn, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--appointments', type=int, default=20_000)
+    parser.add_argument('--patients', type=int, default=2_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='hms-bench-'), 'bench.db')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + db_path
+
+    from app import app
+    from database import db
+    from flask.json.provider import DefaultJSONProvider
+    from models import Appointment
+    from sqlalchemy import text
+    from utils.appointment_rows import appointment_rows
+    from utils.json_provider import OrjsonProvider, orjson
+
+    if orjson is None:
+        sys.exit("orjson is not installed (pip install orjson)")
+
+    random.seed(42)
+    today = date.today()
+    with app.app_context():
+        db.create_all()
+        print(f"Generating {args.appointments:,} appointments in {db_path} ...")
+        with db.engine.begin() as conn:
+            conn.execute(text("INSERT INTO departments (id, name) VALUES (1, 'Cardiology')"))
+            conn.execute(text(
+                "INSERT INTO users (id, username, email, password_hash, role, is_active) "
+                "VALUES (:id, :username, :email, 'x', :role, 1)"
+            ), [{'id': i, 'username': f'user{i}', 'email': f'user{i}@example.com',
+                 'role': 'doctor' if i == 1 else 'patient'} for i in range(1, args.patients + 2)])
+            conn.execute(text(
+                "INSERT INTO doctors (id, user_id, first_name, last_name, specialization_id, is_active) "
+                "VALUES (1, 1, 'Doc', 'One', 1, 1)"
+            ))
+            conn.execute(text(
+                "INSERT INTO patients (id, user_id, first_name, last_name, is_active) "
+                "VALUES (:id, :user_id, 'Pat', :last, 1)"
+            ), [{'id': i, 'user_id': i + 1, 'last': f'P{i}'} for i in range(1, args.patients + 1)])
+            rows = []
+            for i in range(1, args.appointments + 1):
+                day = today + timedelta(days=random.randint(-700, 30))
+                rows.append({'id': i, 'patient_id': random.randint(1, args.patients), 'date': day.isoformat(),
+                             'time': random.choice(SLOT_TIMES), 'status': random.choice(STATUSES),
+                             'reason': 'Follow-up visit for recurring symptoms'})
+            conn.execute(text(
+                "INSERT INTO appointments (id, patient_id, doctor_id, appointment_date, appointment_time, visit_type, "
+                "status, reason, created_at, updated_at) "
+                "VALUES (:id, :patient_id, 1, :date, :time, 'In-person', :status, :reason, "
+                "'2024-01-01 10:00:00.000000', '2024-01-02 10:00:00.000000')"
+            ), rows)
+            conn.execute(text(
+                "INSERT INTO treatments (appointment_id, diagnosis, prescription, medicines, notes, created_at, updated_at) "
+                "SELECT id, 'Hypertension', 'Amlodipine 5mg once daily', '[\"Amlodipine\"]', 'Review in 4 weeks', "
+                "'2024-01-02 10:00:00.000000', '2024-01-02 10:00:00.000000' "
+                "FROM appointments WHERE status = 'Completed'"
+            ))
+
+        default_provider = DefaultJSONProvider(app)
+        orjson_provider = OrjsonProvider(app)
+
+        def orm_list():
+            db.session.expunge_all()  # Hydrate fresh objects every run, as a request would
+            appointments = Appointment.query.filter_by(doctor_id=1).order_by(
+                Appointment.appointment_date.desc(),
+                Appointment.appointment_time.desc()
+            ).all()
+            data = []
+            for apt in appointments:
+                apt_dict = apt.to_dict()
+                if apt.treatment:
+                    apt_dict['treatment'] = apt.treatment.to_dict()
+                data.append(apt_dict)
+            return data
+
+        def core_list():
+            return appointment_rows(Appointment.doctor_id == 1, include_treatment=True)
+
+        def body(data):
+            return {'appointments': data, 'count': len(data)}
+
+        paths = [
+            ('orm', orm_list, default_provider),
+            ('core', core_list, default_provider),
+            ('core+orjson', core_list, orjson_provider),
+        ]
+        print(f"\n{'path':<14}{'build ms':>10}{'dump ms':>10}{'total ms':>10}{'speedup':>9}{'KB':>9}")
+        baseline, reference = None, None
+        for label, build, provider in paths:
+            build_time, data = timed(build, args.repeat)
+            dump_time, response = timed(lambda: provider.response(body(data)), args.repeat)
+            payload = response.get_data()
+            total = build_time + dump_time
+            baseline = baseline or total
+            decoded = json.loads(payload)
+            if reference is None:
+                reference = decoded
+            elif decoded != reference:
+                print(f"  !! {label} output differs from orm")
+            print(f"{label:<14}{build_time * 1000:>10.1f}{dump_time * 1000:>10.1f}{total * 1000:>10.1f}"
+                  f"{baseline / total:>8.1f}x{len(payload) / 1024:>9.0f}")
+
+    print(f"\nDatabase left at {db_path} (delete when done)")
+
+
+if __name__ == '__main__':
+    main()
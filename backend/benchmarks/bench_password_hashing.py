@@ -0,0 +1,83 @@
+"""
+Benchmark: login password verification inline vs on the hashing pool
+
+Simulates a login storm: --clients threads (web worker threads) each verify
+passwords back to back for --seconds. Inline, each thread runs Werkzeug's
+check_password_hash itself; with the pool, each thread goes through
+utils.passwords.verify_password on 1..N worker processes. Reports logins per
+second, logins per second per core in use, p95 latency and how many logins
+were turned away with PasswordHashingBusy.
+
+Usage: python benchmarks/bench_password_hashing.py [--method scrypt] [--clients 32] [--seconds 5]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+def storm(verify, password_hash, clients, seconds):
+    latencies, busy = [], [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def client():
+        mine, rejected = [], 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                verify(password_hash, 'correct horse')
+                mine.append(time.perf_counter() - start)
+            except Exception:
+                rejected += 1
+                time.sleep(0.01)
+        with lock:
+            latencies.extend(mine)
+            busy[0] += rejected
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95)] if latencies else 0.0
+    return len(latencies) / elapsed, p95, busy[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--method', default='scrypt', help='Werkzeug method string, e.g. scrypt or pbkdf2:sha256:600000')
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    from werkzeug.security import check_password_hash, generate_password_hash
+    import utils.passwords as passwords
+
+    password_hash = generate_password_hash('correct horse', method=args.method)
+    print(f"{args.method} ({password_hash.split('$', 1)[0]}), {args.clients} clients, {args.seconds:.0f}s per run, "
+          f"{os.cpu_count()} cores\n")
+    print(f"{'mode':<12}{'cores':>6}{'logins/s':>11}{'per core':>10}{'p95 ms':>10}{'busy':>7}")
+
+    rate, p95, busy = storm(check_password_hash, password_hash, args.clients, args.seconds)
+    print(f"{'inline':<12}{os.cpu_count():>6}{rate:>11.1f}{rate / (os.cpu_count() or 1):>10.1f}{p95 * 1000:>10.1f}{busy:>7}")
+
+    counts = sorted({min(2 ** power, args.max_workers) for power in range(args.max_workers.bit_length() + 1)})
+    for workers in counts:
+        passwords.configure_pool(workers)
+        passwords.verify_password(password_hash, 'warm up')  # Start the workers outside the timed run
+        rate, p95, busy = storm(passwords.verify_password, password_hash, args.clients, args.seconds)
+        print(f"{'pool':<12}{workers:>6}{rate:>11.1f}{rate / workers:>10.1f}{p95 * 1000:>10.1f}{busy:>7}")
+    passwords.shutdown_pool()
+
+
+if __name__ == '__main__':
+    main()
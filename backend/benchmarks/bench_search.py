@@ -0,0 +1,103 @@
+"""
+Benchmark: patient search with ILIKE '%term%' vs the full-text search index
+
+Builds a throwaway SQLite database with N patients (default 1,000,000),
+then times the old ILIKE query from get_all_patients against the FTS5
+backend in utils/search.py. ILIKE returns every match (as the old
+endpoint did); the index returns the top SEARCH_RESULT_LIMIT by rank.
+
+Usage: python benchmarks/bench_search.py [--patients 1000000] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+FIRST_NAMES = ['James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda', 'David',
+               'Elizabeth', 'William', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah',
+               'Arjun', 'Priya', 'Rahul', 'Ananya', 'Vikram', 'Kavya', 'Krishna', 'Meera', 'Rohan', 'Isha']
+LAST_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez',
+              'Martinez', 'Sharma', 'Patel', 'Reddy', 'Iyer', 'Nair', 'Gupta', 'Singh', 'Kumar', 'Rao']
+
+QUERIES = ['john', 'sha', 'krishna patel', 'user123456', 'jhonson']
+
+
+def timed(fn, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--patients', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='hms-bench-'), 'bench.db')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + db_path
+
+    from app import app
+    from database import db
+    from models import Patient, User
+    from sqlalchemy import or_, text
+    from utils.search import get_search_backend
+
+    random.seed(42)
+    with app.app_context():
+        db.create_all()
+        print(f"Generating {args.patients:,} patients in {db_path} ...")
+        start = time.perf_counter()
+        batch = 50_000
+        with db.engine.begin() as conn:
+            for offset in range(0, args.patients, batch):
+                ids = range(offset + 1, min(offset + batch, args.patients) + 1)
+                conn.execute(text(
+                    "INSERT INTO users (id, username, email, password_hash, role, is_active) "
+                    "VALUES (:id, :username, :email, 'x', 'patient', 1)"
+                ), [{'id': i, 'username': f'user{i}', 'email': f'user{i}@example.com'} for i in ids])
+                conn.execute(text(
+                    "INSERT INTO patients (id, user_id, first_name, last_name, phone, is_active) "
+                    "VALUES (:id, :id, :first, :last, :phone, 1)"
+                ), [{'id': i, 'first': random.choice(FIRST_NAMES), 'last': random.choice(LAST_NAMES),
+                     'phone': f'9{random.randint(100000000, 999999999)}'} for i in ids])
+        print(f"  generated in {time.perf_counter() - start:.1f}s")
+
+        start = time.perf_counter()
+        backend = get_search_backend()
+        print(f"  built {backend.name} index in {time.perf_counter() - start:.1f}s\n")
+
+        def ilike(term):
+            pattern = f'%{term}%'
+            return db.session.query(Patient.id).join(User).filter(
+                or_(
+                    Patient.first_name.ilike(pattern),
+                    Patient.last_name.ilike(pattern),
+                    Patient.phone.ilike(pattern),
+                    User.email.ilike(pattern),
+                    User.username.ilike(pattern)
+                )
+            ).all()
+
+        print(f"{'query':<16}{'ILIKE ms':>12}{'index ms':>12}{'speedup':>10}{'hits':>8}")
+        for term in QUERIES:
+            like_time, _ = timed(lambda: ilike(term), args.repeat)
+            index_time, ids = timed(lambda: backend.search_patients(term), args.repeat)
+            print(f"{term:<16}{like_time * 1000:>12.2f}{index_time * 1000:>12.2f}"
+                  f"{like_time / index_time if index_time else float('inf'):>9.1f}x{len(ids):>8}")
+
+    print(f"\nDatabase left at {db_path} (delete when done)")
+
+
+if __name__ == '__main__':
+    main()
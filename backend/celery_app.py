@@ -3,6 +3,7 @@ Celery application configuration
 """
 from celery import Celery
 from celery.schedules import crontab
+from datetime import timedelta
 import os
 
 # Redis configuration
@@ -13,7 +14,8 @@ celery_app = Celery(
     'hospital_management',
     broker=REDIS_URL,
     backend=REDIS_URL,
-    include=['tasks.reminder_tasks', 'tasks.report_tasks', 'tasks.export_tasks']
+    include=['tasks.reminder_tasks', 'tasks.report_tasks', 'tasks.export_tasks', 'tasks.availability_tasks',
+             'tasks.archive_tasks', 'tasks.event_tasks', 'tasks.analytics_tasks']
 )
 
 # Celery configuration
@@ -40,6 +42,36 @@ celery_app.conf.beat_schedule = {
         'schedule': crontab(day_of_month=1, hour=9, minute=0),  # Run on 1st of every month at 9:00 AM
         'options': {'queue': 'reports'}
     },
+    'nightly-availability-materialization': {
+        'task': 'tasks.availability_tasks.materialize_doctor_availability',
+        'schedule': crontab(hour=0, minute=30),  # Run daily at 12:30 AM
+        'options': {'queue': 'maintenance'}
+    },
+    'nightly-appointment-archival': {
+        'task': 'tasks.archive_tasks.archive_old_appointments',
+        'schedule': crontab(hour=2, minute=0),  # Run daily at 2:00 AM
+        'options': {'queue': 'maintenance'}
+    },
+    'outbox-dispatch': {
+        'task': 'tasks.event_tasks.dispatch_outbox',
+        'schedule': timedelta(seconds=10),  # Catch-up; writes also kick the dispatcher directly
+        'options': {'queue': 'events'}
+    },
+    'nightly-outbox-purge': {
+        'task': 'tasks.event_tasks.purge_outbox',
+        'schedule': crontab(hour=3, minute=0),  # Run daily at 3:00 AM
+        'options': {'queue': 'maintenance'}
+    },
+    'nightly-analytics-rollup': {
+        'task': 'tasks.analytics_tasks.refresh_recent_rollup',
+        'schedule': crontab(hour=3, minute=30),  # Run daily at 3:30 AM
+        'options': {'queue': 'maintenance'}
+    },
+    'nightly-columnar-extract': {
+        'task': 'tasks.analytics_tasks.write_columnar_extract',
+        'schedule': crontab(hour=4, minute=0),  # Run daily at 4:00 AM
+        'options': {'queue': 'reports'}
+    },
 }
 
 if __name__ == '__main__':
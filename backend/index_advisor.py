@@ -0,0 +1,209 @@
+"""
+Index advisor: replay hot queries with EXPLAIN QUERY PLAN
+
+Takes the most expensive statements from a query log (see utils/query_log.py,
+enable with QUERY_LOG_PATH=...), or the built-in HOT_QUERIES catalog when no
+log is given, and prints the SQLite query plan and replay time for each.
+Full table scans, skip-scans over a leading index column and temp b-tree sorts
+are flagged. The advisor then tries every candidate index declared in
+models.py that is missing from the database (create, re-plan, re-time, drop)
+and recommends the ones the planner picks up that make the statement faster.
+Run it against a copy of production data, not production.
+
+Usage:
+    python index_advisor.py                      # built-in hot query catalog
+    python index_advisor.py --log queries.jsonl  # top statements from a query log
+    python index_advisor.py --top 20
+"""
+import argparse
+import re
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateIndex
+
+from app import app
+from database import db
+
+# Statements behind the dashboards, reminders, search and booking checks,
+# written the way the ORM issues them (status/is_available as parameters)
+HOT_QUERIES = [
+    ('upcoming booked count (admin dashboard)',
+     "SELECT count(*) FROM appointments WHERE appointment_date >= :today AND status = :booked"),
+    ('reminders for today',
+     "SELECT * FROM appointments WHERE appointment_date = :today AND status = :booked"),
+    ('doctor upcoming week (doctor dashboard)',
+     "SELECT * FROM appointments WHERE doctor_id = :doctor_id AND appointment_date >= :today "
+     "AND appointment_date <= :week_end AND status = :booked ORDER BY appointment_date, appointment_time"),
+    ('doctor slot conflict (booking)',
+     "SELECT * FROM appointments WHERE doctor_id = :doctor_id AND appointment_date = :today "
+     "AND appointment_time = :slot_time AND status = :booked LIMIT 1"),
+    ('doctors available on date (search)',
+     "SELECT DISTINCT doctor_id FROM doctor_availability WHERE date = :today AND is_available = :open"),
+    ('active doctors by specialization (search)',
+     "SELECT * FROM doctors WHERE is_active = :open AND specialization_id = :specialization_id"),
+    ('patient history with treatments',
+     "SELECT appointments.*, treatments.diagnosis FROM appointments "
+     "JOIN treatments ON treatments.appointment_id = appointments.id "
+     "WHERE appointments.patient_id = :patient_id ORDER BY appointments.appointment_date DESC"),
+]
+
+# Indexes added for these statements (migrations/0003_hot_query_indexes.py)
+HOT_QUERY_INDEXES = [
+    ('appointments', 'idx_booked_date'),
+    ('doctor_availability', 'idx_availability_open_date'),
+    ('doctors', 'idx_doctor_specialization_active'),
+]
+
+FLAGS = (
+    (re.compile(r'^SCAN (\w+)\b(?! USING COVERING INDEX)'), 'full table scan'),
+    (re.compile(r'\(ANY\('), 'skip-scan over leading index column'),
+    (re.compile(r'USE TEMP B-TREE'), 'sort/distinct in temp b-tree'),
+)
+
+
+def hot_query_params():
+    """Representative bind values for HOT_QUERIES"""
+    today = date.today()
+    with db.engine.connect() as conn:
+        doctor_id = conn.execute(text("SELECT min(id) FROM doctors")).scalar() or 1
+        patient_id = conn.execute(text("SELECT min(id) FROM patients")).scalar() or 1
+        specialization_id = conn.execute(text("SELECT min(id) FROM departments")).scalar() or 1
+    return {
+        'today': today.isoformat(),
+        'week_end': (today + timedelta(days=7)).isoformat(),
+        'slot_time': '10:00:00.000000',
+        'booked': 'Booked',
+        'open': 1,
+        'doctor_id': doctor_id,
+        'patient_id': patient_id,
+        'specialization_id': specialization_id,
+    }
+
+
+def load_logged_queries(path, top):
+    """Group logged statements by text and return the `top` by total time"""
+    from utils.query_log import read_query_log
+
+    totals = defaultdict(lambda: {'count': 0, 'ms': 0.0, 'params': None})
+    for sql, params, ms in read_query_log(path):
+        entry = totals[sql]
+        entry['count'] += 1
+        entry['ms'] += ms
+        entry['params'] = params
+    ranked = sorted(totals.items(), key=lambda item: item[1]['ms'], reverse=True)[:top]
+    return [
+        (f"{entry['count']} calls, {entry['ms']:.1f} ms total", sql, entry['params'])
+        for sql, entry in ranked
+    ]
+
+
+def explain(conn, sql, params):
+    """Return the EXPLAIN QUERY PLAN detail lines for a statement"""
+    if isinstance(params, dict):
+        rows = conn.execute(text('EXPLAIN QUERY PLAN ' + sql), params)
+    else:
+        rows = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + sql, tuple(params))
+    return [row[-1] for row in rows]
+
+
+def replay(conn, sql, params, repeat=3):
+    """Run a statement `repeat` times and return the best time in ms"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        if isinstance(params, dict):
+            conn.execute(text(sql), params).fetchall()
+        else:
+            conn.exec_driver_sql(sql, tuple(params)).fetchall()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def plan_problems(plan):
+    problems = []
+    for line in plan:
+        for pattern, label in FLAGS:
+            if pattern.search(line):
+                problems.append(f"{label}: {line}")
+    return problems
+
+
+def candidate_indexes(conn):
+    """Indexes declared on the models that do not exist in the database yet"""
+    inspector = inspect(conn)
+    missing = []
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        missing.extend(index for index in table.indexes if index.name not in existing)
+    return missing
+
+
+def advise(queries):
+    with db.engine.connect() as conn:
+        if conn.dialect.name != 'sqlite':
+            print(f"[INFO] EXPLAIN QUERY PLAN replay needs SQLite (connected to {conn.dialect.name})")
+            return []
+
+        candidates = candidate_indexes(conn)
+        recommended = {}
+
+        for label, sql, params in queries:
+            plan = explain(conn, sql, params)
+            elapsed = replay(conn, sql, params)
+            print(f"\n== {label}\n   {' '.join(sql.split())[:160]}")
+            for line in plan:
+                print(f"   plan: {line}")
+            print(f"   time: {elapsed:.2f} ms")
+            for problem in plan_problems(plan):
+                print(f"   [WARN] {problem}")
+
+            improved = False
+            for index in candidates:
+                conn.execute(CreateIndex(index))
+                try:
+                    new_plan = explain(conn, sql, params)
+                    if not any(index.name in line for line in new_plan):
+                        continue
+                    new_elapsed = replay(conn, sql, params)
+                finally:
+                    conn.exec_driver_sql(f'DROP INDEX "{index.name}"')
+                if new_elapsed < elapsed:
+                    improved = True
+                    print(f"   [FIX] {index.name}: {new_elapsed:.2f} ms ({' / '.join(new_plan)})")
+                    recommended.setdefault(index.name, index)
+            if not improved:
+                print("   [OK] no candidate index improves this statement")
+        conn.rollback()
+
+    print("\nRecommended indexes:")
+    if not recommended:
+        print("   none")
+    for index in recommended.values():
+        print(f"   {str(CreateIndex(index).compile(dialect=db.engine.dialect)).strip()};")
+    print("Add them to models.py and a migration in migrations/, then run: python migrate.py upgrade")
+    return list(recommended)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--log', help='query log written with QUERY_LOG_PATH (JSON lines)')
+    parser.add_argument('--top', type=int, default=15, help='number of logged statements to replay')
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.log:
+            queries = load_logged_queries(args.log, args.top)
+        else:
+            params = hot_query_params()
+            queries = [(label, sql, params) for label, sql in HOT_QUERIES]
+        advise(queries)
+
+
+if __name__ == '__main__':
+    main()
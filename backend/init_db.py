@@ -13,10 +13,23 @@ def init_database():
         # db.drop_all()
         
         # Create all tables
+        from sqlalchemy import inspect
+        from utils.migrations import stamp, upgrade
+        fresh = not inspect(db.engine).get_table_names()
         print("Creating database tables...")
         db.create_all()
         print("[OK] Database tables created successfully!")
         
+        # A fresh schema already matches every migration; older ones are migrated
+        if fresh:
+            stamp(None)
+        else:
+            upgrade()
+        
+        # Create full-text search index (kept in sync by the database)
+        from utils.search import get_search_backend
+        print(f"[OK] Search index ready ({get_search_backend().name})")
+        
         # Check if admin already exists
         admin = User.query.filter_by(role='admin').first()
         if admin:
@@ -0,0 +1,73 @@
+"""
+Schema migration command line
+
+    python migrate.py status                     # applied / pending migrations, backfill progress
+    python migrate.py upgrade                    # apply all pending migrations
+    python migrate.py upgrade --target 0002      # apply up to a version
+    python migrate.py upgrade --batch-size 500 --sleep 0.2 --max-seconds 600
+    python migrate.py stamp 0003                 # mark as applied without running
+
+Backfills run in batches (MIGRATION_BATCH_SIZE, default 1000) with a pause
+between batches (MIGRATION_BATCH_SLEEP, default 0.05s) and can be stopped at
+any time: the next run resumes from the last checkpointed batch. Use
+--max-seconds to spread a large backfill over several quiet periods.
+"""
+import argparse
+import sys
+
+from app import app
+from utils.migrations import DEFAULT_BATCH_SIZE, DEFAULT_BATCH_SLEEP, pending_migrations, status, stamp, upgrade
+
+
+def print_status():
+    for migration, applied, checkpoints in status():
+        if applied:
+            state = f"applied {applied.applied_at:%Y-%m-%d %H:%M} ({applied.duration_ms} ms)"
+        else:
+            state = 'pending'
+        print(f"  {migration.version}_{migration.name:<32} {state}")
+        for checkpoint in checkpoints:
+            print(f"      backfill {checkpoint.step}: {checkpoint.rows_done} rows, last id {checkpoint.last_key}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('status', help='show applied and pending migrations')
+
+    upgrade_parser = subparsers.add_parser('upgrade', help='apply pending migrations')
+    upgrade_parser.add_argument('--target', help='stop after this version')
+    upgrade_parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    upgrade_parser.add_argument('--sleep', type=float, default=DEFAULT_BATCH_SLEEP,
+                                help='seconds to pause between backfill batches')
+    upgrade_parser.add_argument('--max-seconds', type=float,
+                                help='pause backfills after this long; rerun to resume')
+
+    stamp_parser = subparsers.add_parser('stamp', help='mark migrations as applied without running them')
+    stamp_parser.add_argument('version')
+
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.command == 'status':
+            print_status()
+        elif args.command == 'upgrade':
+            try:
+                applied = upgrade(args.target, batch_size=args.batch_size, batch_sleep=args.sleep,
+                                  max_seconds=args.max_seconds)
+            except Exception as e:
+                print(f"[ERROR] Migration failed: {e}")
+                sys.exit(1)
+            remaining = pending_migrations(args.target)
+            if remaining:
+                print(f"[INFO] {len(applied)} migration(s) applied, {len(remaining)} still pending. Run again to resume.")
+            else:
+                print(f"Schema update complete. {len(applied)} migration(s) applied.")
+        elif args.command == 'stamp':
+            stamped = stamp(args.version)
+            print(f"[OK] Stamped {', '.join(stamped) if stamped else 'nothing (already applied)'}")
+
+
+if __name__ == '__main__':
+    main()
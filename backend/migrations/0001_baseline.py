@@ -0,0 +1,150 @@
+"""
+Baseline schema: all tables plus the columns added by the old update scripts
+
+Brings databases created before versioned migrations (via init_db.py,
+update_db.py and update_schema_category.py) to the same starting point as a
+fresh one. Every step is a no-op when already applied.
+"""
+from sqlalchemy import (
+    Boolean, Column, Date, DateTime, ForeignKey, Index, Integer, MetaData, Numeric, String, Table, Text, Time
+)
+
+# Frozen copy of the models as of this migration
+metadata = MetaData()
+
+users = Table(
+    'users', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('username', String(80), unique=True, nullable=False, index=True),
+    Column('email', String(120), unique=True, nullable=False, index=True),
+    Column('password_hash', String(255), nullable=False),
+    Column('role', String(20), nullable=False),
+    Column('created_at', DateTime),
+    Column('updated_at', DateTime),
+    Column('is_active', Boolean),
+)
+
+departments = Table(
+    'departments', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('name', String(100), unique=True, nullable=False),
+    Column('category', String(100)),
+    Column('description', Text),
+    Column('created_at', DateTime),
+)
+
+doctors = Table(
+    'doctors', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('user_id', Integer, ForeignKey('users.id'), unique=True, nullable=False),
+    Column('first_name', String(100), nullable=False),
+    Column('last_name', String(100), nullable=False),
+    Column('specialization_id', Integer, ForeignKey('departments.id'), nullable=False),
+    Column('phone', String(20)),
+    Column('license_number', String(50), unique=True),
+    Column('experience_years', Integer),
+    Column('consultation_fee', Numeric(10, 2)),
+    Column('bio', Text),
+    Column('positives', Text),
+    Column('created_at', DateTime),
+    Column('updated_at', DateTime),
+    Column('is_active', Boolean),
+)
+
+doctor_availability = Table(
+    'doctor_availability', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('doctor_id', Integer, ForeignKey('doctors.id'), nullable=False),
+    Column('date', Date, nullable=False),
+    Column('start_time', Time, nullable=False),
+    Column('end_time', Time, nullable=False),
+    Column('is_available', Boolean),
+    Column('created_at', DateTime),
+    Index('idx_doctor_date', 'doctor_id', 'date'),
+)
+
+patients = Table(
+    'patients', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('user_id', Integer, ForeignKey('users.id'), unique=True, nullable=False),
+    Column('first_name', String(100), nullable=False),
+    Column('last_name', String(100), nullable=False),
+    Column('phone', String(20)),
+    Column('date_of_birth', Date),
+    Column('gender', String(10)),
+    Column('address', Text),
+    Column('emergency_contact_name', String(100)),
+    Column('emergency_contact_phone', String(20)),
+    Column('blood_group', String(5)),
+    Column('medical_history', Text),
+    Column('created_at', DateTime),
+    Column('updated_at', DateTime),
+    Column('is_active', Boolean),
+)
+
+appointments = Table(
+    'appointments', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('patient_id', Integer, ForeignKey('patients.id'), nullable=False),
+    Column('doctor_id', Integer, ForeignKey('doctors.id'), nullable=False),
+    Column('appointment_date', Date, nullable=False),
+    Column('appointment_time', Time, nullable=False),
+    Column('visit_type', String(20)),
+    Column('status', String(20)),
+    Column('reason', Text),
+    Column('created_at', DateTime),
+    Column('updated_at', DateTime),
+    Index('idx_doctor_datetime', 'doctor_id', 'appointment_date', 'appointment_time'),
+    Index('idx_patient_date', 'patient_id', 'appointment_date'),
+    Index('idx_status', 'status'),
+)
+
+treatments = Table(
+    'treatments', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('appointment_id', Integer, ForeignKey('appointments.id'), unique=True, nullable=False),
+    Column('diagnosis', Text, nullable=False),
+    Column('tests_done', Text),
+    Column('prescription', Text),
+    Column('medicines', Text),
+    Column('attachments', Text),
+    Column('notes', Text),
+    Column('follow_up_date', Date),
+    Column('follow_up_notes', Text),
+    Column('created_at', DateTime),
+    Column('updated_at', DateTime),
+)
+
+exports = Table(
+    'exports', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('patient_id', Integer, ForeignKey('patients.id'), nullable=False),
+    Column('format', String(10), nullable=False),
+    Column('filename', String(255), unique=True, nullable=False),
+    Column('filepath', String(500), nullable=False),
+    Column('size', Integer),
+    Column('checksum', String(64)),
+    Column('status', String(20)),
+    Column('total_records', Integer),
+    Column('created_at', DateTime),
+    Index('idx_export_patient_created', 'patient_id', 'created_at'),
+)
+
+
+def upgrade(ctx):
+    ctx.create_tables(users, departments, doctors, doctor_availability, patients, appointments, treatments, exports)
+
+    ctx.add_column('appointments', 'visit_type', 'VARCHAR(20)')
+    ctx.add_column('treatments', 'tests_done', 'TEXT')
+    ctx.add_column('treatments', 'medicines', 'TEXT')
+    ctx.add_column('treatments', 'attachments', 'TEXT')
+    ctx.add_column('doctors', 'positives', 'TEXT')
+    ctx.add_column('departments', 'category', 'VARCHAR(100)')
+
+    # Rows written before visit_type existed
+    ctx.backfill(
+        'appointments_visit_type',
+        table='appointments',
+        where='visit_type IS NULL',
+        set_sql="visit_type = 'In-person'"
+    )
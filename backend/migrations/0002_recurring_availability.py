@@ -0,0 +1,47 @@
+"""
+Recurring availability: templates, exceptions and slot template_id
+"""
+from sqlalchemy import Boolean, Column, Date, DateTime, ForeignKey, Index, Integer, MetaData, String, Table, Text, Time
+
+# Frozen copy of the models as of this migration
+metadata = MetaData()
+
+availability_templates = Table(
+    'availability_templates', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('doctor_id', Integer, ForeignKey('doctors.id'), nullable=False),
+    Column('weekday', Integer, nullable=False),
+    Column('start_time', Time, nullable=False),
+    Column('end_time', Time, nullable=False),
+    Column('valid_from', Date, nullable=False),
+    Column('valid_until', Date),
+    Column('is_active', Boolean),
+    Column('created_at', DateTime),
+    Index('idx_template_doctor_weekday', 'doctor_id', 'weekday'),
+)
+
+availability_exceptions = Table(
+    'availability_exceptions', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('doctor_id', Integer, ForeignKey('doctors.id')),
+    Column('date', Date, nullable=False),
+    Column('start_time', Time),
+    Column('end_time', Time),
+    Column('reason', String(20)),
+    Column('notes', Text),
+    Column('created_at', DateTime),
+    Index('idx_exception_date_doctor', 'date', 'doctor_id'),
+)
+
+availability_materialization = Table(
+    'availability_materialization', metadata,
+    Column('doctor_id', Integer, ForeignKey('doctors.id'), primary_key=True),
+    Column('materialized_until', Date, nullable=False),
+    Column('updated_at', DateTime),
+)
+
+
+def upgrade(ctx):
+    ctx.reflect(metadata, 'doctors')
+    ctx.create_tables(availability_templates, availability_exceptions, availability_materialization)
+    ctx.add_column('doctor_availability', 'template_id', 'INTEGER REFERENCES availability_templates(id)')
@@ -0,0 +1,47 @@
+"""
+Partial/covering indexes for dashboard, reminder and search queries
+"""
+from sqlalchemy import Boolean, Column, Date, Index, Integer, MetaData, String, Table, Time, text
+
+# The indexed columns, as of this migration (the tables themselves already exist)
+metadata = MetaData()
+
+appointments = Table(
+    'appointments', metadata,
+    Column('appointment_date', Date),
+    Column('appointment_time', Time),
+    Column('status', String(20)),
+)
+doctor_availability = Table(
+    'doctor_availability', metadata,
+    Column('date', Date),
+    Column('doctor_id', Integer),
+    Column('is_available', Boolean),
+)
+doctors = Table(
+    'doctors', metadata,
+    Column('specialization_id', Integer),
+    Column('is_active', Boolean),
+)
+
+idx_booked_date = Index(
+    'idx_booked_date', appointments.c.appointment_date, appointments.c.appointment_time, appointments.c.status,
+    sqlite_where=text("status = 'Booked'"),
+    postgresql_where=text("status = 'Booked'")
+)
+idx_availability_open_date = Index(
+    'idx_availability_open_date',
+    doctor_availability.c.date, doctor_availability.c.doctor_id, doctor_availability.c.is_available,
+    sqlite_where=text('is_available = 1'),
+    postgresql_where=text('is_available')
+)
+idx_doctor_specialization_active = Index(
+    'idx_doctor_specialization_active', doctors.c.specialization_id, doctors.c.is_active
+)
+
+
+def upgrade(ctx):
+    ctx.create_index(idx_booked_date)
+    ctx.create_index(idx_availability_open_date)
+    ctx.create_index(idx_doctor_specialization_active)
+    ctx.analyze()
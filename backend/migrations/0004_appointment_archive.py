@@ -0,0 +1,45 @@
+"""
+Archive tables for old completed/cancelled appointments and their treatments
+"""
+from sqlalchemy import Column, Date, DateTime, ForeignKey, Index, Integer, MetaData, String, Table, Text, Time
+
+# Frozen copy of the models as of this migration
+metadata = MetaData()
+
+appointments_archive = Table(
+    'appointments_archive', metadata,
+    Column('id', Integer, primary_key=True, autoincrement=False),
+    Column('patient_id', Integer, ForeignKey('patients.id'), nullable=False),
+    Column('doctor_id', Integer, ForeignKey('doctors.id'), nullable=False),
+    Column('appointment_date', Date, nullable=False),
+    Column('appointment_time', Time, nullable=False),
+    Column('visit_type', String(20)),
+    Column('status', String(20)),
+    Column('reason', Text),
+    Column('created_at', DateTime),
+    Column('updated_at', DateTime),
+    Column('archived_at', DateTime),
+    Index('idx_archive_patient_date', 'patient_id', 'appointment_date'),
+    Index('idx_archive_doctor_date', 'doctor_id', 'appointment_date'),
+)
+
+treatments_archive = Table(
+    'treatments_archive', metadata,
+    Column('id', Integer, primary_key=True, autoincrement=False),
+    Column('appointment_id', Integer, ForeignKey('appointments_archive.id'), unique=True, nullable=False),
+    Column('diagnosis', Text, nullable=False),
+    Column('tests_done', Text),
+    Column('prescription', Text),
+    Column('medicines', Text),
+    Column('attachments', Text),
+    Column('notes', Text),
+    Column('follow_up_date', Date),
+    Column('follow_up_notes', Text),
+    Column('created_at', DateTime),
+    Column('updated_at', DateTime),
+)
+
+
+def upgrade(ctx):
+    ctx.reflect(metadata, 'patients', 'doctors')
+    ctx.create_tables(appointments_archive, treatments_archive)
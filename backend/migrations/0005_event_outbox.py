@@ -0,0 +1,40 @@
+"""
+Transactional outbox for appointment events and the audit log its consumer writes
+"""
+from sqlalchemy import Column, DateTime, Index, Integer, MetaData, String, Table, Text, text
+
+# Frozen copy of the models as of this migration
+metadata = MetaData()
+
+outbox_events = Table(
+    'outbox_events', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('event_type', String(50), nullable=False),
+    Column('aggregate_id', Integer, nullable=False),
+    Column('payload', Text, nullable=False),
+    Column('created_at', DateTime),
+    Column('dispatched_at', DateTime),
+    Column('attempts', Integer),
+    Column('last_error', Text),
+    Index('idx_outbox_pending', 'id',
+          sqlite_where=text('dispatched_at IS NULL'),
+          postgresql_where=text('dispatched_at IS NULL')),
+)
+
+audit_log = Table(
+    'audit_log', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('event_id', Integer, unique=True, nullable=False),
+    Column('event_type', String(50), nullable=False),
+    Column('appointment_id', Integer, nullable=False),
+    Column('actor_user_id', Integer),
+    Column('actor_role', String(20)),
+    Column('payload', Text),
+    Column('occurred_at', DateTime, nullable=False),
+    Column('recorded_at', DateTime),
+    Index('idx_audit_appointment', 'appointment_id', 'occurred_at'),
+)
+
+
+def upgrade(ctx):
+    ctx.create_tables(outbox_events, audit_log)
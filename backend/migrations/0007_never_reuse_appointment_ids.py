@@ -0,0 +1,112 @@
+"""
+Never reuse appointment/treatment ids that already moved to the archive
+
+Archived rows keep their hot-table ids. SQLite hands the highest free rowid
+of a plain INTEGER PRIMARY KEY table to the next insert, so once the newest
+appointment was archived a new booking got the same id and the next archive
+run failed on appointments_archive's primary key. On SQLite the hot tables
+are rebuilt with AUTOINCREMENT and their sequences start above the highest
+id in either tier; hot rows that already collided are given fresh ids.
+PostgreSQL sequences never go back, so there is nothing to do there.
+"""
+from sqlalchemy import text
+
+# Frozen SQLite definitions as of this migration
+TABLES = {
+    'appointments': {
+        'archive': 'appointments_archive',
+        'columns': ['id', 'patient_id', 'doctor_id', 'appointment_date', 'appointment_time', 'visit_type',
+                    'status', 'reason', 'created_at', 'updated_at'],
+        'create': (
+            "CREATE TABLE appointments_rebuild ("
+            "id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, "
+            "patient_id INTEGER NOT NULL REFERENCES patients (id), "
+            "doctor_id INTEGER NOT NULL REFERENCES doctors (id), "
+            "appointment_date DATE NOT NULL, "
+            "appointment_time TIME NOT NULL, "
+            "visit_type VARCHAR(20), "
+            "status VARCHAR(20), "
+            "reason TEXT, "
+            "created_at DATETIME, "
+            "updated_at DATETIME)"
+        ),
+        'indexes': [
+            "CREATE INDEX idx_doctor_datetime ON appointments (doctor_id, appointment_date, appointment_time)",
+            "CREATE INDEX idx_patient_date ON appointments (patient_id, appointment_date)",
+            "CREATE INDEX idx_status ON appointments (status)",
+            "CREATE INDEX idx_booked_date ON appointments (appointment_date, appointment_time, status) "
+            "WHERE status = 'Booked'",
+        ],
+    },
+    'treatments': {
+        'archive': 'treatments_archive',
+        'columns': ['id', 'appointment_id', 'diagnosis', 'tests_done', 'prescription', 'medicines', 'attachments',
+                    'notes', 'follow_up_date', 'follow_up_notes', 'created_at', 'updated_at'],
+        'create': (
+            "CREATE TABLE treatments_rebuild ("
+            "id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, "
+            "appointment_id INTEGER NOT NULL UNIQUE REFERENCES appointments (id), "
+            "diagnosis TEXT NOT NULL, "
+            "tests_done TEXT, "
+            "prescription TEXT, "
+            "medicines TEXT, "
+            "attachments TEXT, "
+            "notes TEXT, "
+            "follow_up_date DATE, "
+            "follow_up_notes TEXT, "
+            "created_at DATETIME, "
+            "updated_at DATETIME)"
+        ),
+        'indexes': [],
+    },
+}
+
+
+def _max_id(conn, table, archive):
+    return conn.execute(text(
+        f"SELECT MAX(id) FROM (SELECT MAX(id) AS id FROM {table} UNION ALL SELECT MAX(id) FROM {archive}) ids"
+    )).scalar() or 0
+
+
+def _renumber_collisions(conn, table, archive):
+    """Give hot rows whose id is already archived a fresh id above both tiers"""
+    colliding = conn.execute(text(
+        f"SELECT id FROM {table} WHERE id IN (SELECT id FROM {archive}) ORDER BY id"
+    )).scalars().all()
+    next_id = _max_id(conn, table, archive)
+    for old_id in colliding:
+        next_id += 1
+        conn.execute(text(f"UPDATE {table} SET id = :new WHERE id = :old"), {'new': next_id, 'old': old_id})
+        if table == 'appointments':
+            conn.execute(text("UPDATE treatments SET appointment_id = :new WHERE appointment_id = :old"),
+                         {'new': next_id, 'old': old_id})
+    return len(colliding)
+
+
+def upgrade(ctx):
+    if ctx.dialect != 'sqlite':
+        ctx.log("ids come from sequences, nothing to do")
+        return
+
+    for table, spec in TABLES.items():
+        with ctx.engine.begin() as conn:
+            renumbered = _renumber_collisions(conn, table, spec['archive'])
+            if renumbered:
+                ctx.log(f"{table}: gave {renumbered} rows that collided with the archive new ids")
+
+            sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                               {'name': table}).scalar()
+            if 'AUTOINCREMENT' not in sql.upper():
+                columns = ', '.join(spec['columns'])
+                conn.execute(text(spec['create']))
+                conn.execute(text(f"INSERT INTO {table}_rebuild ({columns}) SELECT {columns} FROM {table}"))
+                conn.execute(text(f"DROP TABLE {table}"))
+                conn.execute(text(f"ALTER TABLE {table}_rebuild RENAME TO {table}"))
+                for statement in spec['indexes']:
+                    conn.execute(text(statement))
+                ctx.log(f"{table}: rebuilt with AUTOINCREMENT")
+
+            conn.execute(text("DELETE FROM sqlite_sequence WHERE name = :name"), {'name': table})
+            conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)"),
+                         {'name': table, 'seq': _max_id(conn, table, spec['archive'])})
+            ctx.log(f"{table}: new ids start above {_max_id(conn, table, spec['archive'])}")
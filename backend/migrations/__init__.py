@@ -0,0 +1,8 @@
+"""
+Versioned schema migrations, applied in order by migrate.py
+
+Add a new migration as NNNN_short_name.py (next free number) with a
+docstring whose first line describes it and an upgrade(ctx) function. See
+utils/migrations.py for the ctx helpers. Never edit a migration that has
+already been applied somewhere; add a new one instead.
+"""
@@ -1,5 +1,6 @@
+import json
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
+from utils.passwords import hash_password, verify_password, needs_rehash
 from sqlalchemy.orm import relationship
 from database import db
 
@@ -21,12 +22,16 @@ class User(db.Model):
     patient_profile = relationship('Patient', backref='user', uselist=False, cascade='all, delete-orphan')
     
     def set_password(self, password):
-        """Hash and set password"""
-        self.password_hash = generate_password_hash(password)
+        """Hash and set password (on the hashing pool, see utils/passwords.py)"""
+        self.password_hash = hash_password(password)
     
     def check_password(self, password):
         """Check password against hash"""
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
+    
+    def password_needs_rehash(self):
+        """True if the stored hash uses outdated cost parameters"""
+        return needs_rehash(self.password_hash)
     
     def to_dict(self):
         """Convert user to dictionary"""
@@ -92,6 +97,9 @@ class Doctor(db.Model):
     appointments = relationship('Appointment', backref='doctor', lazy='dynamic', cascade='all, delete-orphan')
     availability_slots = relationship('DoctorAvailability', backref='doctor', lazy='dynamic', cascade='all, delete-orphan')
     
+    # Index for faster queries (search by specialization among active doctors)
+    __table_args__ = (db.Index('idx_doctor_specialization_active', 'specialization_id', 'is_active'),)
+    
     def to_dict(self):
         """Convert doctor to dictionary"""
         return {
@@ -126,10 +134,17 @@ class DoctorAvailability(db.Model):
     start_time = db.Column(db.Time, nullable=False)
     end_time = db.Column(db.Time, nullable=False)
     is_available = db.Column(db.Boolean, default=True)
+    template_id = db.Column(db.Integer, db.ForeignKey('availability_templates.id'))  # Set when expanded from a recurring template
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Index for faster queries
-    __table_args__ = (db.Index('idx_doctor_date', 'doctor_id', 'date'),)
+    __table_args__ = (
+        db.Index('idx_doctor_date', 'doctor_id', 'date'),
+        # Search: doctors with an open slot on a date (covering, open slots only)
+        db.Index('idx_availability_open_date', 'date', 'doctor_id', 'is_available',
+                 sqlite_where=db.text('is_available = 1'),
+                 postgresql_where=db.text('is_available')),
+    )
     
     def to_dict(self):
         """Convert availability to dictionary"""
@@ -139,12 +154,92 @@ class DoctorAvailability(db.Model):
             'date': self.date.isoformat() if self.date else None,
             'start_time': self.start_time.strftime('%H:%M') if self.start_time else None,
             'end_time': self.end_time.strftime('%H:%M') if self.end_time else None,
-            'is_available': self.is_available
+            'is_available': self.is_available,
+            'is_recurring': self.template_id is not None
         }
     
     def __repr__(self):
         return f'<DoctorAvailability Doctor:{self.doctor_id} Date:{self.date}>'
 
+class AvailabilityTemplate(db.Model):
+    """Weekly recurring availability slot for a doctor"""
+    __tablename__ = 'availability_templates'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id'), nullable=False)
+    weekday = db.Column(db.Integer, nullable=False)  # 0 = Monday ... 6 = Sunday
+    start_time = db.Column(db.Time, nullable=False)
+    end_time = db.Column(db.Time, nullable=False)
+    valid_from = db.Column(db.Date, nullable=False)
+    valid_until = db.Column(db.Date)  # None = open-ended
+    is_active = db.Column(db.Boolean, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (db.Index('idx_template_doctor_weekday', 'doctor_id', 'weekday'),)
+    
+    def to_dict(self):
+        """Convert template to dictionary"""
+        return {
+            'id': self.id,
+            'doctor_id': self.doctor_id,
+            'weekday': self.weekday,
+            'start_time': self.start_time.strftime('%H:%M') if self.start_time else None,
+            'end_time': self.end_time.strftime('%H:%M') if self.end_time else None,
+            'valid_from': self.valid_from.isoformat() if self.valid_from else None,
+            'valid_until': self.valid_until.isoformat() if self.valid_until else None,
+            'is_active': self.is_active
+        }
+    
+    def __repr__(self):
+        return f'<AvailabilityTemplate Doctor:{self.doctor_id} Weekday:{self.weekday}>'
+
+class AvailabilityException(db.Model):
+    """Leave (per doctor) or holiday (doctor_id is None, hospital-wide) blocking recurring slots"""
+    __tablename__ = 'availability_exceptions'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id'))  # None = applies to all doctors
+    date = db.Column(db.Date, nullable=False)
+    start_time = db.Column(db.Time)  # None = whole day
+    end_time = db.Column(db.Time)
+    reason = db.Column(db.String(20), default='leave')  # 'leave', 'holiday'
+    notes = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (db.Index('idx_exception_date_doctor', 'date', 'doctor_id'),)
+    
+    def blocks(self, start_time, end_time):
+        """Check if this exception overlaps the given time range"""
+        if self.start_time is None or self.end_time is None:
+            return True
+        return start_time < self.end_time and self.start_time < end_time
+    
+    def to_dict(self):
+        """Convert exception to dictionary"""
+        return {
+            'id': self.id,
+            'doctor_id': self.doctor_id,
+            'date': self.date.isoformat() if self.date else None,
+            'start_time': self.start_time.strftime('%H:%M') if self.start_time else None,
+            'end_time': self.end_time.strftime('%H:%M') if self.end_time else None,
+            'reason': self.reason,
+            'notes': self.notes
+        }
+    
+    def __repr__(self):
+        return f'<AvailabilityException Doctor:{self.doctor_id} Date:{self.date}>'
+
+class AvailabilityMaterialization(db.Model):
+    """Per-doctor watermark: recurring templates are expanded into slots up to this date"""
+    __tablename__ = 'availability_materialization'
+    
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id'), primary_key=True)
+    materialized_until = db.Column(db.Date, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<AvailabilityMaterialization Doctor:{self.doctor_id} Until:{self.materialized_until}>'
+
 class Patient(db.Model):
     """Patient model with profile and contact information"""
     __tablename__ = 'patients'
@@ -215,6 +310,13 @@ class Appointment(db.Model):
         db.Index('idx_doctor_datetime', 'doctor_id', 'appointment_date', 'appointment_time'),
         db.Index('idx_patient_date', 'patient_id', 'appointment_date'),
         db.Index('idx_status', 'status'),
+        # Dashboards/reminders: status = 'Booked' AND appointment_date >= today
+        # (status is carried in the index so counts never touch the table)
+        db.Index('idx_booked_date', 'appointment_date', 'appointment_time', 'status',
+                 sqlite_where=db.text("status = 'Booked'"),
+                 postgresql_where=db.text("status = 'Booked'")),
+        # Never reuse an id: archived rows keep theirs (see utils/archive.py)
+        {'sqlite_autoincrement': True},
     )
     
     def to_dict(self):
@@ -256,6 +358,9 @@ class Treatment(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Never reuse an id: archived rows keep theirs (see utils/archive.py)
+    __table_args__ = {'sqlite_autoincrement': True}
+    
     def to_dict(self):
         """Convert treatment to dictionary"""
         return {
@@ -277,3 +382,239 @@ class Treatment(db.Model):
     def __repr__(self):
         return f'<Treatment Appointment:{self.appointment_id}>'
 
+
+class ArchivedAppointment(db.Model):
+    """Completed/cancelled appointment moved out of the hot table (see utils/archive.py)"""
+    __tablename__ = 'appointments_archive'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # Same id as in appointments
+    patient_id = db.Column(db.Integer, db.ForeignKey('patients.id'), nullable=False)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id'), nullable=False)
+    appointment_date = db.Column(db.Date, nullable=False)
+    appointment_time = db.Column(db.Time, nullable=False)
+    visit_type = db.Column(db.String(20))
+    status = db.Column(db.String(20))
+    reason = db.Column(db.Text)
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    patient = relationship('Patient')
+    doctor = relationship('Doctor')
+    treatment = relationship('ArchivedTreatment', backref='appointment', uselist=False, cascade='all, delete-orphan')
+    
+    # Index for faster queries
+    __table_args__ = (
+        db.Index('idx_archive_patient_date', 'patient_id', 'appointment_date'),
+        db.Index('idx_archive_doctor_date', 'doctor_id', 'appointment_date'),
+    )
+    
+    def to_dict(self):
+        """Convert archived appointment to dictionary (same shape as Appointment)"""
+        data = Appointment.to_dict(self)
+        data['archived'] = True
+        return data
+    
+    def __repr__(self):
+        return f'<ArchivedAppointment {self.id} - Patient:{self.patient_id} Doctor:{self.doctor_id} Date:{self.appointment_date}>'
+
+class ArchivedTreatment(db.Model):
+    """Treatment record of an archived appointment"""
+    __tablename__ = 'treatments_archive'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # Same id as in treatments
+    appointment_id = db.Column(db.Integer, db.ForeignKey('appointments_archive.id'), unique=True, nullable=False)
+    diagnosis = db.Column(db.Text, nullable=False)
+    tests_done = db.Column(db.Text)
+    prescription = db.Column(db.Text)
+    medicines = db.Column(db.Text)
+    attachments = db.Column(db.Text)
+    notes = db.Column(db.Text)
+    follow_up_date = db.Column(db.Date)
+    follow_up_notes = db.Column(db.Text)
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    
+    def to_dict(self):
+        """Convert archived treatment to dictionary (same shape as Treatment)"""
+        data = Treatment.to_dict(self)
+        data['archived'] = True
+        return data
+    
+    def __repr__(self):
+        return f'<ArchivedTreatment Appointment:{self.appointment_id}>'
+
+
+class Export(db.Model):
+    """Catalog of generated patient export files (PDF/CSV)"""
+    __tablename__ = 'exports'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patients.id'), nullable=False)
+    format = db.Column(db.String(10), nullable=False)  # 'pdf', 'csv'
+    filename = db.Column(db.String(255), unique=True, nullable=False)
+    filepath = db.Column(db.String(500), nullable=False)
+    size = db.Column(db.Integer)  # Size in bytes
+    checksum = db.Column(db.String(64))  # SHA-256 hex digest
+    status = db.Column(db.String(20), default='processing')  # 'processing', 'completed', 'failed'
+    total_records = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Index for listing a patient's exports newest first
+    __table_args__ = (db.Index('idx_export_patient_created', 'patient_id', 'created_at'),)
+    
+    def to_dict(self):
+        """Convert export to dictionary"""
+        return {
+            'id': self.id,
+            'patient_id': self.patient_id,
+            'format': self.format,
+            'filename': self.filename,
+            'size': self.size,
+            'checksum': self.checksum,
+            'status': self.status,
+            'total_records': self.total_records,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'download_url': f'/api/exports/download/{self.filename}'
+        }
+    
+    def __repr__(self):
+        return f'<Export {self.filename} ({self.status})>'
+
+
+class OutboxEvent(db.Model):
+    """Domain event written in the same transaction as the change it describes (see utils/outbox.py)"""
+    __tablename__ = 'outbox_events'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    event_type = db.Column(db.String(50), nullable=False)  # e.g. 'appointment.booked'
+    aggregate_id = db.Column(db.Integer, nullable=False)  # Appointment id
+    payload = db.Column(db.Text, nullable=False)  # JSON
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    dispatched_at = db.Column(db.DateTime)  # NULL until handed to the consumers
+    attempts = db.Column(db.Integer, default=0)
+    last_error = db.Column(db.Text)
+    
+    # Dispatcher polls undelivered events in id order
+    __table_args__ = (
+        db.Index('idx_outbox_pending', 'id',
+                 sqlite_where=db.text('dispatched_at IS NULL'),
+                 postgresql_where=db.text('dispatched_at IS NULL')),
+    )
+    
+    def to_dict(self):
+        """Convert outbox event to the message delivered to consumers"""
+        return {
+            'id': self.id,
+            'event_type': self.event_type,
+            'aggregate_id': self.aggregate_id,
+            'payload': json.loads(self.payload) if self.payload else {},
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+    
+    def __repr__(self):
+        return f'<OutboxEvent {self.id} {self.event_type} ({"dispatched" if self.dispatched_at else "pending"})>'
+
+
+class AuditLog(db.Model):
+    """Append-only record of appointment events, written by the audit consumer"""
+    __tablename__ = 'audit_log'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    event_id = db.Column(db.Integer, unique=True, nullable=False)  # OutboxEvent id; redelivery is a no-op
+    event_type = db.Column(db.String(50), nullable=False)
+    appointment_id = db.Column(db.Integer, nullable=False)
+    actor_user_id = db.Column(db.Integer)
+    actor_role = db.Column(db.String(20))
+    payload = db.Column(db.Text)  # JSON
+    occurred_at = db.Column(db.DateTime, nullable=False)
+    recorded_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (db.Index('idx_audit_appointment', 'appointment_id', 'occurred_at'),)
+    
+    def to_dict(self):
+        """Convert audit entry to dictionary"""
+        return {
+            'id': self.id,
+            'event_type': self.event_type,
+            'appointment_id': self.appointment_id,
+            'actor_user_id': self.actor_user_id,
+            'actor_role': self.actor_role,
+            'payload': json.loads(self.payload) if self.payload else {},
+            'occurred_at': self.occurred_at.isoformat() if self.occurred_at else None,
+            'recorded_at': self.recorded_at.isoformat() if self.recorded_at else None
+        }
+    
+    def __repr__(self):
+        return f'<AuditLog {self.event_type} Appointment:{self.appointment_id}>'
+
+
+class AppointmentDailyRollup(db.Model):
+    """Appointments per day, doctor and status across both tiers; analytics charts read this (see utils/analytics.py)"""
+    __tablename__ = 'appointment_daily_rollup'
+
+    day = db.Column(db.Date, primary_key=True)
+    doctor_id = db.Column(db.Integer, primary_key=True)  # No foreign key: rows outlive deleted doctors until the nightly refresh
+    status = db.Column(db.String(20), primary_key=True)
+    appointment_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def to_dict(self):
+        """Convert rollup row to dictionary"""
+        return {
+            'day': self.day.isoformat() if self.day else None,
+            'doctor_id': self.doctor_id,
+            'status': self.status,
+            'appointment_count': self.appointment_count
+        }
+
+    def __repr__(self):
+        return f'<AppointmentDailyRollup {self.day} Doctor:{self.doctor_id} {self.status}={self.appointment_count}>'
+
+
+class SchemaMigration(db.Model):
+    """Applied schema migration versions (see migrate.py)"""
+    __tablename__ = 'schema_migrations'
+    
+    version = db.Column(db.String(20), primary_key=True)  # e.g. '0003'
+    name = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+    duration_ms = db.Column(db.Integer)
+    
+    def to_dict(self):
+        """Convert schema migration to dictionary"""
+        return {
+            'version': self.version,
+            'name': self.name,
+            'applied_at': self.applied_at.isoformat() if self.applied_at else None,
+            'duration_ms': self.duration_ms
+        }
+    
+    def __repr__(self):
+        return f'<SchemaMigration {self.version} {self.name}>'
+
+
+class MigrationCheckpoint(db.Model):
+    """Progress of a batched data backfill, so an interrupted migration resumes where it stopped"""
+    __tablename__ = 'migration_checkpoints'
+    
+    version = db.Column(db.String(20), primary_key=True)
+    step = db.Column(db.String(100), primary_key=True)
+    last_key = db.Column(db.Integer, default=0)  # Highest primary key processed
+    rows_done = db.Column(db.Integer, default=0)
+    completed = db.Column(db.Boolean, default=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        """Convert migration checkpoint to dictionary"""
+        return {
+            'version': self.version,
+            'step': self.step,
+            'last_key': self.last_key,
+            'rows_done': self.rows_done,
+            'completed': self.completed,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+    
+    def __repr__(self):
+        return f'<MigrationCheckpoint {self.version}:{self.step} at {self.last_key}>'
@@ -2,15 +2,35 @@
 Admin routes for managing doctors, patients, and appointments
 """
 from flask import Blueprint, request, jsonify
+from werkzeug.exceptions import HTTPException
 from auth import admin_required
 from database import db
-from models import User, Doctor, Patient, Department, Appointment, Treatment
-from sqlalchemy import or_, func, and_
+from models import User, Doctor, Patient, Department, Appointment, Treatment, AvailabilityException
 from datetime import datetime, date
 from utils.cache import (
     invalidate_doctor_search_cache,
     invalidate_doctor_availability_cache,
+    cache_delete_pattern,
+    bump_generation,
 )
+from utils.archive import archived_status_counts, delete_archived_appointments, invalidate_archive_counts
+from utils.analytics import (
+    get_analytics_series,
+    appointment_rollup_keys,
+    refresh_rollup_keys,
+    drop_doctor_rollup,
+    GRANULARITIES,
+)
+from utils.availability import apply_exception, parse_exception, rewind_materialization, ensure_materialized
+from utils.search import search_doctor_ids, search_patient_ids, order_by_rank
+from utils.live_updates import latest_event_id
+from utils.outbox import emit_appointment_event, emit_status_event, kick_dispatcher, APPOINTMENT_CANCELLED, APPOINTMENT_RESCHEDULED
+from utils.passwords import PasswordHashingBusy, PASSWORD_HASH_RETRY_AFTER
+from utils.user_profile import invalidate_user_profile, invalidate_all_user_profiles
+from utils.rate_limit import rate_limit_metrics
+from utils.admission import admission_metrics
+from utils.appointment_rows import appointment_rows
+from utils.department_catalog import department_catalog
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/api/admin')
 
@@ -21,11 +41,15 @@ def admin_dashboard(current_user):
     Admin dashboard with statistics
     """
     try:
+        # Stream position for GET /api/live/appointments (read before the snapshot)
+        last_event_id = latest_event_id()
+        
         # Get statistics
         total_doctors = Doctor.query.filter_by(is_active=True).count()
         total_patients = Patient.query.filter_by(is_active=True).count()
-        total_appointments = Appointment.query.count()
-        total_departments = Department.query.count()
+        archived_counts = archived_status_counts()  # Cached until the next archival run
+        total_appointments = Appointment.query.count() + sum(archived_counts.values())
+        total_departments = department_catalog.count()
         
         today = date.today()
         upcoming_appointments = Appointment.query.filter(
@@ -33,8 +57,8 @@ def admin_dashboard(current_user):
             Appointment.status == 'Booked'
         ).count()
         
-        completed_appointments = Appointment.query.filter_by(status='Completed').count()
-        cancelled_appointments = Appointment.query.filter_by(status='Cancelled').count()
+        completed_appointments = Appointment.query.filter_by(status='Completed').count() + archived_counts.get('Completed', 0)
+        cancelled_appointments = Appointment.query.filter_by(status='Cancelled').count() + archived_counts.get('Cancelled', 0)
         
         # Recent appointments
         recent_appointments = Appointment.query.order_by(
@@ -49,6 +73,7 @@ def admin_dashboard(current_user):
         
         return jsonify({
             'role': 'admin',
+            'last_event_id': last_event_id,
             'statistics': {
                 'total_doctors': total_doctors,
                 'total_patients': total_patients,
@@ -91,18 +116,14 @@ def get_all_doctors(current_user):
             is_active_bool = is_active.lower() == 'true'
             query = query.filter_by(is_active=is_active_bool)
         
-        # Search by name
+        # Search by name or license number (full-text index)
         if search:
-            search_pattern = f'%{search}%'
-            query = query.filter(
-                or_(
-                    Doctor.first_name.ilike(search_pattern),
-                    Doctor.last_name.ilike(search_pattern),
-                    Doctor.license_number.ilike(search_pattern)
-                )
-            )
+            doctor_ids = search_doctor_ids(search, limit=None)
+            query = query.filter(Doctor.id.in_(doctor_ids))
         
         doctors = query.all()
+        if search:
+            doctors = order_by_rank(doctors, doctor_ids)
         
         return jsonify({
             'doctors': [doctor.to_dict() for doctor in doctors],
@@ -187,6 +208,9 @@ def add_doctor(current_user):
             'doctor': doctor.to_dict()
         }), 201
         
+    except PasswordHashingBusy:
+        db.session.rollback()
+        return jsonify({'error': 'Server is busy, please try again shortly'}), 503, {'Retry-After': str(PASSWORD_HASH_RETRY_AFTER)}
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'Failed to add doctor: {str(e)}'}), 500
@@ -252,6 +276,7 @@ def update_doctor(current_user, doctor_id):
         doctor.updated_at = datetime.utcnow()
         db.session.commit()
         invalidate_doctor_search_cache()
+        invalidate_user_profile(doctor.user_id)
         
         return jsonify({
             'message': 'Doctor updated successfully',
@@ -274,6 +299,10 @@ def delete_doctor(current_user, doctor_id):
         # Get user before deletion for cache invalidation
         user = doctor.user
         doctor_id_for_cache = doctor.id
+        user_id_for_cache = doctor.user_id
+        
+        # Archived appointments have no ORM cascade from the doctor
+        archived = delete_archived_appointments(doctor_id=doctor_id_for_cache)
         
         # Delete doctor (this will cascade delete related appointments and availability slots)
         db.session.delete(doctor)
@@ -285,6 +314,12 @@ def delete_doctor(current_user, doctor_id):
         db.session.commit()
         invalidate_doctor_search_cache()
         invalidate_doctor_availability_cache(doctor_id_for_cache)
+        invalidate_user_profile(user_id_for_cache)
+        if archived:
+            invalidate_archive_counts()
+        
+        # Cascaded appointment deletes emit no events; drop the doctor's rollup rows now
+        drop_doctor_rollup(doctor_id_for_cache)
         
         return jsonify({'message': 'Doctor deleted successfully'}), 200
         
@@ -312,20 +347,14 @@ def get_all_patients(current_user):
             is_active_bool = is_active.lower() == 'true'
             query = query.filter_by(is_active=is_active_bool)
         
-        # Search by name, ID, phone, email
+        # Search by name, phone, email, username (full-text index)
         if search:
-            search_pattern = f'%{search}%'
-            query = query.join(User).filter(
-                or_(
-                    Patient.first_name.ilike(search_pattern),
-                    Patient.last_name.ilike(search_pattern),
-                    Patient.phone.ilike(search_pattern),
-                    User.email.ilike(search_pattern),
-                    User.username.ilike(search_pattern)
-                )
-            )
+            patient_ids = search_patient_ids(search, limit=None)
+            query = query.filter(Patient.id.in_(patient_ids))
         
         patients = query.all()
+        if search:
+            patients = order_by_rank(patients, patient_ids)
         
         return jsonify({
             'patients': [patient.to_dict() for patient in patients],
@@ -397,6 +426,8 @@ def update_patient(current_user, patient_id):
         
         patient.updated_at = datetime.utcnow()
         db.session.commit()
+        invalidate_user_profile(patient.user_id)
+        bump_generation('patients')
         
         return jsonify({
             'message': 'Patient updated successfully',
@@ -418,6 +449,13 @@ def delete_patient(current_user, patient_id):
         
         # Get user before deletion
         user = patient.user
+        user_id_for_cache = patient.user_id
+        
+        # Rollup days to recount once the cascaded appointments are gone (no events are emitted)
+        rollup_keys = appointment_rollup_keys(patient.id)
+        
+        # Archived appointments have no ORM cascade from the patient
+        archived = delete_archived_appointments(patient_id=patient.id)
         
         # Delete patient (this will cascade delete related records if configured)
         db.session.delete(patient)
@@ -427,6 +465,11 @@ def delete_patient(current_user, patient_id):
             db.session.delete(user)
         
         db.session.commit()
+        invalidate_user_profile(user_id_for_cache)
+        bump_generation('patients')
+        if archived:
+            invalidate_archive_counts()
+        refresh_rollup_keys(rollup_keys)
         
         return jsonify({'message': 'Patient deleted successfully'}), 200
         
@@ -450,30 +493,28 @@ def get_all_appointments(current_user):
         doctor_id = request.args.get('doctor_id', type=int)
         patient_id = request.args.get('patient_id', type=int)
         
-        query = Appointment.query
+        conditions = []
         
         if status:
-            query = query.filter_by(status=status)
+            conditions.append(Appointment.status == status)
         
         if date_from:
-            query = query.filter(Appointment.appointment_date >= date_from)
+            conditions.append(Appointment.appointment_date >= date_from)
         
         if date_to:
-            query = query.filter(Appointment.appointment_date <= date_to)
+            conditions.append(Appointment.appointment_date <= date_to)
         
         if doctor_id:
-            query = query.filter_by(doctor_id=doctor_id)
+            conditions.append(Appointment.doctor_id == doctor_id)
         
         if patient_id:
-            query = query.filter_by(patient_id=patient_id)
+            conditions.append(Appointment.patient_id == patient_id)
         
-        appointments = query.order_by(
-            Appointment.appointment_date.desc(),
-            Appointment.appointment_time.desc()
-        ).all()
+        # Core rows shaped like to_dict() (see utils/appointment_rows.py)
+        appointments = appointment_rows(*conditions)
         
         return jsonify({
-            'appointments': [apt.to_dict() for apt in appointments],
+            'appointments': appointments,
             'count': len(appointments)
         }), 200
         
@@ -523,6 +564,8 @@ def update_appointment(current_user, appointment_id):
                 return jsonify({'error': 'Doctor already has an appointment at this time'}), 400
         
         # Update fields
+        previous_date, previous_time = appointment.appointment_date, appointment.appointment_time
+        previous_status = appointment.status
         if 'appointment_date' in data:
             appointment.appointment_date = data['appointment_date']
         if 'appointment_time' in data:
@@ -533,7 +576,19 @@ def update_appointment(current_user, appointment_id):
             appointment.reason = data['reason'].strip() or None
         
         appointment.updated_at = datetime.utcnow()
+        
+        # Status changes and moves go through the outbox like patient/doctor changes
+        emitted = None
+        moved = {}
+        if 'appointment_date' in data or 'appointment_time' in data:
+            moved = {'previous_date': previous_date, 'previous_time': previous_time}
+        if appointment.status != previous_status:
+            emitted = emit_status_event(appointment, actor=current_user, **moved)
+        elif moved:
+            emitted = emit_appointment_event(APPOINTMENT_RESCHEDULED, appointment, actor=current_user, **moved)
         db.session.commit()
+        if emitted:
+            kick_dispatcher()
         
         return jsonify({
             'message': 'Appointment updated successfully',
@@ -554,7 +609,9 @@ def cancel_appointment(current_user, appointment_id):
         appointment = Appointment.query.get_or_404(appointment_id)
         appointment.status = 'Cancelled'
         appointment.updated_at = datetime.utcnow()
+        emit_appointment_event(APPOINTMENT_CANCELLED, appointment, actor=current_user)
         db.session.commit()
+        kick_dispatcher()
         
         return jsonify({'message': 'Appointment cancelled successfully'}), 200
         
@@ -569,9 +626,8 @@ def cancel_appointment(current_user, appointment_id):
 def get_departments(current_user):
     """Get all departments"""
     try:
-        departments = Department.query.all()
         return jsonify({
-            'departments': [dept.to_dict() for dept in departments]
+            'departments': department_catalog.departments()
         }), 200
     except Exception as e:
         return jsonify({'error': f'Failed to get departments: {str(e)}'}), 500
@@ -598,6 +654,7 @@ def add_department(current_user):
         
         db.session.add(department)
         db.session.commit()
+        bump_generation('departments')
         
         return jsonify({
             'message': 'Department added successfully',
@@ -613,7 +670,9 @@ def add_department(current_user):
 def get_department_details(current_user, department_id):
     """Get department details with list of doctors"""
     try:
-        department = Department.query.get_or_404(department_id)
+        department = department_catalog.get(department_id)
+        if not department:
+            return jsonify({'error': 'Department not found'}), 404
         
         # Get doctors in this department
         doctors = Doctor.query.filter_by(
@@ -621,7 +680,7 @@ def get_department_details(current_user, department_id):
             is_active=True
         ).all()
         
-        dept_dict = department.to_dict()
+        dept_dict = dict(department)  # Catalog entries are shared
         dept_dict['doctors'] = [{
             'id': doc.id,
             'first_name': doc.first_name,
@@ -665,6 +724,8 @@ def update_department(current_user, department_id):
         department.description = data.get('description', '').strip() or None
         
         db.session.commit()
+        invalidate_all_user_profiles()  # Doctor profiles carry the department name
+        bump_generation('departments', 'doctors')
         
         return jsonify({
             'message': 'Department updated successfully',
@@ -691,6 +752,7 @@ def delete_department(current_user, department_id):
         
         db.session.delete(department)
         db.session.commit()
+        bump_generation('departments')
         
         return jsonify({
             'message': 'Department deleted successfully'
@@ -707,7 +769,8 @@ def delete_department(current_user, department_id):
 def get_analytics(current_user):
     """
     Get analytics data for Chart.js
-    Returns appointment trends and specialization demand
+    Returns appointment trends, specialization demand, status distribution and top doctors
+    Query params: days (default 30), granularity (day/week/month; default day up to 7 days, else week)
     """
     try:
         from datetime import timedelta
@@ -717,132 +780,16 @@ def get_analytics(current_user):
         end_date = date.today()
         start_date = end_date - timedelta(days=days)
         
-        # Appointment trends (daily for last 7 days, weekly for longer periods)
-        if days <= 7:
-            # Daily data
-            daily_appointments = db.session.query(
-                func.date(Appointment.appointment_date).label('date'),
-                func.count(Appointment.id).label('count')
-            ).filter(
-                Appointment.appointment_date >= start_date,
-                Appointment.appointment_date <= end_date
-            ).group_by(
-                func.date(Appointment.appointment_date)
-            ).order_by(
-                func.date(Appointment.appointment_date)
-            ).all()
-            
-            appointment_trends = {
-                'labels': [str(day[0]) for day in daily_appointments],
-                'data': [day[1] for day in daily_appointments]
-            }
-        else:
-            # Weekly data - use date formatting compatible with SQLite
-            weekly_appointments = db.session.query(
-                func.strftime('%Y-%W', Appointment.appointment_date).label('week'),
-                func.count(Appointment.id).label('count')
-            ).filter(
-                Appointment.appointment_date >= start_date,
-                Appointment.appointment_date <= end_date
-            ).group_by(
-                func.strftime('%Y-%W', Appointment.appointment_date)
-            ).order_by(
-                func.strftime('%Y-%W', Appointment.appointment_date)
-            ).all()
-            
-            appointment_trends = {
-                'labels': [week[0] for week in weekly_appointments],
-                'data': [week[1] for week in weekly_appointments]
-            }
+        granularity = request.args.get('granularity') or ('day' if days <= 7 else 'week')
+        if granularity not in GRANULARITIES:
+            return jsonify({'error': f'Invalid granularity. Use one of: {", ".join(GRANULARITIES)}'}), 400
         
-        # Specialization demand (appointments by department)
-        specialization_demand = db.session.query(
-            Department.name.label('department'),
-            func.count(Appointment.id).label('count')
-        ).join(
-            Doctor, Department.id == Doctor.specialization_id
-        ).join(
-            Appointment, Doctor.id == Appointment.doctor_id
-        ).filter(
-            Appointment.appointment_date >= start_date,
-            Appointment.appointment_date <= end_date
-        ).group_by(
-            Department.name
-        ).order_by(
-            func.count(Appointment.id).desc()
-        ).all()
-        
-        specialization_data = {
-            'labels': [dept[0] for dept in specialization_demand],
-            'data': [dept[1] for dept in specialization_demand]
-        }
-        
-        # Status distribution
-        status_distribution = db.session.query(
-            Appointment.status,
-            func.count(Appointment.id).label('count')
-        ).filter(
-            Appointment.appointment_date >= start_date,
-            Appointment.appointment_date <= end_date
-        ).group_by(
-            Appointment.status
-        ).all()
-        
-        status_data = {
-            'labels': [status[0] for status in status_distribution],
-            'data': [status[1] for status in status_distribution]
-        }
-        
-        # Top performing doctors (by appointment count)
-        top_doctors = db.session.query(
-            Doctor.id,
-            Doctor.first_name,
-            Doctor.last_name,
-            Doctor.specialization_id,
-            Doctor.user_id,
-            func.count(Appointment.id).label('appointment_count')
-        ).outerjoin(
-            Appointment, 
-            and_(
-                Doctor.id == Appointment.doctor_id,
-                Appointment.appointment_date >= start_date,
-                Appointment.appointment_date <= end_date
-            )
-        ).filter(
-            Doctor.is_active == True
-        ).group_by(
-            Doctor.id,
-            Doctor.first_name,
-            Doctor.last_name,
-            Doctor.specialization_id,
-            Doctor.user_id
-        ).having(
-            func.count(Appointment.id) > 0
-        ).order_by(
-            func.count(Appointment.id).desc()
-        ).limit(10).all()
-        
-        # Get department names and user emails for doctors
-        top_doctors_data = []
-        for doc in top_doctors:
-            department = Department.query.get(doc.specialization_id)
-            doctor_user = User.query.get(doc.user_id) if doc.user_id else None
-            
-            top_doctors_data.append({
-                'id': doc.id,
-                'first_name': doc.first_name,
-                'last_name': doc.last_name,
-                'full_name': f"{doc.first_name} {doc.last_name}",
-                'email': doctor_user.email if doctor_user else None,
-                'specialization': department.name if department else 'N/A',
-                'appointment_count': doc.appointment_count or 0
-            })
+        # Every series comes from the daily rollup, cached per range and granularity
+        analytics = get_analytics_series(start_date, end_date, granularity)
         
         return jsonify({
-            'appointment_trends': appointment_trends,
-            'specialization_demand': specialization_data,
-            'status_distribution': status_data,
-            'top_doctors': top_doctors_data,
+            **analytics,
+            'granularity': granularity,
             'date_range': {
                 'start': start_date.isoformat(),
                 'end': end_date.isoformat(),
@@ -853,3 +800,117 @@ def get_analytics(current_user):
     except Exception as e:
         return jsonify({'error': f'Failed to get analytics: {str(e)}'}), 500
 
+# ==================== METRICS ====================
+
+@admin_bp.route('/metrics', methods=['GET'])
+@admin_required
+def get_metrics(current_user):
+    """
+    Operational counters: login attempts, rate-limit rejections and lockouts,
+    and requests turned away by admission control
+    """
+    try:
+        return jsonify({
+            'rate_limit': rate_limit_metrics(),
+            'admission': admission_metrics()
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'Failed to get metrics: {str(e)}'}), 500
+
+
+# ==================== HOLIDAYS ====================
+
+def _invalidate_all_availability_caches():
+    invalidate_doctor_search_cache()
+    cache_delete_pattern("doctor:availability:*")
+    bump_generation('holidays', 'availability')
+
+@admin_bp.route('/holidays', methods=['GET'])
+@admin_required
+def get_holidays(current_user):
+    """
+    Get clinic-wide holidays (upcoming by default, ?all=true for all)
+    """
+    try:
+        query = AvailabilityException.query.filter(AvailabilityException.doctor_id == None)
+        if request.args.get('all', 'false').lower() != 'true':
+            query = query.filter(AvailabilityException.date >= date.today())
+        
+        holidays = query.order_by(AvailabilityException.date).all()
+        
+        return jsonify({
+            'holidays': [holiday.to_dict() for holiday in holidays],
+            'total': len(holidays)
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'Failed to get holidays: {str(e)}'}), 500
+
+@admin_bp.route('/holidays', methods=['POST'])
+@admin_required
+def add_holiday(current_user):
+    """
+    Add a clinic-wide holiday; recurring slots for that date are removed for every doctor
+    Body: { "date": "YYYY-MM-DD", "notes": "...", "start_time": "HH:MM", "end_time": "HH:MM" }
+    """
+    try:
+        data = request.get_json() or {}
+        
+        try:
+            holiday_date, start_time, end_time, _, notes = parse_exception(data)
+        except (KeyError, ValueError) as e:
+            return jsonify({'error': f'Invalid holiday: {str(e)}'}), 400
+        
+        if holiday_date < date.today():
+            return jsonify({'error': 'Cannot add a holiday for a past date'}), 400
+        
+        holiday = AvailabilityException(
+            doctor_id=None,
+            date=holiday_date,
+            start_time=start_time,
+            end_time=end_time,
+            reason='holiday',
+            notes=notes
+        )
+        db.session.add(holiday)
+        removed = apply_exception(holiday)
+        db.session.commit()
+        _invalidate_all_availability_caches()
+        
+        return jsonify({
+            'message': f'Holiday added. {removed} recurring slot(s) removed.',
+            'holiday': holiday.to_dict()
+        }), 201
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Failed to add holiday: {str(e)}'}), 500
+
+@admin_bp.route('/holidays/<int:holiday_id>', methods=['DELETE'])
+@admin_required
+def delete_holiday(current_user, holiday_id):
+    """
+    Remove a holiday; recurring slots for that date are generated again
+    """
+    try:
+        holiday = AvailabilityException.query.filter_by(
+            id=holiday_id,
+            doctor_id=None
+        ).first_or_404()
+        
+        holiday_date = holiday.date
+        db.session.delete(holiday)
+        rewind_materialization(holiday_date)
+        db.session.commit()
+        
+        ensure_materialized()
+        _invalidate_all_availability_caches()
+        
+        return jsonify({'message': 'Holiday removed successfully'}), 200
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Failed to remove holiday: {str(e)}'}), 500
@@ -1,12 +1,14 @@
 """
 Authentication routes for login and registration
 """
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt_identity
 from datetime import timedelta
 from database import db
 from models import User, Patient, Doctor
-from werkzeug.security import check_password_hash
+from utils.passwords import PasswordHashingBusy, PASSWORD_HASH_RETRY_AFTER
+from utils.user_profile import find_login_user, find_token_user, token_claims, get_user_profile
+from utils.rate_limit import check_login_attempt, record_login_failure, record_login_success
 import re
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/api/auth')
@@ -90,9 +92,10 @@ def register():
         db.session.commit()
         
         # Create access token - identity must be a string
+        display_name = f"{patient.first_name} {patient.last_name}"
         access_token = create_access_token(
             identity=str(user.id),
-            additional_claims={'role': user.role, 'username': user.username}
+            additional_claims=token_claims(user, patient.id, display_name)
         )
         
         return jsonify({
@@ -103,10 +106,14 @@ def register():
                 'username': user.username,
                 'email': user.email,
                 'role': user.role,
-                'profile': patient.to_dict()
+                'profile_id': patient.id,
+                'display_name': display_name
             }
         }), 201
         
+    except PasswordHashingBusy:
+        db.session.rollback()
+        return jsonify({'error': 'Server is busy, please try again shortly'}), 503, {'Retry-After': str(PASSWORD_HASH_RETRY_AFTER)}
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'Registration failed: {str(e)}'}), 500
@@ -126,44 +133,50 @@ def login():
         username = data.get('username').strip()
         password = data.get('password')
         
-        # Find user by username
-        user = User.query.filter_by(username=username).first()
+        # Turn away floods before paying for a lookup and a password hash
+        allowed, retry_after = check_login_attempt(request.remote_addr, username)
+        if not allowed:
+            return jsonify({
+                'error': f'Too many login attempts. Please try again in {retry_after} seconds.',
+                'retry_after': retry_after
+            }), 429, {'Retry-After': str(retry_after)}
+        
+        # Find user by username, with profile id and name for the token claims (one query)
+        user, profile_id, display_name = find_login_user(username)
         
         # Check if user exists and password is correct
         if not user or not user.check_password(password):
+            record_login_failure(request.remote_addr, username)
             return jsonify({'error': 'Invalid username or password'}), 401
+        record_login_success(request.remote_addr, username)
         
         # Check if user is active
         if not user.is_active:
             return jsonify({'error': 'Account is inactive. Please contact administrator.'}), 403
         
+        # Upgrade hashes made with older cost parameters while the plaintext is at hand
+        if user.password_needs_rehash():
+            try:
+                user.set_password(password)
+                db.session.commit()
+            except PasswordHashingBusy:
+                pass  # Try again on a later login
+        
         # Create access token - identity must be a string
+        claims = token_claims(user, profile_id, display_name)
         access_token = create_access_token(
             identity=str(user.id),
-            additional_claims={'role': user.role, 'username': user.username},
+            additional_claims=claims,
             expires_delta=timedelta(hours=24)
         )
         
         # Create refresh token - identity must be a string
         refresh_token = create_refresh_token(
             identity=str(user.id),
-            additional_claims={'role': user.role, 'username': user.username}
+            additional_claims=claims
         )
         
-        # Get user profile based on role
-        profile = None
-        if user.role == 'patient' and user.patient_profile:
-            profile = user.patient_profile.to_dict()
-        elif user.role == 'doctor' and user.doctor_profile:
-            profile = user.doctor_profile.to_dict()
-        elif user.role == 'admin':
-            profile = {
-                'id': user.id,
-                'username': user.username,
-                'email': user.email,
-                'role': 'admin'
-            }
-        
+        # The full profile is fetched lazily from /me
         return jsonify({
             'message': 'Login successful',
             'access_token': access_token,
@@ -173,10 +186,13 @@ def login():
                 'username': user.username,
                 'email': user.email,
                 'role': user.role,
-                'profile': profile
+                'profile_id': profile_id,
+                'display_name': display_name
             }
         }), 200
         
+    except PasswordHashingBusy:
+        return jsonify({'error': 'Server is busy, please try again shortly'}), 503, {'Retry-After': str(PASSWORD_HASH_RETRY_AFTER)}
     except Exception as e:
         return jsonify({'error': f'Login failed: {str(e)}'}), 500
 
@@ -188,8 +204,8 @@ def refresh():
     """
     try:
         user_id = get_jwt_identity()
-        # Convert string identity back to int for database query
-        user = User.query.get(int(user_id))
+        # Convert string identity back to int; claims are re-read so a renamed user gets the new name
+        user, profile_id, display_name = find_token_user(int(user_id))
         
         if not user or not user.is_active:
             return jsonify({'error': 'User not found or inactive'}), 401
@@ -197,7 +213,7 @@ def refresh():
         # Create new access token - identity must be a string
         access_token = create_access_token(
             identity=str(user.id),
-            additional_claims={'role': user.role, 'username': user.username}
+            additional_claims=token_claims(user, profile_id, display_name)
         )
         
         return jsonify({
@@ -215,36 +231,20 @@ def get_current_user():
     """
     try:
         user_id = get_jwt_identity()
-        # Convert string identity back to int for database query
-        user = User.query.get(int(user_id))
+        # Convert string identity back to int; the profile is cached with its ETag
+        body, etag = get_user_profile(int(user_id))
         
-        if not user:
+        if body is None:
             return jsonify({'error': 'User not found'}), 404
         
-        # Get user profile based on role
-        profile = None
-        if user.role == 'patient' and user.patient_profile:
-            profile = user.patient_profile.to_dict()
-        elif user.role == 'doctor' and user.doctor_profile:
-            profile = user.doctor_profile.to_dict()
-        elif user.role == 'admin':
-            profile = {
-                'id': user.id,
-                'username': user.username,
-                'email': user.email,
-                'role': 'admin'
-            }
-        
-        return jsonify({
-            'user': {
-                'id': user.id,
-                'username': user.username,
-                'email': user.email,
-                'role': user.role,
-                'is_active': user.is_active,
-                'profile': profile
-            }
-        }), 200
+        # Weak comparison: compression turns the ETag weak (W/"...") on large profiles
+        if request.if_none_match.contains_weak(etag):
+            response = current_app.response_class(status=304)
+        else:
+            response = jsonify(body)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
         
     except Exception as e:
         return jsonify({'error': f'Failed to get user info: {str(e)}'}), 500
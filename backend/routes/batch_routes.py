@@ -0,0 +1,32 @@
+"""
+Batch endpoint: several GET requests in one round trip (see utils/batch.py)
+"""
+from flask import Blueprint, request, jsonify
+from auth import role_required
+from utils.batch import parse_batch, run_batch
+
+batch_bp = Blueprint('batch', __name__, url_prefix='/api/batch')
+
+@batch_bp.route('', methods=['POST'])
+@role_required('admin', 'doctor', 'patient')
+def run_batch_requests(current_user):
+    """
+    Run a list of GET requests with the caller's token and return all results
+    Body: {"requests": [{"id": "appointments", "path": "/api/patient/appointments?status=Booked"}, ...]}
+    Returns {"responses": [{"id", "status", "body"}, ...]} in request order
+    """
+    try:
+        try:
+            items = parse_batch(request.get_json(silent=True))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        responses = run_batch(items)
+        
+        return jsonify({
+            'responses': responses,
+            'count': len(responses)
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'Failed to run batch: {str(e)}'}), 500
@@ -5,9 +5,12 @@ These routes demonstrate role-based access control
 from flask import Blueprint, jsonify
 from auth import admin_required, doctor_required, patient_required, get_current_user
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import User, Doctor, Patient, Appointment, Department
+from models import User, Doctor, Patient, Appointment
 from datetime import datetime, date, timedelta
 from database import db
+from utils.archive import archived_status_counts
+from utils.dashboard_snapshot import get_doctor_snapshot, snapshot_response
+from utils.department_catalog import department_catalog
 
 dashboard_bp = Blueprint('dashboard', __name__, url_prefix='/api/dashboard')
 
@@ -22,12 +25,13 @@ def admin_dashboard(current_user):
         # Get statistics
         total_doctors = Doctor.query.filter_by(is_active=True).count()
         total_patients = Patient.query.filter_by(is_active=True).count()
-        total_appointments = Appointment.query.count()
+        archived_counts = archived_status_counts()
+        total_appointments = Appointment.query.count() + sum(archived_counts.values())
         upcoming_appointments = Appointment.query.filter(
             Appointment.appointment_date >= date.today(),
             Appointment.status == 'Booked'
         ).count()
-        completed_appointments = Appointment.query.filter_by(status='Completed').count()
+        completed_appointments = Appointment.query.filter_by(status='Completed').count() + archived_counts.get('Completed', 0)
         
         # Get recent appointments
         recent_appointments = Appointment.query.order_by(
@@ -65,50 +69,18 @@ def doctor_dashboard(current_user):
         if not doctor:
             return jsonify({'error': 'Doctor profile not found'}), 404
         
-        # Get today's appointments
-        today = date.today()
-        today_appointments = Appointment.query.filter(
-            Appointment.doctor_id == doctor.id,
-            Appointment.appointment_date == today,
-            Appointment.status == 'Booked'
-        ).order_by(Appointment.appointment_time).all()
-        
-        # Get upcoming appointments (next 7 days)
-        week_end = today + timedelta(days=7)
-        upcoming_appointments = Appointment.query.filter(
-            Appointment.doctor_id == doctor.id,
-            Appointment.appointment_date >= today,
-            Appointment.appointment_date <= week_end,
-            Appointment.status == 'Booked'
-        ).order_by(Appointment.appointment_date, Appointment.appointment_time).all()
-        
-        # Get assigned patients (patients who have appointments with this doctor)
-        patient_ids = db.session.query(Appointment.patient_id).filter(
-            Appointment.doctor_id == doctor.id
-        ).distinct().all()
-        patient_ids = [pid[0] for pid in patient_ids]
-        assigned_patients = Patient.query.filter(Patient.id.in_(patient_ids)).limit(20).all()
-        
-        # Get completed appointments count for today
-        completed_today = Appointment.query.filter(
-            Appointment.doctor_id == doctor.id,
-            Appointment.appointment_date == today,
-            Appointment.status == 'Completed'
-        ).count()
+        # Cached snapshot shared with /api/doctor/dashboard
+        snapshot = snapshot_response(get_doctor_snapshot(doctor.id))
+        snapshot['statistics'] = {
+            key: snapshot['statistics'][key]
+            for key in ('appointments_today', 'completed_today', 'upcoming_this_week', 'total_patients')
+        }
         
         return jsonify({
             'role': 'doctor',
             'dashboard': 'doctor',
             'doctor': doctor.to_dict(),
-            'statistics': {
-                'appointments_today': len(today_appointments),
-                'completed_today': completed_today,
-                'upcoming_this_week': len(upcoming_appointments),
-                'total_patients': len(assigned_patients)
-            },
-            'today_appointments': [apt.to_dict() for apt in today_appointments],
-            'upcoming_appointments': [apt.to_dict() for apt in upcoming_appointments],
-            'assigned_patients': [patient.to_dict() for patient in assigned_patients],
+            **snapshot,
             'user': current_user.to_dict()
         }), 200
         
@@ -128,8 +100,8 @@ def patient_dashboard(current_user):
         if not patient:
             return jsonify({'error': 'Patient profile not found'}), 404
         
-        # Get all departments
-        departments = Department.query.all()
+        # Get all departments (in-process catalog, see utils/department_catalog.py)
+        departments = department_catalog.departments()
         
         # Get upcoming appointments
         today = date.today()
@@ -157,7 +129,7 @@ def patient_dashboard(current_user):
             'role': 'patient',
             'dashboard': 'patient',
             'patient': patient.to_dict(),
-            'departments': [dept.to_dict() for dept in departments],
+            'departments': departments,
             'upcoming_appointments': [apt.to_dict() for apt in upcoming_appointments],
             'past_appointments': appointments_with_treatment,
             'statistics': {
@@ -2,22 +2,56 @@
 Doctor routes for managing appointments, treatments, and availability
 """
 from flask import Blueprint, request, jsonify
+from werkzeug.exceptions import HTTPException
 from auth import doctor_required
 from database import db
-from models import Doctor, Patient, Appointment, Treatment, DoctorAvailability
+from models import Doctor, Patient, Appointment, Treatment, DoctorAvailability, AvailabilityTemplate, AvailabilityException
 from datetime import datetime, date, timedelta
-from sqlalchemy import and_
+from sqlalchemy import and_, or_
 from utils.cache import (
     cache_get_json,
     cache_set_json,
-    invalidate_doctor_availability_cache,
-    invalidate_doctor_search_cache,
+    invalidate_doctor_availability_dates,
+)
+from utils.archive import fetch_appointment_history, fetch_doctor_patients, decode_cursor
+from utils.availability import (
+    apply_availability,
+    ensure_materialized,
+    replace_templates,
+    apply_exception,
+    parse_exception,
+    rewind_materialization,
+    MATERIALIZE_DAYS,
+)
+from utils.timeline import invalidate_patient_summary
+from utils.appointment_rows import appointment_rows
+from utils.dashboard_snapshot import get_doctor_snapshot, snapshot_response, apply_appointment_event
+from utils.conditional import (
+    conditional,
+    own_doctor_appointments,
+    own_doctor_availability,
+    patient_appointments,
+    bump_appointment_generations,
+    bump_generations_for_event,
+)
+from utils.outbox import (
+    emit_appointment_event,
+    kick_dispatcher,
+    register_in_process_consumer,
+    APPOINTMENT_COMPLETED,
+    APPOINTMENT_CANCELLED,
 )
 
 doctor_bp = Blueprint('doctor', __name__, url_prefix='/api/doctor')
 
+# Keep cached dashboard snapshots current as appointment writes commit
+register_in_process_consumer(apply_appointment_event)
+# Move the HTTP validators of the doctor's, the patient's and the admin appointment views
+register_in_process_consumer(bump_generations_for_event)
+
 @doctor_bp.route('/dashboard', methods=['GET'])
 @doctor_required
+@conditional(own_doctor_appointments, 'patients', daily=True)
 def doctor_dashboard(current_user):
     """
     Doctor dashboard with appointments and statistics
@@ -28,59 +62,14 @@ def doctor_dashboard(current_user):
         if not doctor:
             return jsonify({'error': 'Doctor profile not found'}), 404
         
-        today = date.today()
-        week_end = today + timedelta(days=7)
-        
-        # Today's appointments
-        today_appointments = Appointment.query.filter(
-            Appointment.doctor_id == doctor.id,
-            Appointment.appointment_date == today,
-            Appointment.status == 'Booked'
-        ).order_by(Appointment.appointment_time).all()
-        
-        # Upcoming appointments (next 7 days)
-        upcoming_appointments = Appointment.query.filter(
-            Appointment.doctor_id == doctor.id,
-            Appointment.appointment_date >= today,
-            Appointment.appointment_date <= week_end,
-            Appointment.status == 'Booked'
-        ).order_by(Appointment.appointment_date, Appointment.appointment_time).all()
-        
-        # Completed today
-        completed_today = Appointment.query.filter(
-            Appointment.doctor_id == doctor.id,
-            Appointment.appointment_date == today,
-            Appointment.status == 'Completed'
-        ).count()
-        
-        # Assigned patients (unique patients with appointments)
-        patient_ids = db.session.query(Appointment.patient_id).filter(
-            Appointment.doctor_id == doctor.id
-        ).distinct().all()
-        patient_ids = [pid[0] for pid in patient_ids]
-        assigned_patients = Patient.query.filter(Patient.id.in_(patient_ids)).limit(20).all()
-        
-        # Statistics
-        total_appointments = Appointment.query.filter_by(doctor_id=doctor.id).count()
-        completed_appointments = Appointment.query.filter(
-            Appointment.doctor_id == doctor.id,
-            Appointment.status == 'Completed'
-        ).count()
+        # Counts, today's/this week's appointments and recent patients come from
+        # the cached snapshot, which appointment writes patch in place
+        snapshot = get_doctor_snapshot(doctor.id)
         
         return jsonify({
             'role': 'doctor',
             'doctor': doctor.to_dict(),
-            'statistics': {
-                'appointments_today': len(today_appointments),
-                'completed_today': completed_today,
-                'upcoming_this_week': len(upcoming_appointments),
-                'total_patients': len(assigned_patients),
-                'total_appointments': total_appointments,
-                'completed_appointments': completed_appointments
-            },
-            'today_appointments': [apt.to_dict() for apt in today_appointments],
-            'upcoming_appointments': [apt.to_dict() for apt in upcoming_appointments],
-            'assigned_patients': [patient.to_dict() for patient in assigned_patients]
+            **snapshot_response(snapshot)
         }), 200
         
     except Exception as e:
@@ -90,6 +79,7 @@ def doctor_dashboard(current_user):
 
 @doctor_bp.route('/appointments', methods=['GET'])
 @doctor_required
+@conditional(own_doctor_appointments, 'patients', daily=True)
 def get_appointments(current_user):
     """
     Get doctor's appointments with optional filters
@@ -104,29 +94,19 @@ def get_appointments(current_user):
         date_from = request.args.get('date_from')
         date_to = request.args.get('date_to')
         
-        query = Appointment.query.filter_by(doctor_id=doctor.id)
+        conditions = [Appointment.doctor_id == doctor.id]
         
         if status:
-            query = query.filter_by(status=status)
+            conditions.append(Appointment.status == status)
         
         if date_from:
-            query = query.filter(Appointment.appointment_date >= date_from)
+            conditions.append(Appointment.appointment_date >= date_from)
         
         if date_to:
-            query = query.filter(Appointment.appointment_date <= date_to)
+            conditions.append(Appointment.appointment_date <= date_to)
         
-        appointments = query.order_by(
-            Appointment.appointment_date.desc(),
-            Appointment.appointment_time.desc()
-        ).all()
-        
-        # Include treatment data in appointments
-        appointments_data = []
-        for apt in appointments:
-            apt_dict = apt.to_dict()
-            if apt.treatment:
-                apt_dict['treatment'] = apt.treatment.to_dict()
-            appointments_data.append(apt_dict)
+        # Include treatment data in appointments (Core rows, see utils/appointment_rows.py)
+        appointments_data = appointment_rows(*conditions, include_treatment=True)
         
         return jsonify({
             'appointments': appointments_data,
@@ -138,6 +118,7 @@ def get_appointments(current_user):
 
 @doctor_bp.route('/appointments/<int:appointment_id>', methods=['GET'])
 @doctor_required
+@conditional(own_doctor_appointments, 'patients')
 def get_appointment(current_user, appointment_id):
     """Get appointment details"""
     try:
@@ -180,7 +161,9 @@ def complete_appointment(current_user, appointment_id):
         
         appointment.status = 'Completed'
         appointment.updated_at = datetime.utcnow()
+        emit_appointment_event(APPOINTMENT_COMPLETED, appointment, actor=current_user)
         db.session.commit()
+        kick_dispatcher()
         
         return jsonify({
             'message': 'Appointment marked as completed',
@@ -216,7 +199,9 @@ def cancel_appointment(current_user, appointment_id):
         
         appointment.status = 'Cancelled'
         appointment.updated_at = datetime.utcnow()
+        emit_appointment_event(APPOINTMENT_CANCELLED, appointment, actor=current_user)
         db.session.commit()
+        kick_dispatcher()
         
         return jsonify({
             'message': 'Appointment cancelled successfully',
@@ -277,11 +262,18 @@ def add_treatment(current_user, appointment_id):
         db.session.add(treatment)
         
         # Mark appointment as completed if not already
-        if appointment.status == 'Booked':
+        completed = appointment.status == 'Booked'
+        if completed:
             appointment.status = 'Completed'
             appointment.updated_at = datetime.utcnow()
+            emit_appointment_event(APPOINTMENT_COMPLETED, appointment, actor=current_user)
         
         db.session.commit()
+        if completed:
+            kick_dispatcher()
+        else:
+            invalidate_patient_summary(appointment.patient_id)  # No event, but the treated count moved
+            bump_appointment_generations(appointment)
         
         return jsonify({
             'message': 'Treatment added successfully',
@@ -341,6 +333,7 @@ def update_treatment(current_user, appointment_id):
         
         treatment.updated_at = datetime.utcnow()
         db.session.commit()
+        bump_appointment_generations(appointment)
         
         return jsonify({
             'message': 'Treatment updated successfully',
@@ -353,52 +346,52 @@ def update_treatment(current_user, appointment_id):
 
 # ==================== PATIENT HISTORY ====================
 
+PATIENTS_PAGE_SIZE = 50
+MAX_PATIENTS_PAGE = 200
+
 @doctor_bp.route('/patients', methods=['GET'])
 @doctor_required
+@conditional(own_doctor_appointments, 'patients', 'archive')
 def get_assigned_patients(current_user):
     """
-    Get list of patients assigned to this doctor with latest diagnosis
+    Get patients assigned to this doctor with their latest diagnosis,
+    most recently seen first (?order=asc for least recently seen first)
+    Paging: ?limit=N&cursor=<next_cursor from the previous page>; ?q= filters by name
     """
     try:
         doctor = current_user.doctor_profile
         if not doctor:
             return jsonify({'error': 'Doctor profile not found'}), 404
         
-        # Get unique patient IDs
-        patient_ids = db.session.query(Appointment.patient_id).filter(
-            Appointment.doctor_id == doctor.id
-        ).distinct().all()
-        patient_ids = [pid[0] for pid in patient_ids]
-        
-        patients = Patient.query.filter(Patient.id.in_(patient_ids)).all()
+        limit = max(1, min(request.args.get('limit', PATIENTS_PAGE_SIZE, type=int), MAX_PATIENTS_PAGE))
+        cursor = request.args.get('cursor')
+        try:
+            if cursor:
+                decode_cursor(cursor)  # Raises ValueError when malformed
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        
+        # Current and archived visits, last visit and latest diagnosis in one query
+        rows, next_cursor = fetch_doctor_patients(
+            doctor.id,
+            limit=limit,
+            cursor=cursor,
+            ascending=request.args.get('order') == 'asc',
+            name=(request.args.get('q') or '').strip() or None
+        )
         
-        # Get latest diagnosis for each patient from completed appointments
-        from models import Treatment
-        patients_with_diagnosis = []
-        for patient in patients:
+        patients = []
+        for patient, last_visit_date, last_visit_time, visit_count, latest_diagnosis in rows:
             patient_dict = patient.to_dict()
-            
-            # Get the most recent completed appointment with treatment for this patient and doctor
-            latest_appointment = Appointment.query.filter(
-                Appointment.patient_id == patient.id,
-                Appointment.doctor_id == doctor.id,
-                Appointment.status == 'Completed'
-            ).order_by(
-                Appointment.appointment_date.desc(),
-                Appointment.appointment_time.desc()
-            ).first()
-            
-            # Get the latest diagnosis from treatment
-            if latest_appointment and latest_appointment.treatment:
-                patient_dict['latest_diagnosis'] = latest_appointment.treatment.diagnosis
-            else:
-                patient_dict['latest_diagnosis'] = None
-            
-            patients_with_diagnosis.append(patient_dict)
+            patient_dict['latest_diagnosis'] = latest_diagnosis
+            patient_dict['last_visit'] = last_visit_date.isoformat()
+            patient_dict['visit_count'] = visit_count
+            patients.append(patient_dict)
         
         return jsonify({
-            'patients': patients_with_diagnosis,
-            'count': len(patients_with_diagnosis)
+            'patients': patients,
+            'count': len(patients),
+            'next_cursor': next_cursor
         }), 200
         
     except Exception as e:
@@ -406,6 +399,7 @@ def get_assigned_patients(current_user):
 
 @doctor_bp.route('/patients/<int:patient_id>', methods=['GET'])
 @doctor_required
+@conditional(patient_appointments, 'doctors', 'patients', 'archive')
 def get_patient_history(current_user, patient_id):
     """
     Get full medical history of a patient
@@ -415,11 +409,8 @@ def get_patient_history(current_user, patient_id):
         doctor = current_user.doctor_profile
         patient = Patient.query.get_or_404(patient_id)
         
-        # Get all appointments with this doctor
-        appointments = Appointment.query.filter_by(
-            patient_id=patient_id,
-            doctor_id=doctor.id
-        ).order_by(Appointment.appointment_date.desc()).all()
+        # Get all appointments with this doctor (current and archived)
+        appointments, _ = fetch_appointment_history(patient_id=patient_id, doctor_id=doctor.id)
         
         # Include treatment details
         appointments_with_treatment = []
@@ -445,6 +436,7 @@ AVAILABILITY_CACHE_TTL = 300  # 5 minutes
 
 @doctor_bp.route('/availability', methods=['GET'])
 @doctor_required
+@conditional(own_doctor_availability, 'holidays', daily=True)
 def get_availability(current_user):
     """
     Get doctor's availability for next 7 days
@@ -462,6 +454,9 @@ def get_availability(current_user):
         today = date.today()
         week_end = today + timedelta(days=7)
         
+        # Expand recurring templates for this window if not done yet
+        ensure_materialized([doctor.id])
+        
         availability = DoctorAvailability.query.filter(
             DoctorAvailability.doctor_id == doctor.id,
             DoctorAvailability.date >= today,
@@ -507,40 +502,36 @@ def set_availability(current_user):
         today = date.today()
         week_end = today + timedelta(days=7)
         
-        # Clear existing availability for next 7 days
-        DoctorAvailability.query.filter(
+        # Diff submitted slots against existing rows; only changes are written
+        try:
+            changes = apply_availability(doctor.id, data, today, week_end)
+        except (KeyError, ValueError) as e:
+            db.session.rollback()
+            return jsonify({'error': f'Invalid availability slot: {str(e)}'}), 400
+        
+        db.session.commit()
+        invalidate_doctor_availability_dates(doctor.id, changes['affected_dates'])
+        
+        availability = DoctorAvailability.query.filter(
             DoctorAvailability.doctor_id == doctor.id,
             DoctorAvailability.date >= today,
             DoctorAvailability.date <= week_end
-        ).delete()
-        
-        # Add new availability slots
-        created_slots = []
-        for slot_data in data:
-            slot_date = datetime.strptime(slot_data['date'], '%Y-%m-%d').date()
-            
-            # Only allow setting availability for next 7 days
-            if slot_date < today or slot_date > week_end:
-                continue
-            
-            slot = DoctorAvailability(
-                doctor_id=doctor.id,
-                date=slot_date,
-                start_time=datetime.strptime(slot_data['start_time'], '%H:%M').time(),
-                end_time=datetime.strptime(slot_data['end_time'], '%H:%M').time(),
-                is_available=slot_data.get('is_available', True)
-            )
-            
-            db.session.add(slot)
-            created_slots.append(slot)
-        
-        db.session.commit()
-        invalidate_doctor_availability_cache(doctor.id)
-        invalidate_doctor_search_cache()
+        ).order_by(DoctorAvailability.date, DoctorAvailability.start_time).all()
         
         return jsonify({
-            'message': f'Availability updated successfully. Created {len(created_slots)} slots.',
-            'availability': [slot.to_dict() for slot in created_slots]
+            'message': (
+                f"Availability updated successfully. {changes['inserted']} added, "
+                f"{changes['updated']} updated, {changes['deleted']} removed."
+            ),
+            'changes': {
+                'inserted': changes['inserted'],
+                'updated': changes['updated'],
+                'deleted': changes['deleted'],
+                'unchanged': changes['unchanged'],
+                'kept_booked': changes['kept_booked'],
+                'affected_dates': [d.isoformat() for d in changes['affected_dates']]
+            },
+            'availability': [slot.to_dict() for slot in availability]
         }), 201
         
     except Exception as e:
@@ -570,8 +561,7 @@ def update_availability_slot(current_user, availability_id):
             availability.is_available = bool(data['is_available'])
         
         db.session.commit()
-        invalidate_doctor_availability_cache(doctor.id)
-        invalidate_doctor_search_cache()
+        invalidate_doctor_availability_dates(doctor.id, [availability.date])
         
         return jsonify({
             'message': 'Availability slot updated successfully',
@@ -595,10 +585,10 @@ def delete_availability_slot(current_user, availability_id):
             doctor_id=doctor.id
         ).first_or_404()
         
+        slot_date = availability.date
         db.session.delete(availability)
         db.session.commit()
-        invalidate_doctor_availability_cache(doctor.id)
-        invalidate_doctor_search_cache()
+        invalidate_doctor_availability_dates(doctor.id, [slot_date])
         
         return jsonify({'message': 'Availability slot deleted successfully'}), 200
         
@@ -606,3 +596,160 @@ def delete_availability_slot(current_user, availability_id):
         db.session.rollback()
         return jsonify({'error': f'Failed to delete availability: {str(e)}'}), 500
 
+
+# ==================== RECURRING AVAILABILITY ====================
+
+@doctor_bp.route('/availability/templates', methods=['GET'])
+@doctor_required
+@conditional(own_doctor_availability, 'holidays', daily=True)
+def get_availability_templates(current_user):
+    """
+    Get weekly recurring availability templates and upcoming leave/holidays
+    """
+    try:
+        doctor = current_user.doctor_profile
+        if not doctor:
+            return jsonify({'error': 'Doctor profile not found'}), 404
+        
+        templates = AvailabilityTemplate.query.filter_by(
+            doctor_id=doctor.id,
+            is_active=True
+        ).order_by(AvailabilityTemplate.weekday, AvailabilityTemplate.start_time).all()
+        
+        exceptions = AvailabilityException.query.filter(
+            or_(AvailabilityException.doctor_id == doctor.id, AvailabilityException.doctor_id == None),
+            AvailabilityException.date >= date.today()
+        ).order_by(AvailabilityException.date).all()
+        
+        return jsonify({
+            'templates': [template.to_dict() for template in templates],
+            'exceptions': [exception.to_dict() for exception in exceptions]
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'Failed to get availability templates: {str(e)}'}), 500
+
+@doctor_bp.route('/availability/templates', methods=['PUT'])
+@doctor_required
+def set_availability_templates(current_user):
+    """
+    Replace weekly recurring availability templates
+    Concrete slots are generated from these automatically
+    Body: Array of template objects
+    [
+      {
+        "weekday": 0,  (0 = Monday ... 6 = Sunday)
+        "start_time": "HH:MM",
+        "end_time": "HH:MM"
+      }
+    ]
+    """
+    try:
+        doctor = current_user.doctor_profile
+        if not doctor:
+            return jsonify({'error': 'Doctor profile not found'}), 404
+        
+        data = request.get_json()
+        
+        if not isinstance(data, list):
+            return jsonify({'error': 'Expected array of template objects'}), 400
+        
+        try:
+            templates = replace_templates(doctor.id, data)
+        except (KeyError, ValueError, TypeError) as e:
+            db.session.rollback()
+            return jsonify({'error': f'Invalid availability template: {str(e)}'}), 400
+        
+        db.session.commit()
+        
+        today = date.today()
+        ensure_materialized([doctor.id])
+        invalidate_doctor_availability_dates(
+            doctor.id,
+            [today + timedelta(days=offset) for offset in range(MATERIALIZE_DAYS + 1)]
+        )
+        
+        return jsonify({
+            'message': f'Recurring availability updated. {len(templates)} weekly slots.',
+            'templates': [template.to_dict() for template in templates]
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Failed to update availability templates: {str(e)}'}), 500
+
+@doctor_bp.route('/availability/exceptions', methods=['POST'])
+@doctor_required
+def add_availability_exception(current_user):
+    """
+    Add leave for a date (whole day, or a time range)
+    Body: { "date": "YYYY-MM-DD", "start_time": "HH:MM", "end_time": "HH:MM", "notes": "..." }
+    """
+    try:
+        doctor = current_user.doctor_profile
+        if not doctor:
+            return jsonify({'error': 'Doctor profile not found'}), 404
+        
+        data = request.get_json() or {}
+        
+        try:
+            exception_date, start_time, end_time, _, notes = parse_exception(data)
+        except (KeyError, ValueError) as e:
+            return jsonify({'error': f'Invalid leave entry: {str(e)}'}), 400
+        
+        if exception_date < date.today():
+            return jsonify({'error': 'Cannot add leave for a past date'}), 400
+        
+        exception = AvailabilityException(
+            doctor_id=doctor.id,
+            date=exception_date,
+            start_time=start_time,
+            end_time=end_time,
+            reason='leave',
+            notes=notes
+        )
+        db.session.add(exception)
+        removed = apply_exception(exception)
+        db.session.commit()
+        invalidate_doctor_availability_dates(doctor.id, [exception_date])
+        
+        return jsonify({
+            'message': f'Leave added. {removed} recurring slot(s) removed.',
+            'exception': exception.to_dict()
+        }), 201
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Failed to add leave: {str(e)}'}), 500
+
+@doctor_bp.route('/availability/exceptions/<int:exception_id>', methods=['DELETE'])
+@doctor_required
+def delete_availability_exception(current_user, exception_id):
+    """
+    Remove leave; recurring slots for that date are generated again
+    """
+    try:
+        doctor = current_user.doctor_profile
+        if not doctor:
+            return jsonify({'error': 'Doctor profile not found'}), 404
+        
+        exception = AvailabilityException.query.filter_by(
+            id=exception_id,
+            doctor_id=doctor.id
+        ).first_or_404()
+        
+        exception_date = exception.date
+        db.session.delete(exception)
+        rewind_materialization(exception_date, doctor.id)
+        db.session.commit()
+        
+        ensure_materialized([doctor.id])
+        invalidate_doctor_availability_dates(doctor.id, [exception_date])
+        
+        return jsonify({'message': 'Leave removed successfully'}), 200
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Failed to remove leave: {str(e)}'}), 500
@@ -4,7 +4,7 @@ Routes for triggering and managing CSV exports
 from flask import Blueprint, request, jsonify, send_file
 from auth import patient_required, admin_required
 from database import db
-from models import Patient
+from models import Patient, Export
 from tasks.export_tasks import export_patient_treatment_pdf, export_patient_treatment_csv, generate_pdf_export, generate_csv_export
 from celery.result import AsyncResult
 from celery_app import celery_app
@@ -154,24 +154,26 @@ def download_export(current_user, filename):
     Download exported CSV file
     """
     try:
-        # Security: Verify filename belongs to current user
-        if not filename.startswith(f'patient_{current_user.patient_profile.id}_'):
-            return jsonify({'error': 'Unauthorized access'}), 403
+        patient = current_user.patient_profile
+        if not patient:
+            return jsonify({'error': 'Patient profile not found'}), 404
         
-        exports_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'exports')
-        filepath = os.path.join(exports_dir, filename)
+        # Security: Resolve file through the export catalog scoped to current user
+        export = Export.query.filter_by(filename=filename).first()
+        if not export or export.patient_id != patient.id:
+            return jsonify({'error': 'Unauthorized access'}), 403
         
-        if not os.path.exists(filepath):
+        if export.status != 'completed' or not os.path.exists(export.filepath):
             return jsonify({'error': 'File not found'}), 404
         
-        # Determine mimetype based on file extension
-        if filename.endswith('.csv'):
+        # Determine mimetype based on export format
+        if export.format == 'csv':
             mimetype = 'text/csv'
         else:
             mimetype = 'application/pdf'
         
         return send_file(
-            filepath,
+            export.filepath,
             as_attachment=True,
             download_name=filename,
             mimetype=mimetype
@@ -192,29 +194,13 @@ def list_my_exports(current_user):
         if not patient:
             return jsonify({'error': 'Patient profile not found'}), 404
         
-        exports_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'exports')
-        
-        if not os.path.exists(exports_dir):
-            return jsonify({'exports': [], 'count': 0}), 200
-        
-        # Get all files for this patient
-        prefix = f'patient_{patient.id}_'
-        exports = []
-        
-        for filename in os.listdir(exports_dir):
-            if filename.startswith(prefix) and (filename.endswith('.pdf') or filename.endswith('.csv')):
-                filepath = os.path.join(exports_dir, filename)
-                file_stat = os.stat(filepath)
-                
-                exports.append({
-                    'filename': filename,
-                    'created_at': datetime.fromtimestamp(file_stat.st_ctime).isoformat(),
-                    'size': file_stat.st_size,
-                    'download_url': f'/api/exports/download/{filename}'
-                })
-        
-        # Sort by creation time (newest first)
-        exports.sort(key=lambda x: x['created_at'], reverse=True)
+        # Indexed lookup in the export catalog (newest first)
+        exports = Export.query.filter_by(
+            patient_id=patient.id,
+            status='completed'
+        ).order_by(Export.created_at.desc()).all()
+        
+        exports = [export.to_dict() for export in exports]
         
         return jsonify({
             'exports': exports,
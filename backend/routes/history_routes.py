@@ -3,18 +3,51 @@ Appointment and Treatment History Routes
 Provides comprehensive history viewing for all roles
 """
 from flask import Blueprint, request, jsonify
-from auth import admin_required, doctor_required, patient_required, admin_or_doctor_required
+from auth import admin_required, doctor_required, patient_required, admin_or_doctor_required, role_required
 from database import db
 from models import Appointment, Treatment, Patient, Doctor
 from datetime import date, datetime, timedelta
 from sqlalchemy import and_, or_, desc
+from utils.archive import (
+    fetch_appointment_history,
+    fetch_treatment_history,
+    status_counts,
+    treatment_count,
+    doctor_has_seen_patient,
+    decode_cursor,
+    patient_summary,
+    archive_cutoff,
+)
+from utils.outbox import register_in_process_consumer
+from utils.conditional import conditional, patient_appointments
+from utils.timeline import get_patient_summary, drop_summary_for_event
 
 history_bp = Blueprint('history', __name__, url_prefix='/api/history')
 
+# Cached patient summaries are dropped as appointment writes commit
+register_in_process_consumer(drop_summary_for_event)
+
+MAX_HISTORY_PAGE = 200
+TIMELINE_PAGE_SIZE = 20
+
+def _page_args():
+    """
+    Optional paging: ?limit=N&cursor=<next_cursor from the previous page>
+    Returns (limit, cursor); limit is None when the full history is requested
+    """
+    limit = request.args.get('limit', type=int)
+    if limit is not None:
+        limit = max(1, min(limit, MAX_HISTORY_PAGE))
+    cursor = request.args.get('cursor')
+    if cursor:
+        decode_cursor(cursor)  # Raises ValueError when malformed
+    return limit, cursor
+
 # ==================== APPOINTMENT HISTORY ====================
 
 @history_bp.route('/appointments', methods=['GET'])
 @admin_required
+@conditional('appointments', 'archive', 'doctors', 'patients')
 def admin_appointment_history(current_user):
     """
     Admin: View complete appointment history with filters
@@ -28,27 +61,21 @@ def admin_appointment_history(current_user):
         date_to = request.args.get('date_to')
         include_treatment = request.args.get('include_treatment', 'true').lower() == 'true'
         
-        query = Appointment.query
-        
-        if patient_id:
-            query = query.filter_by(patient_id=patient_id)
-        
-        if doctor_id:
-            query = query.filter_by(doctor_id=doctor_id)
-        
-        if status:
-            query = query.filter_by(status=status)
-        
-        if date_from:
-            query = query.filter(Appointment.appointment_date >= date_from)
-        
-        if date_to:
-            query = query.filter(Appointment.appointment_date <= date_to)
-        
-        appointments = query.order_by(
-            desc(Appointment.appointment_date),
-            desc(Appointment.appointment_time)
-        ).all()
+        try:
+            limit, cursor = _page_args()
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        
+        # Hot and archived appointments, newest first
+        appointments, next_cursor = fetch_appointment_history(
+            patient_id=patient_id,
+            doctor_id=doctor_id,
+            status=status,
+            date_from=date_from,
+            date_to=date_to,
+            limit=limit,
+            cursor=cursor
+        )
         
         # Build response with treatment details if requested
         appointments_data = []
@@ -61,6 +88,7 @@ def admin_appointment_history(current_user):
         return jsonify({
             'appointments': appointments_data,
             'count': len(appointments_data),
+            'next_cursor': next_cursor,
             'filters': {
                 'patient_id': patient_id,
                 'doctor_id': doctor_id,
@@ -75,6 +103,7 @@ def admin_appointment_history(current_user):
 
 @history_bp.route('/appointments/patient/<int:patient_id>', methods=['GET'])
 @admin_or_doctor_required
+@conditional(patient_appointments, 'archive', 'doctors', 'patients', daily=True)
 def view_patient_appointment_history(current_user, patient_id):
     """
     Admin/Doctor: View complete appointment history for a specific patient
@@ -89,25 +118,22 @@ def view_patient_appointment_history(current_user, patient_id):
             if not doctor:
                 return jsonify({'error': 'Doctor profile not found'}), 404
             
-            # Check if doctor has any appointments with this patient
-            has_relation = Appointment.query.filter_by(
-                doctor_id=doctor.id,
-                patient_id=patient_id
-            ).first()
-            
-            if not has_relation:
+            # Check if doctor has any appointments (current or archived) with this patient
+            if not doctor_has_seen_patient(doctor.id, patient_id):
                 return jsonify({
                     'error': 'You do not have access to this patient\'s history',
                     'message': 'You must have at least one appointment with this patient'
                 }), 403
         
-        # Get all appointments for this patient
-        appointments = Appointment.query.filter_by(
-            patient_id=patient_id
-        ).order_by(
-            desc(Appointment.appointment_date),
-            desc(Appointment.appointment_time)
-        ).all()
+        try:
+            limit, cursor = _page_args()
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        
+        # Get appointments for this patient from both tiers
+        appointments, next_cursor = fetch_appointment_history(patient_id=patient_id, limit=limit, cursor=cursor)
+        summary = get_patient_summary(patient_id)
+        counts = summary['by_status']
         
         # Include treatment details
         appointments_with_treatment = []
@@ -120,12 +146,13 @@ def view_patient_appointment_history(current_user, patient_id):
         return jsonify({
             'patient': patient.to_dict(),
             'appointments': appointments_with_treatment,
-            'total_appointments': len(appointments_with_treatment),
+            'total_appointments': summary['total'],
+            'next_cursor': next_cursor,
             'statistics': {
-                'booked': len([a for a in appointments if a.status == 'Booked']),
-                'completed': len([a for a in appointments if a.status == 'Completed']),
-                'cancelled': len([a for a in appointments if a.status == 'Cancelled']),
-                'with_treatment': len([a for a in appointments if a.treatment])
+                'booked': counts.get('Booked', 0),
+                'completed': counts.get('Completed', 0),
+                'cancelled': counts.get('Cancelled', 0),
+                'with_treatment': summary['with_treatment']
             }
         }), 200
         
@@ -134,6 +161,7 @@ def view_patient_appointment_history(current_user, patient_id):
 
 @history_bp.route('/appointments/my-history', methods=['GET'])
 @patient_required
+@conditional(patient_appointments, 'archive', 'doctors', 'patients', daily=True)
 def patient_own_history(current_user):
     """
     Patient: View own complete appointment and treatment history
@@ -148,21 +176,19 @@ def patient_own_history(current_user):
         date_from = request.args.get('date_from')
         date_to = request.args.get('date_to')
         
-        query = Appointment.query.filter_by(patient_id=patient.id)
-        
-        if status:
-            query = query.filter_by(status=status)
+        try:
+            limit, cursor = _page_args()
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
         
-        if date_from:
-            query = query.filter(Appointment.appointment_date >= date_from)
-        
-        if date_to:
-            query = query.filter(Appointment.appointment_date <= date_to)
-        
-        appointments = query.order_by(
-            desc(Appointment.appointment_date),
-            desc(Appointment.appointment_time)
-        ).all()
+        appointments, next_cursor = fetch_appointment_history(
+            patient_id=patient.id,
+            status=status,
+            date_from=date_from,
+            date_to=date_to,
+            limit=limit,
+            cursor=cursor
+        )
         
         # Include all treatment details
         appointments_with_treatment = []
@@ -172,33 +198,107 @@ def patient_own_history(current_user):
                 apt_dict['treatment'] = apt.treatment.to_dict()
             appointments_with_treatment.append(apt_dict)
         
-        # Calculate statistics
-        today = date.today()
-        upcoming = [a for a in appointments if a.appointment_date >= today and a.status == 'Booked']
-        past = [a for a in appointments if a.appointment_date < today or a.status in ['Completed', 'Cancelled']]
+        # Statistics cover every appointment matching the filters, not just this page
+        if status or date_from or date_to:
+            summary = patient_summary(patient.id, status=status, date_from=date_from, date_to=date_to)
+        else:
+            summary = get_patient_summary(patient.id)
+        counts = summary['by_status']
         
         return jsonify({
             'patient': patient.to_dict(),
             'appointments': appointments_with_treatment,
             'total_appointments': len(appointments_with_treatment),
+            'next_cursor': next_cursor,
             'statistics': {
-                'total': len(appointments),
-                'upcoming': len(upcoming),
-                'past': len(past),
-                'booked': len([a for a in appointments if a.status == 'Booked']),
-                'completed': len([a for a in appointments if a.status == 'Completed']),
-                'cancelled': len([a for a in appointments if a.status == 'Cancelled']),
-                'with_treatment': len([a for a in appointments if a.treatment])
+                'total': summary['total'],
+                'upcoming': summary['upcoming'],
+                'past': summary['total'] - summary['upcoming'],
+                'booked': counts.get('Booked', 0),
+                'completed': counts.get('Completed', 0),
+                'cancelled': counts.get('Cancelled', 0),
+                'with_treatment': summary['with_treatment']
             }
         }), 200
         
     except Exception as e:
         return jsonify({'error': f'Failed to get appointment history: {str(e)}'}), 500
 
+# ==================== TIMELINE ====================
+
+@history_bp.route('/timeline', methods=['GET'])
+@history_bp.route('/timeline/<int:patient_id>', methods=['GET'])
+@role_required('admin', 'doctor', 'patient')
+@conditional(patient_appointments, 'archive', 'doctors', 'patients', daily=True)
+def patient_timeline(current_user, patient_id=None):
+    """
+    Patient timeline for every role: appointments newest first, each with its
+    treatment, plus summary counts for the whole history
+    Patients get their own timeline; admins and doctors pass the patient id
+    Query params: status, date_from, date_to, limit (default 20), cursor
+    """
+    try:
+        if current_user.role == 'patient':
+            patient = current_user.patient_profile
+            if not patient:
+                return jsonify({'error': 'Patient profile not found'}), 404
+            if patient_id is not None and patient_id != patient.id:
+                return jsonify({'error': 'You can only view your own timeline'}), 403
+        else:
+            if patient_id is None:
+                return jsonify({'error': 'Patient id is required'}), 400
+            patient = Patient.query.get_or_404(patient_id)
+            if current_user.role == 'doctor':
+                doctor = current_user.doctor_profile
+                if not doctor:
+                    return jsonify({'error': 'Doctor profile not found'}), 404
+                if not doctor_has_seen_patient(doctor.id, patient.id):
+                    return jsonify({'error': 'You do not have access to this patient\'s history'}), 403
+        
+        try:
+            limit, cursor = _page_args()
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        
+        appointments, next_cursor = fetch_appointment_history(
+            patient_id=patient.id,
+            status=request.args.get('status'),
+            date_from=request.args.get('date_from'),
+            date_to=request.args.get('date_to'),
+            limit=limit or TIMELINE_PAGE_SIZE,
+            cursor=cursor
+        )
+        
+        entries = []
+        for apt in appointments:
+            apt_dict = apt.to_dict()
+            apt_dict['treatment'] = apt.treatment.to_dict() if apt.treatment else None
+            entries.append(apt_dict)
+        
+        summary = get_patient_summary(patient.id)
+        return jsonify({
+            'patient': patient.to_dict(),
+            'entries': entries,
+            'count': len(entries),
+            'next_cursor': next_cursor,
+            'summary': {
+                'total': summary['total'],
+                'upcoming': summary['upcoming'],
+                'booked': summary['by_status'].get('Booked', 0),
+                'completed': summary['by_status'].get('Completed', 0),
+                'cancelled': summary['by_status'].get('Cancelled', 0),
+                'with_treatment': summary['with_treatment']
+            }
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'Failed to get patient timeline: {str(e)}'}), 500
+
 # ==================== TREATMENT HISTORY ====================
 
 @history_bp.route('/treatments', methods=['GET'])
 @admin_required
+@conditional('appointments', 'archive', 'doctors', 'patients')
 def admin_treatment_history(current_user):
     """
     Admin: View all treatment records
@@ -210,23 +310,19 @@ def admin_treatment_history(current_user):
         date_from = request.args.get('date_from')
         date_to = request.args.get('date_to')
         
-        query = Treatment.query.join(Appointment)
-        
-        if patient_id:
-            query = query.filter(Appointment.patient_id == patient_id)
-        
-        if doctor_id:
-            query = query.filter(Appointment.doctor_id == doctor_id)
-        
-        if date_from:
-            query = query.filter(Appointment.appointment_date >= date_from)
-        
-        if date_to:
-            query = query.filter(Appointment.appointment_date <= date_to)
+        try:
+            limit, cursor = _page_args()
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
         
-        treatments = query.order_by(
-            desc(Appointment.appointment_date)
-        ).all()
+        treatments, next_cursor = fetch_treatment_history(
+            patient_id=patient_id,
+            doctor_id=doctor_id,
+            date_from=date_from,
+            date_to=date_to,
+            limit=limit,
+            cursor=cursor
+        )
         
         treatments_data = []
         for treatment in treatments:
@@ -237,7 +333,8 @@ def admin_treatment_history(current_user):
         
         return jsonify({
             'treatments': treatments_data,
-            'count': len(treatments_data)
+            'count': len(treatments_data),
+            'next_cursor': next_cursor
         }), 200
         
     except Exception as e:
@@ -245,6 +342,7 @@ def admin_treatment_history(current_user):
 
 @history_bp.route('/treatments/patient/<int:patient_id>', methods=['GET'])
 @admin_or_doctor_required
+@conditional(patient_appointments, 'archive', 'doctors', 'patients')
 def view_patient_treatment_history(current_user, patient_id):
     """
     Admin/Doctor: View all treatment records for a specific patient
@@ -258,21 +356,17 @@ def view_patient_treatment_history(current_user, patient_id):
             if not doctor:
                 return jsonify({'error': 'Doctor profile not found'}), 404
             
-            # Check if doctor has treated this patient
-            has_relation = Appointment.query.filter_by(
-                doctor_id=doctor.id,
-                patient_id=patient_id
-            ).first()
-            
-            if not has_relation:
+            # Check if doctor has treated this patient (current or archived)
+            if not doctor_has_seen_patient(doctor.id, patient_id):
                 return jsonify({'error': 'You do not have access to this patient\'s treatment history'}), 403
         
-        # Get all treatments for this patient
-        treatments = Treatment.query.join(Appointment).filter(
-            Appointment.patient_id == patient_id
-        ).order_by(
-            desc(Appointment.appointment_date)
-        ).all()
+        try:
+            limit, cursor = _page_args()
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        
+        # Get treatments for this patient from both tiers
+        treatments, next_cursor = fetch_treatment_history(patient_id=patient_id, limit=limit, cursor=cursor)
         
         treatments_data = []
         for treatment in treatments:
@@ -288,7 +382,8 @@ def view_patient_treatment_history(current_user, patient_id):
         return jsonify({
             'patient': patient.to_dict(),
             'treatments': treatments_data,
-            'count': len(treatments_data)
+            'count': len(treatments_data),
+            'next_cursor': next_cursor
         }), 200
         
     except Exception as e:
@@ -296,6 +391,7 @@ def view_patient_treatment_history(current_user, patient_id):
 
 @history_bp.route('/treatments/my-treatments', methods=['GET'])
 @patient_required
+@conditional(patient_appointments, 'archive', 'doctors', 'patients')
 def patient_own_treatments(current_user):
     """
     Patient: View own treatment records
@@ -305,12 +401,13 @@ def patient_own_treatments(current_user):
         if not patient:
             return jsonify({'error': 'Patient profile not found'}), 404
         
-        # Get all treatments for this patient
-        treatments = Treatment.query.join(Appointment).filter(
-            Appointment.patient_id == patient.id
-        ).order_by(
-            desc(Appointment.appointment_date)
-        ).all()
+        try:
+            limit, cursor = _page_args()
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        
+        # Get treatments for this patient from both tiers
+        treatments, next_cursor = fetch_treatment_history(patient_id=patient.id, limit=limit, cursor=cursor)
         
         treatments_data = []
         for treatment in treatments:
@@ -325,7 +422,8 @@ def patient_own_treatments(current_user):
         
         return jsonify({
             'treatments': treatments_data,
-            'count': len(treatments_data)
+            'count': len(treatments_data),
+            'next_cursor': next_cursor
         }), 200
         
     except Exception as e:
@@ -335,34 +433,35 @@ def patient_own_treatments(current_user):
 
 @history_bp.route('/statistics', methods=['GET'])
 @admin_required
+@conditional('appointments', 'archive')
 def appointment_statistics(current_user):
     """
     Admin: Get appointment statistics by status
     """
     try:
-        from sqlalchemy import func
-        
-        # Get counts by status
-        status_counts = db.session.query(
-            Appointment.status,
-            func.count(Appointment.id).label('count')
-        ).group_by(Appointment.status).all()
+        # Get counts by status (current and archived)
+        by_status = status_counts()
         
         # Get total counts
-        total_appointments = Appointment.query.count()
-        total_with_treatment = Treatment.query.count()
+        total_appointments = sum(by_status.values())
+        total_with_treatment = treatment_count()
         
         # Get recent activity (last 30 days)
         thirty_days_ago = date.today() - timedelta(days=30)
         recent_appointments = Appointment.query.filter(
             Appointment.appointment_date >= thirty_days_ago
         ).count()
+        if thirty_days_ago < archive_cutoff():
+            from models import ArchivedAppointment
+            recent_appointments += ArchivedAppointment.query.filter(
+                ArchivedAppointment.appointment_date >= thirty_days_ago
+            ).count()
         
         statistics = {
             'total_appointments': total_appointments,
             'total_with_treatment': total_with_treatment,
             'recent_appointments_30_days': recent_appointments,
-            'by_status': {status: count for status, count in status_counts}
+            'by_status': by_status
         }
         
         return jsonify({'statistics': statistics}), 200
@@ -0,0 +1,116 @@
+"""
+Server-Sent Events stream of appointment changes for doctor and admin dashboards
+Replaces dashboard polling: load the dashboard once, then apply these deltas
+"""
+from functools import wraps
+from flask import Blueprint, Response, request, jsonify
+from auth import role_required
+from models import User
+from utils.live_updates import (
+    ALL_CHANNEL,
+    LIVE_UPDATES_BROKER,
+    STREAM_TICKET_TTL,
+    doctor_channel,
+    get_broker,
+    issue_stream_ticket,
+    publish_event,
+    redeem_stream_ticket,
+    replay_since,
+    stream,
+)
+from utils.outbox import register_in_process_consumer
+
+live_bp = Blueprint('live', __name__, url_prefix='/api/live')
+
+# The in-memory broker only sees changes made by this process, published as they commit
+if LIVE_UPDATES_BROKER == 'memory':
+    register_in_process_consumer(publish_event)
+
+STREAM_ROLES = ('admin', 'doctor')
+
+def ticket_or_role_required(*allowed_roles):
+    """
+    role_required, except that a ?ticket= from POST /api/live/tickets may stand
+    in for the Authorization header (EventSource cannot send headers)
+    """
+    def decorator(f):
+        header_auth = role_required(*allowed_roles)(f)
+
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            ticket = request.args.get('ticket')
+            if not ticket:
+                return header_auth(*args, **kwargs)
+            try:
+                user_id = redeem_stream_ticket(ticket)
+            except Exception as e:
+                return jsonify({'error': f'Live updates unavailable: {str(e)}'}), 503
+            user = User.query.get(user_id) if user_id is not None else None
+            if not user or not user.is_active:
+                return jsonify({'error': 'Invalid or expired stream ticket'}), 401
+            if user.role not in allowed_roles:
+                return jsonify({'error': 'Insufficient permissions'}), 403
+            kwargs['current_user'] = user
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+@live_bp.route('/tickets', methods=['POST'])
+@role_required(*STREAM_ROLES)
+def create_stream_ticket(current_user):
+    """
+    Issue a single-use ticket for opening the appointment stream with
+    ?ticket=<ticket>, so the access token never appears in a URL
+    """
+    try:
+        return jsonify({
+            'ticket': issue_stream_ticket(current_user.id),
+            'expires_in': STREAM_TICKET_TTL
+        }), 201
+    except Exception as e:
+        return jsonify({'error': f'Live updates unavailable: {str(e)}'}), 503
+
+@live_bp.route('/appointments', methods=['GET'])
+@ticket_or_role_required(*STREAM_ROLES)
+def appointment_stream(current_user):
+    """
+    Stream appointment deltas: the doctor's own appointments, or every
+    appointment for admins. EventSource clients pass ?ticket=<ticket> from
+    POST /api/live/tickets. A ticket opens one stream, so a client reconnects
+    with a new ticket and ?last_event_id= to replay missed deltas.
+    """
+    try:
+        if current_user.role == 'doctor':
+            doctor = current_user.doctor_profile
+            if not doctor:
+                return jsonify({'error': 'Doctor profile not found'}), 404
+            doctor_id, channel = doctor.id, doctor_channel(doctor.id)
+        else:
+            doctor_id, channel = None, ALL_CHANNEL
+
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        try:
+            last_event_id = int(last_event_id) if last_event_id else None
+        except ValueError:
+            return jsonify({'error': 'Invalid Last-Event-ID'}), 400
+
+        # Subscribe before replaying so nothing falls between the two
+        # (a delta may then arrive twice, which upserting makes harmless)
+        try:
+            subscription = get_broker().subscribe([channel])
+        except Exception as e:
+            return jsonify({'error': f'Live updates unavailable: {str(e)}'}), 503
+
+        try:
+            replay = replay_since(last_event_id, doctor_id=doctor_id) if last_event_id is not None else []
+        except Exception:
+            subscription.close()
+            raise
+
+        return Response(stream(subscription, replay), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Stop nginx from buffering the stream
+        })
+
+    except Exception as e:
+        return jsonify({'error': f'Failed to open live updates: {str(e)}'}), 500
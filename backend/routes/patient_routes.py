@@ -4,15 +4,30 @@ Patient routes for booking appointments, viewing doctors, and managing profile
 from flask import Blueprint, request, jsonify
 from auth import patient_required
 from database import db
-from models import Patient, Doctor, Department, Appointment, Treatment, DoctorAvailability
+from models import Patient, Doctor, Appointment, Treatment, DoctorAvailability
 from datetime import datetime, date, timedelta
 from sqlalchemy import and_, or_
-from utils.cache import cache_get_json, cache_set_json
+from utils.cache import doctor_search_date_tag, bump_generation
+from utils.search import search_doctor_ids, order_by_rank, DOCTOR_NAME_FIELDS
+from utils.availability import ensure_materialized, MATERIALIZE_DAYS
+from utils.user_profile import invalidate_user_profile
+from utils.conditional import conditional, own_patient_appointments, doctor_availability, SHORT_CACHE
+from utils.appointment_rows import appointment_rows
+from utils.compression import cache_response, cached_response
+from utils.department_catalog import department_catalog
+from utils.outbox import (
+    emit_appointment_event,
+    kick_dispatcher,
+    APPOINTMENT_BOOKED,
+    APPOINTMENT_RESCHEDULED,
+    APPOINTMENT_CANCELLED,
+)
 
 patient_bp = Blueprint('patient', __name__, url_prefix='/api/patient')
 
 @patient_bp.route('/dashboard', methods=['GET'])
 @patient_required
+@conditional(own_patient_appointments, 'departments', 'doctors', 'patients', daily=True)
 def patient_dashboard(current_user):
     """
     Patient dashboard with departments, doctors, and appointments
@@ -23,8 +38,8 @@ def patient_dashboard(current_user):
         if not patient:
             return jsonify({'error': 'Patient profile not found'}), 404
         
-        # Get all departments
-        departments = Department.query.all()
+        # Get all departments (in-process catalog, see utils/department_catalog.py)
+        departments = department_catalog.departments()
         
         # Get upcoming appointments
         today = date.today()
@@ -51,7 +66,7 @@ def patient_dashboard(current_user):
         return jsonify({
             'role': 'patient',
             'patient': patient.to_dict(),
-            'departments': [dept.to_dict() for dept in departments],
+            'departments': departments,
             'upcoming_appointments': [apt.to_dict() for apt in upcoming_appointments],
             'past_appointments': appointments_with_treatment,
             'statistics': {
@@ -68,6 +83,7 @@ def patient_dashboard(current_user):
 
 @patient_bp.route('/profile', methods=['GET'])
 @patient_required
+@conditional(rows=lambda current_user, **_: [current_user.updated_at, current_user.patient_profile.updated_at])
 def get_profile(current_user):
     """Get patient profile"""
     try:
@@ -124,6 +140,8 @@ def update_profile(current_user):
         
         patient.updated_at = datetime.utcnow()
         db.session.commit()
+        invalidate_user_profile(current_user.id)
+        bump_generation('patients')
         
         return jsonify({
             'message': 'Profile updated successfully',
@@ -141,6 +159,7 @@ DOCTOR_SEARCH_CACHE_TTL = 300  # 5 minutes
 
 @patient_bp.route('/doctors', methods=['GET'])
 @patient_required
+@conditional('doctors', 'departments', 'availability', 'holidays', daily=True)
 def search_doctors(current_user):
     """
     Search and view doctors
@@ -157,16 +176,6 @@ def search_doctors(current_user):
         if specialization_id:
             query = query.filter_by(specialization_id=specialization_id)
         
-        # Search by name
-        if search:
-            search_pattern = f'%{search}%'
-            query = query.filter(
-                or_(
-                    Doctor.first_name.ilike(search_pattern),
-                    Doctor.last_name.ilike(search_pattern)
-                )
-            )
-        
         available_date_key = 'any'
         selected_date = None
         
@@ -184,11 +193,27 @@ def search_doctors(current_user):
             f"{specialization_id or 'any'}:"
             f"{available_date_key}"
         )
-        cached_response = cache_get_json(search_key)
-        if cached_response:
-            return jsonify(cached_response), 200
+        cached = cached_response(search_key)  # Stored gzipped, served without re-encoding
+        if cached is not None:
+            return cached
+
+        # Search by name (full-text index)
+        if search:
+            doctor_ids = search_doctor_ids(search, fields=DOCTOR_NAME_FIELDS)
+            query = query.filter(Doctor.id.in_(doctor_ids))
 
         doctors = query.all()
+        if search:
+            doctors = order_by_rank(doctors, doctor_ids)
+
+        # Availability is shown for the next 7 days
+        today = date.today()
+        week_end = today + timedelta(days=7)
+
+        # Expand recurring templates for these doctors through the dates read below
+        through = max(week_end, selected_date) if selected_date else week_end
+        ensure_materialized([doctor.id for doctor in doctors],
+                            through=min(through, today + timedelta(days=MATERIALIZE_DAYS)))
 
         if selected_date:
             available_doctor_ids = db.session.query(DoctorAvailability.doctor_id).filter(
@@ -200,9 +225,6 @@ def search_doctors(current_user):
             doctors = [d for d in doctors if d.id in available_doctor_ids]
 
         # Get availability for each doctor (next 7 days)
-        today = date.today()
-        week_end = today + timedelta(days=7)
-        
         doctors_with_availability = []
         for doctor in doctors:
             doctor_dict = doctor.to_dict()
@@ -223,7 +245,20 @@ def search_doctors(current_user):
             'count': len(doctors_with_availability)
         }
 
-        cache_set_json(search_key, response_payload, ttl=DOCTOR_SEARCH_CACHE_TTL)
+        # Every result embeds the 7-day availability window, so a date-filtered
+        # search is also stale when any date in that window changes
+        search_tags = {doctor_search_date_tag(available_date_key)}
+        if selected_date:
+            search_tags.update(
+                doctor_search_date_tag((today + timedelta(days=offset)).isoformat())
+                for offset in range((week_end - today).days + 1)
+            )
+        cache_response(
+            search_key,
+            response_payload,
+            tags=sorted(search_tags),
+            ttl=DOCTOR_SEARCH_CACHE_TTL
+        )
         return jsonify(response_payload), 200
         
     except Exception as e:
@@ -231,12 +266,14 @@ def search_doctors(current_user):
 
 @patient_bp.route('/doctors/<int:doctor_id>', methods=['GET'])
 @patient_required
+@conditional('doctors', doctor_availability, 'holidays', daily=True)
 def get_doctor_details(current_user, doctor_id):
     """
     Get detailed doctor information with availability
     """
     try:
         doctor = Doctor.query.filter_by(id=doctor_id, is_active=True).first_or_404()
+        ensure_materialized([doctor.id])
         
         # Get availability for next 7 days
         today = date.today()
@@ -261,6 +298,7 @@ def get_doctor_details(current_user, doctor_id):
 
 @patient_bp.route('/appointments', methods=['GET'])
 @patient_required
+@conditional(own_patient_appointments, 'doctors', 'patients', daily=True)
 def get_appointments(current_user):
     """
     Get patient's appointments
@@ -274,27 +312,17 @@ def get_appointments(current_user):
         status = request.args.get('status')
         upcoming_only = request.args.get('upcoming_only', 'false').lower() == 'true'
         
-        query = Appointment.query.filter_by(patient_id=patient.id)
+        conditions = [Appointment.patient_id == patient.id]
         
         if status:
-            query = query.filter_by(status=status)
+            conditions.append(Appointment.status == status)
         
         if upcoming_only:
             today = date.today()
-            query = query.filter(Appointment.appointment_date >= today)
+            conditions.append(Appointment.appointment_date >= today)
         
-        appointments = query.order_by(
-            Appointment.appointment_date.desc(),
-            Appointment.appointment_time.desc()
-        ).all()
-        
-        # Include treatment details
-        appointments_with_treatment = []
-        for apt in appointments:
-            apt_dict = apt.to_dict()
-            if apt.treatment:
-                apt_dict['treatment'] = apt.treatment.to_dict()
-            appointments_with_treatment.append(apt_dict)
+        # Include treatment details (Core rows, see utils/appointment_rows.py)
+        appointments_with_treatment = appointment_rows(*conditions, include_treatment=True)
         
         return jsonify({
             'appointments': appointments_with_treatment,
@@ -327,23 +355,31 @@ def book_appointment(current_user):
         appointment_date = datetime.strptime(data['appointment_date'], '%Y-%m-%d').date()
         appointment_time = datetime.strptime(data['appointment_time'], '%H:%M').time()
         
-        # Check if doctor exists and is active
-        doctor = Doctor.query.filter_by(id=doctor_id, is_active=True).first()
-        if not doctor:
-            return jsonify({'error': 'Doctor not found or inactive'}), 404
-        
         # Check if appointment date is in the past
         if appointment_date < date.today():
             return jsonify({'error': 'Cannot book appointment in the past'}), 400
         
-        # Comprehensive validation using utility functions
-        from utils.appointment_utils import validate_appointment_booking
+        # Doctor, open slot and both conflicts in one query
+        from utils.appointment_utils import check_booking, validate_appointment_booking, take_availability_slot
+        
+        check = check_booking(doctor_id, patient.id, appointment_date, appointment_time)
+        
+        # Check if doctor exists and is active
+        if not check.doctor_active:
+            return jsonify({'error': 'Doctor not found or inactive'}), 404
+        
+        # Recurring slots must exist before the availability check
+        if check.needs_materialization:
+            ensure_materialized([doctor_id])
+            check = check_booking(doctor_id, patient.id, appointment_date, appointment_time)
         
+        # Comprehensive validation using utility functions
         is_valid, error_message, conflict_details = validate_appointment_booking(
             doctor_id=doctor_id,
             patient_id=patient.id,
             appointment_date=appointment_date,
-            appointment_time=appointment_time
+            appointment_time=appointment_time,
+            check=check
         )
         
         if not is_valid:
@@ -364,22 +400,15 @@ def book_appointment(current_user):
         
         db.session.add(appointment)
         
-        # Update doctor availability - mark the slot as unavailable
-        from utils.cache import invalidate_doctor_availability_cache, invalidate_doctor_search_cache
-        
-        availability_slot = DoctorAvailability.query.filter(
-            DoctorAvailability.doctor_id == doctor_id,
-            DoctorAvailability.date == appointment_date,
-            DoctorAvailability.start_time <= appointment_time,
-            DoctorAvailability.end_time >= appointment_time
-        ).first()
-        
-        if availability_slot:
-            availability_slot.is_available = False
-            invalidate_doctor_availability_cache(doctor_id)
-            invalidate_doctor_search_cache()
+        # Update doctor availability - mark the slot found by the check as unavailable
+        if not take_availability_slot(check.slot_id):
+            db.session.rollback()
+            return jsonify({'error': 'This time slot was just booked. Please choose another time.'}), 409
         
+        # Cache invalidation, notifications and audit run off the outbox
+        emit_appointment_event(APPOINTMENT_BOOKED, appointment, actor=current_user)
         db.session.commit()
+        kick_dispatcher()
         
         return jsonify({
             'message': 'Appointment booked successfully',
@@ -421,15 +450,24 @@ def reschedule_appointment(current_user, appointment_id):
         if new_date < date.today():
             return jsonify({'error': 'Cannot reschedule to a past date'}), 400
         
-        # Comprehensive validation using utility functions
-        from utils.appointment_utils import validate_appointment_booking
+        # Slot and both conflicts in one query
+        from utils.appointment_utils import check_booking, validate_appointment_booking
+        
+        check = check_booking(appointment.doctor_id, patient.id, new_date, new_time, appointment_id)
         
+        # Recurring slots must exist before the availability check
+        if check.needs_materialization:
+            ensure_materialized([appointment.doctor_id])
+            check = check_booking(appointment.doctor_id, patient.id, new_date, new_time, appointment_id)
+        
+        # Comprehensive validation using utility functions
         is_valid, error_message, conflict_details = validate_appointment_booking(
             doctor_id=appointment.doctor_id,
             patient_id=patient.id,
             appointment_date=new_date,
             appointment_time=new_time,
-            exclude_appointment_id=appointment_id
+            exclude_appointment_id=appointment_id,
+            check=check
         )
         
         if not is_valid:
@@ -439,11 +477,15 @@ def reschedule_appointment(current_user, appointment_id):
             return jsonify(response), 400
         
         # Update appointment
+        previous_date, previous_time = appointment.appointment_date, appointment.appointment_time
         appointment.appointment_date = new_date
         appointment.appointment_time = new_time
         appointment.updated_at = datetime.utcnow()
         
+        emit_appointment_event(APPOINTMENT_RESCHEDULED, appointment, actor=current_user,
+                               previous_date=previous_date, previous_time=previous_time)
         db.session.commit()
+        kick_dispatcher()
         
         return jsonify({
             'message': 'Appointment rescheduled successfully',
@@ -481,7 +523,9 @@ def cancel_appointment(current_user, appointment_id):
         
         appointment.status = 'Cancelled'
         appointment.updated_at = datetime.utcnow()
+        emit_appointment_event(APPOINTMENT_CANCELLED, appointment, actor=current_user)
         db.session.commit()
+        kick_dispatcher()
         
         return jsonify({'message': 'Appointment cancelled successfully'}), 200
         
@@ -491,6 +535,7 @@ def cancel_appointment(current_user, appointment_id):
 
 @patient_bp.route('/appointments/<int:appointment_id>', methods=['GET'])
 @patient_required
+@conditional(own_patient_appointments, 'doctors', 'patients')
 def get_appointment_details(current_user, appointment_id):
     """
     Get appointment details with treatment history
@@ -515,23 +560,14 @@ def get_appointment_details(current_user, appointment_id):
 
 @patient_bp.route('/departments', methods=['GET'])
 @patient_required
+@conditional('departments', cache_control=SHORT_CACHE)
 def get_departments(current_user):
     """
     Get all departments with doctor counts
     """
     try:
-        departments = Department.query.all()
-        departments_with_counts = []
-        
-        for dept in departments:
-            dept_dict = dept.to_dict()
-            # Count active doctors in this department
-            doctor_count = Doctor.query.filter_by(
-                specialization_id=dept.id,
-                is_active=True
-            ).count()
-            dept_dict['active_doctors_count'] = doctor_count
-            departments_with_counts.append(dept_dict)
+        # Counts come precomputed from the in-process catalog
+        departments_with_counts = department_catalog.departments(active_counts=True)
         
         return jsonify({
             'departments': departments_with_counts
@@ -542,20 +578,23 @@ def get_departments(current_user):
 
 @patient_bp.route('/departments/<int:department_id>', methods=['GET'])
 @patient_required
+@conditional('departments', 'doctors', cache_control=SHORT_CACHE)
 def get_department_details(current_user, department_id):
     """
     Get department details with list of doctors
     """
     try:
-        department = Department.query.get_or_404(department_id)
+        department = department_catalog.get(department_id)
+        if not department:
+            return jsonify({'error': 'Department not found'}), 404
         
         # Get doctors in this department
         doctors = Doctor.query.filter_by(
-            specialization_id=department.id,
+            specialization_id=department_id,
             is_active=True
         ).all()
         
-        dept_dict = department.to_dict()
+        dept_dict = dict(department)  # Catalog entries are shared
         dept_dict['doctors'] = [doc.to_dict() for doc in doctors]
         
         return jsonify({'department': dept_dict}), 200
@@ -0,0 +1,52 @@
+"""
+Typeahead suggestions for search boxes
+Lightweight alternative to the full search endpoints: ids and labels only
+"""
+from flask import Blueprint, request, jsonify
+from auth import role_required
+from utils.suggest import suggest_index, SUGGEST_KINDS
+
+suggest_bp = Blueprint('suggest', __name__, url_prefix='/api/suggest')
+
+SUGGEST_DEFAULT_LIMIT = 8
+SUGGEST_MAX_LIMIT = 20
+
+# Kinds each role may see suggestions for
+ROLE_SUGGEST_KINDS = {
+    'admin': ('doctor', 'department', 'patient'),
+    'doctor': ('doctor', 'department'),
+    'patient': ('doctor', 'department'),
+}
+
+@suggest_bp.route('', methods=['GET'])
+@role_required('admin', 'doctor', 'patient')
+def suggest(current_user):
+    """
+    Prefix suggestions for doctors, departments and patients
+    Query params: q (prefix), types (comma-separated: doctor,department,patient), limit
+    """
+    try:
+        query = request.args.get('q', '').strip()
+        limit = min(request.args.get('limit', type=int, default=SUGGEST_DEFAULT_LIMIT), SUGGEST_MAX_LIMIT)
+        
+        allowed_kinds = ROLE_SUGGEST_KINDS.get(current_user.role, ())
+        requested = request.args.get('types')
+        if requested:
+            kinds = [kind for kind in requested.split(',') if kind in SUGGEST_KINDS and kind in allowed_kinds]
+        else:
+            kinds = list(allowed_kinds)
+        
+        if not query or limit <= 0:
+            return jsonify({'query': query, 'suggestions': []}), 200
+        
+        suggestions = suggest_index.suggest(
+            query,
+            kinds=kinds,
+            limit=limit,
+            include_inactive=current_user.role == 'admin'
+        )
+        
+        return jsonify({'query': query, 'suggestions': suggestions}), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'Failed to get suggestions: {str(e)}'}), 500
@@ -0,0 +1,75 @@
+"""
+Analytics rollup maintenance and the nightly columnar extract (see utils/analytics.py, utils/columnar.py)
+"""
+from celery_app import celery_app
+from datetime import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+def _app():
+    """Shared Flask app for the per-event rollup refresh"""
+    from app import app
+    return app
+
+@celery_app.task(name='tasks.analytics_tasks.refresh_rollup_for_event', bind=True, ignore_result=True)
+def refresh_rollup_for_event(self, event):
+    """
+    Outbox consumer: recount the doctor's rollup rows for the days the
+    appointment event touched (its date, and the previous date when rescheduled)
+    """
+    from database import db
+    from utils.analytics import refresh_rollup
+
+    payload = event['payload']
+    days = {
+        datetime.strptime(value, '%Y-%m-%d').date()
+        for value in (payload.get('appointment_date'), payload.get('previous_date'))
+        if value
+    }
+
+    with _app().app_context():
+        try:
+            for day in sorted(days):
+                refresh_rollup(day, doctor_id=payload['doctor_id'])
+            return {'status': 'success', 'event_id': event['id']}
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error refreshing analytics rollup for event {event['id']}: {str(e)}")
+            raise
+
+@celery_app.task(name='tasks.analytics_tasks.refresh_recent_rollup', bind=True)
+def refresh_recent_rollup(self, days=None):
+    """
+    Nightly task to recount the rollup around today and drop deleted doctors
+    Runs at 3:30 AM daily
+    """
+    from utils.analytics import refresh_recent_rollup as refresh, ROLLUP_REFRESH_DAYS
+
+    with _app().app_context():
+        try:
+            result = refresh(days or ROLLUP_REFRESH_DAYS)
+            logger.info(f"Refreshed analytics rollup for +/-{result['days']} days, purged {result['purged']} rows")
+            return {'status': 'success', **result}
+        except Exception as e:
+            logger.error(f"Error refreshing analytics rollup: {str(e)}")
+            raise
+
+@celery_app.task(name='tasks.analytics_tasks.write_columnar_extract', bind=True)
+def write_columnar_extract(self):
+    """
+    Nightly task to export appointments, treatments, doctors and departments
+    into the columnar extract used by reports and long-range analytics
+    Runs at 4:00 AM daily, after archival
+    """
+    from utils.columnar import write_extract
+
+    with _app().app_context():
+        try:
+            result = write_extract()
+            if result is None:
+                return {'status': 'skipped', 'message': 'numpy not installed'}
+            return {'status': 'success', **result}
+        except Exception as e:
+            logger.error(f"Error writing columnar extract: {str(e)}")
+            raise
@@ -0,0 +1,28 @@
+"""
+Nightly task that moves old completed/cancelled appointments to the archive tables
+"""
+from celery_app import celery_app
+import logging
+
+logger = logging.getLogger(__name__)
+
+@celery_app.task(name='tasks.archive_tasks.archive_old_appointments', bind=True)
+def archive_old_appointments(self, days=None):
+    """
+    Nightly task to archive completed/cancelled appointments (and their
+    treatments) older than ARCHIVE_AFTER_DAYS, or `days` if given
+    Runs at 2:00 AM daily
+    """
+    from app import create_app
+    from utils.archive import archive_old_appointments as archive, archive_cutoff
+    app = create_app()
+    
+    with app.app_context():
+        try:
+            result = archive(before=archive_cutoff(days))
+            logger.info(f"Archived {result['appointments']} appointments, {result['treatments']} treatments")
+            return {'status': 'success', **result}
+            
+        except Exception as e:
+            logger.error(f"Error archiving appointments: {str(e)}")
+            raise
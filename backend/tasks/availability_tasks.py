@@ -0,0 +1,38 @@
+"""
+Nightly task that expands recurring availability templates into slots
+"""
+from celery_app import celery_app
+from datetime import date, timedelta
+import logging
+
+logger = logging.getLogger(__name__)
+
+@celery_app.task(name='tasks.availability_tasks.materialize_doctor_availability', bind=True)
+def materialize_doctor_availability(self):
+    """
+    Nightly task to roll every doctor's recurring availability window forward
+    Runs at 12:30 AM daily. Read paths also expand lazily, so a missed run
+    only means the first reader of the day does the work.
+    """
+    from app import create_app
+    from utils.availability import ensure_materialized, MATERIALIZE_DAYS
+    app = create_app()
+    
+    with app.app_context():
+        try:
+            through = date.today() + timedelta(days=MATERIALIZE_DAYS)
+            expanded = ensure_materialized(through=through)
+            slot_dates = sum(len(dates) for dates in expanded.values())
+            
+            logger.info(f"Materialized availability for {len(expanded)} doctors ({slot_dates} doctor-days) through {through}")
+            
+            return {
+                'status': 'success',
+                'doctors_updated': len(expanded),
+                'doctor_days_added': slot_dates,
+                'materialized_through': through.isoformat()
+            }
+            
+        except Exception as e:
+            logger.error(f"Error materializing doctor availability: {str(e)}")
+            raise
@@ -0,0 +1,169 @@
+"""
+Outbox dispatcher and consumers for appointment events (see utils/outbox.py)
+"""
+from celery_app import celery_app
+from datetime import datetime
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+def _app():
+    """Shared Flask app for the high-volume event tasks"""
+    from app import app
+    return app
+
+@celery_app.task(name='tasks.event_tasks.dispatch_outbox', bind=True, ignore_result=True)
+def dispatch_outbox(self):
+    """
+    Deliver pending outbox events to their consumer tasks
+    Runs every few seconds, and right after each appointment change
+    """
+    from database import db
+    from utils.outbox import dispatch_pending_events
+
+    with _app().app_context():
+        try:
+            return {'status': 'success', **dispatch_pending_events()}
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error dispatching outbox events: {str(e)}")
+            raise
+
+@celery_app.task(name='tasks.event_tasks.purge_outbox', bind=True, ignore_result=True)
+def purge_outbox(self, older_than_days=None):
+    """
+    Nightly task to delete dispatched outbox events past retention
+    Runs at 3:00 AM daily
+    """
+    from utils.outbox import purge_dispatched_events, OUTBOX_RETENTION_DAYS
+
+    with _app().app_context():
+        try:
+            deleted = purge_dispatched_events(older_than_days or OUTBOX_RETENTION_DAYS)
+            logger.info(f"Purged {deleted} dispatched outbox events")
+            return {'status': 'success', 'deleted': deleted}
+        except Exception as e:
+            logger.error(f"Error purging outbox events: {str(e)}")
+            raise
+
+# ==================== CONSUMERS ====================
+
+@celery_app.task(name='tasks.event_tasks.invalidate_appointment_caches', bind=True, ignore_result=True)
+def invalidate_appointment_caches(self, event):
+    """
+    Drop the doctor's cached availability and the doctor searches for the
+    appointment date (and the previous date when rescheduled)
+    """
+    from utils.cache import invalidate_doctor_availability_dates
+
+    payload = event['payload']
+    dates = {
+        datetime.strptime(value, '%Y-%m-%d').date()
+        for value in (payload.get('appointment_date'), payload.get('previous_date'))
+        if value
+    }
+    invalidate_doctor_availability_dates(payload['doctor_id'], sorted(dates))
+    return {'status': 'success', 'event_id': event['id']}
+
+@celery_app.task(name='tasks.event_tasks.send_appointment_notification', bind=True, ignore_result=True)
+def send_appointment_notification(self, event):
+    """
+    Email the patient about a booked, rescheduled or cancelled appointment
+    """
+    from models import Appointment
+    from utils.notifications import send_email_notification
+
+    subjects = {
+        'appointment.booked': 'Appointment Confirmed',
+        'appointment.rescheduled': 'Appointment Rescheduled',
+        'appointment.cancelled': 'Appointment Cancelled',
+    }
+
+    with _app().app_context():
+        try:
+            appointment = Appointment.query.get(event['aggregate_id'])
+            if not appointment or not appointment.patient or not appointment.patient.user:
+                logger.warning(f"Appointment {event['aggregate_id']} not found for event {event['id']}")
+                return {'status': 'skipped', 'event_id': event['id']}
+
+            patient = appointment.patient
+            doctor = appointment.doctor
+            subject = subjects.get(event['event_type'], 'Appointment Update')
+            message = f"""
+Dear {patient.first_name} {patient.last_name},
+
+{subject}:
+
+Date: {appointment.appointment_date.strftime('%B %d, %Y')}
+Time: {appointment.appointment_time.strftime('%I:%M %p')}
+Doctor: Dr. {doctor.first_name} {doctor.last_name}
+Status: {appointment.status}
+
+Thank you,
+Hospital Management System
+"""
+            sent = send_email_notification(
+                to_email=patient.user.email,
+                subject=f"{subject} - {appointment.appointment_date.strftime('%B %d, %Y')}",
+                message=message
+            )
+            return {'status': 'success' if sent else 'skipped', 'event_id': event['id']}
+
+        except Exception as e:
+            logger.error(f"Error sending notification for event {event['id']}: {str(e)}")
+            raise
+
+@celery_app.task(name='tasks.event_tasks.publish_live_update', bind=True, ignore_result=True)
+def publish_live_update(self, event):
+    """
+    Fan the event out to live dashboard streams over Redis pub/sub
+    """
+    from utils.live_updates import LIVE_UPDATES_BROKER, publish_event
+
+    if LIVE_UPDATES_BROKER != 'redis':
+        return {'status': 'skipped', 'event_id': event['id']}  # Published in-process by the web server
+
+    with _app().app_context():
+        try:
+            publish_event(event)
+            return {'status': 'success', 'event_id': event['id']}
+        except Exception as e:
+            logger.error(f"Error publishing live update for event {event['id']}: {str(e)}")
+            raise
+
+@celery_app.task(name='tasks.event_tasks.record_audit_entry', bind=True, ignore_result=True)
+def record_audit_entry(self, event):
+    """
+    Append the event to the audit log (once per event id)
+    """
+    from database import db
+    from models import AuditLog
+    from sqlalchemy.exc import IntegrityError
+
+    with _app().app_context():
+        try:
+            if AuditLog.query.filter_by(event_id=event['id']).first():
+                return {'status': 'duplicate', 'event_id': event['id']}
+
+            payload = event['payload']
+            db.session.add(AuditLog(
+                event_id=event['id'],
+                event_type=event['event_type'],
+                appointment_id=event['aggregate_id'],
+                actor_user_id=payload.get('actor_user_id'),
+                actor_role=payload.get('actor_role'),
+                payload=json.dumps(payload),
+                occurred_at=datetime.fromisoformat(payload.get('occurred_at') or event['created_at'])
+            ))
+            db.session.commit()
+            return {'status': 'success', 'event_id': event['id']}
+
+        except IntegrityError:
+            # Same event delivered twice concurrently; the other copy won
+            db.session.rollback()
+            return {'status': 'duplicate', 'event_id': event['id']}
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error recording audit entry for event {event['id']}: {str(e)}")
+            raise
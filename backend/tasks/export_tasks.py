@@ -4,12 +4,15 @@ PDF and CSV export tasks for patient treatment history
 from celery_app import celery_app
 
 from database import db
-from models import Patient, Appointment, Treatment, Doctor
+from models import Patient, Appointment, Treatment, Doctor, Export
 from datetime import datetime
 import os
 import csv
+import hashlib
 import logging
+import uuid
 from utils.notifications import send_email_notification
+from utils.archive import fetch_appointment_history
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
@@ -17,33 +20,85 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 
 logger = logging.getLogger(__name__)
 
+def _file_checksum(filepath, chunk_size=65536):
+    """Compute SHA-256 checksum of a file in chunks"""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _export_filename(patient_id, extension):
+    """
+    Unique export filename: the timestamp is only to the second, so a random
+    suffix keeps two exports started in the same second apart
+    """
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    return f"patient_{patient_id}_treatment_history_{timestamp}_{uuid.uuid4().hex[:8]}.{extension}"
+
+def create_export_record(patient_id, export_format, filename, filepath):
+    """
+    Register a new export in the catalog with status 'processing'
+    """
+    export = Export(
+        patient_id=patient_id,
+        format=export_format,
+        filename=filename,
+        filepath=filepath,
+        status='processing'
+    )
+    db.session.add(export)
+    db.session.commit()
+    return export
+
+def complete_export_record(export, total_records):
+    """
+    Mark a catalog entry as completed and record file size and checksum
+    """
+    export.size = os.path.getsize(export.filepath)
+    export.checksum = _file_checksum(export.filepath)
+    export.total_records = total_records
+    export.status = 'completed'
+    db.session.commit()
+
+def fail_export_record(export):
+    """
+    Mark a catalog entry as failed (best effort)
+    """
+    try:
+        db.session.rollback()
+        export.status = 'failed'
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Failed to mark export {export.filename} as failed: {str(e)}")
+
 def generate_pdf_export(patient_id, user_email=None):
     """
     Synchronous function to export patient treatment history to PDF
     Can be called directly without Celery
     """
+    export = None
     try:
         patient = Patient.query.get(patient_id)
         
         if not patient:
             raise ValueError('Patient not found')
         
-        # Get all appointments with treatments
-        appointments = Appointment.query.filter_by(
-            patient_id=patient_id
-        ).order_by(
-            Appointment.appointment_date.desc()
-        ).all()
+        # Get all appointments with treatments (current and archived)
+        appointments, _ = fetch_appointment_history(patient_id=patient_id)
         
         # Create exports directory
         exports_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'exports')
         os.makedirs(exports_dir, exist_ok=True)
         
         # Generate filename
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"patient_{patient_id}_treatment_history_{timestamp}.pdf"
+        filename = _export_filename(patient_id, 'pdf')
         filepath = os.path.join(exports_dir, filename)
         
+        # Register in export catalog
+        export = create_export_record(patient_id, 'pdf', filename, filepath)
+        
         # Create PDF
         doc = SimpleDocTemplate(filepath, pagesize=letter)
         elements = []
@@ -105,6 +160,7 @@ def generate_pdf_export(patient_id, user_email=None):
         
         elements.append(table)
         doc.build(elements)
+        complete_export_record(export, len(appointments))
         
         # Send notification email if email provided
         if user_email:
@@ -116,6 +172,7 @@ def generate_pdf_export(patient_id, user_email=None):
         result = {
             'status': 'success',
             'patient_id': patient_id,
+            'export_id': export.id,
             'filename': filename,
             'filepath': filepath,
             'total_records': len(appointments),
@@ -126,6 +183,8 @@ def generate_pdf_export(patient_id, user_email=None):
         return result
         
     except Exception as e:
+        if export is not None:
+            fail_export_record(export)
         logger.error(f"Error exporting PDF for patient {patient_id}: {str(e)}")
         raise
 
@@ -134,28 +193,27 @@ def generate_csv_export(patient_id, user_email=None):
     Synchronous function to export patient treatment history to CSV
     Can be called directly without Celery
     """
+    export = None
     try:
         patient = Patient.query.get(patient_id)
         
         if not patient:
             raise ValueError('Patient not found')
         
-        # Get all appointments with treatments
-        appointments = Appointment.query.filter_by(
-            patient_id=patient_id
-        ).order_by(
-            Appointment.appointment_date.desc()
-        ).all()
+        # Get all appointments with treatments (current and archived)
+        appointments, _ = fetch_appointment_history(patient_id=patient_id)
         
         # Create exports directory
         exports_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'exports')
         os.makedirs(exports_dir, exist_ok=True)
         
         # Generate filename
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"patient_{patient_id}_treatment_history_{timestamp}.csv"
+        filename = _export_filename(patient_id, 'csv')
         filepath = os.path.join(exports_dir, filename)
         
+        # Register in export catalog
+        export = create_export_record(patient_id, 'csv', filename, filepath)
+        
         # Create CSV file
         with open(filepath, 'w', newline='', encoding='utf-8') as csvfile:
             writer = csv.writer(csvfile)
@@ -217,6 +275,8 @@ def generate_csv_export(patient_id, user_email=None):
                     follow_up_notes
                 ])
         
+        complete_export_record(export, len(appointments))
+        
         # Send notification email if email provided
         if user_email:
             try:
@@ -227,6 +287,7 @@ def generate_csv_export(patient_id, user_email=None):
         result = {
             'status': 'success',
             'patient_id': patient_id,
+            'export_id': export.id,
             'filename': filename,
             'filepath': filepath,
             'total_records': len(appointments),
@@ -237,6 +298,8 @@ def generate_csv_export(patient_id, user_email=None):
         return result
         
     except Exception as e:
+        if export is not None:
+            fail_export_record(export)
         logger.error(f"Error exporting CSV for patient {patient_id}: {str(e)}")
         raise
 
@@ -8,9 +8,17 @@ from models import Doctor, Appointment, Treatment, Department
 from datetime import date, datetime, timedelta
 from utils.reports import generate_doctor_report_html, generate_doctor_report_pdf
 from utils.notifications import send_email_notification
+from utils.columnar import load_extract, DIAGNOSIS_KEY_LENGTH
+from utils.archive import TIERS
+from sqlalchemy import distinct, func, select, union_all
+from sqlalchemy.orm import joinedload
 import logging
 from calendar import monthrange
 
+logger = logging.getLogger(__name__)
+
+REPORT_APPOINTMENT_ROWS = 50
+
 # Create app instance for Celery
 @celery_app.task(name='tasks.report_tasks.generate_monthly_doctor_reports', bind=True)
 def generate_monthly_doctor_reports(self):
@@ -156,36 +164,31 @@ def generate_doctor_monthly_report_data(doctor_id, month, year):
         last_day = monthrange(year, month)[1]
         end_date = date(year, month, last_day)
         
-        # Get appointments for the month
-        appointments = Appointment.query.filter(
-            Appointment.doctor_id == doctor_id,
-            Appointment.appointment_date >= start_date,
-            Appointment.appointment_date <= end_date
-        ).order_by(Appointment.appointment_date, Appointment.appointment_time).all()
-        
-        # Get treatments
-        treatments = Treatment.query.join(Appointment).filter(
-            Appointment.doctor_id == doctor_id,
-            Appointment.appointment_date >= start_date,
-            Appointment.appointment_date <= end_date
-        ).all()
+        # Appointments listed in the report (it shows the first REPORT_APPOINTMENT_ROWS),
+        # from both tiers since older months are mostly archived
+        appointments = []
+        for appointment_model, _ in TIERS:
+            appointments += appointment_model.query.options(
+                joinedload(appointment_model.patient), joinedload(appointment_model.treatment)
+            ).filter(
+                appointment_model.doctor_id == doctor_id,
+                appointment_model.appointment_date >= start_date,
+                appointment_model.appointment_date <= end_date
+            ).order_by(
+                appointment_model.appointment_date, appointment_model.appointment_time, appointment_model.id
+            ).limit(REPORT_APPOINTMENT_ROWS).all()
+        appointments = sorted(
+            appointments, key=lambda a: (a.appointment_date, a.appointment_time, a.id)
+        )[:REPORT_APPOINTMENT_ROWS]
+        treatments = [a.treatment for a in appointments if a.treatment]
         
-        # Calculate statistics
-        total_appointments = len(appointments)
-        completed = len([a for a in appointments if a.status == 'Completed'])
-        cancelled = len([a for a in appointments if a.status == 'Cancelled'])
-        booked = len([a for a in appointments if a.status == 'Booked'])
-        
-        # Get unique patients
-        patient_ids = list(set([a.patient_id for a in appointments]))
-        unique_patients = len(patient_ids)
-        
-        # Get diagnosis summary
-        diagnosis_summary = {}
-        for treatment in treatments:
-            if treatment.diagnosis:
-                diagnosis = treatment.diagnosis[:50]  # First 50 chars
-                diagnosis_summary[diagnosis] = diagnosis_summary.get(diagnosis, 0) + 1
+        # Statistics for the whole month: from the nightly columnar extract once it
+        # covers the month, otherwise from grouped queries
+        extract = load_extract()
+        if extract is not None and extract.as_of > end_date:
+            summary = extract.doctor_summary(doctor_id, start_date, end_date)
+        else:
+            summary = doctor_month_summary(doctor_id, start_date, end_date)
         
         return {
             'doctor': doctor.to_dict(),
@@ -195,23 +198,58 @@ def generate_doctor_monthly_report_data(doctor_id, month, year):
                 'start_date': start_date.isoformat(),
                 'end_date': end_date.isoformat()
             },
-            'statistics': {
-                'total_appointments': total_appointments,
-                'completed': completed,
-                'cancelled': cancelled,
-                'booked': booked,
-                'unique_patients': unique_patients,
-                'treatments_provided': len(treatments)
-            },
+            'statistics': summary['statistics'],
             'appointments': [a.to_dict() for a in appointments],
             'treatments': [t.to_dict() for t in treatments],
-            'diagnosis_summary': diagnosis_summary
+            'diagnosis_summary': summary['diagnosis_summary']
         }
         
     except Exception as e:
         logger.error(f"Error generating report data: {str(e)}")
         return None
 
+def doctor_month_summary(doctor_id, start_date, end_date):
+    """
+    Report statistics and diagnosis summary for a doctor's month across both
+    tiers, as the columnar extract has them, with grouped queries (used until
+    the extract covers the month)
+    """
+    visits = union_all(*(
+        select(
+            appointment_model.status,
+            appointment_model.patient_id,
+            treatment_model.id.label('treatment_id'),
+            func.substr(treatment_model.diagnosis, 1, DIAGNOSIS_KEY_LENGTH).label('diagnosis')
+        ).select_from(appointment_model).outerjoin(
+            treatment_model, treatment_model.appointment_id == appointment_model.id
+        ).where(
+            appointment_model.doctor_id == doctor_id,
+            appointment_model.appointment_date >= start_date,
+            appointment_model.appointment_date <= end_date
+        )
+        for appointment_model, treatment_model in TIERS
+    )).subquery('visits')
+    by_status = dict(db.session.execute(
+        select(visits.c.status, func.count()).group_by(visits.c.status)
+    ).all())
+    unique_patients = db.session.execute(select(func.count(distinct(visits.c.patient_id)))).scalar()
+    
+    diagnosis_summary = dict(db.session.execute(
+        select(visits.c.diagnosis, func.count()).where(visits.c.treatment_id != None).group_by(visits.c.diagnosis)
+    ).all())
+    
+    return {
+        'statistics': {
+            'total_appointments': sum(by_status.values()),
+            'completed': by_status.get('Completed', 0),
+            'cancelled': by_status.get('Cancelled', 0),
+            'booked': by_status.get('Booked', 0),
+            'unique_patients': unique_patients or 0,
+            'treatments_provided': sum(diagnosis_summary.values())
+        },
+        'diagnosis_summary': {key: count for key, count in diagnosis_summary.items() if key},
+    }
+
 def send_doctor_report_email(doctor, report_data, html_report, pdf_path, month, year):
     """
     Send monthly report email to doctor
@@ -0,0 +1,102 @@
+"""
+Regression tests for appointment archival
+Run with: python -m pytest test_archive.py (uses a throwaway SQLite database)
+"""
+import os
+import tempfile
+from datetime import date, time, timedelta
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test_archive.db')
+
+from sqlalchemy import text
+
+from app import app
+from database import db
+from models import Appointment, ArchivedAppointment, ArchivedTreatment, Department, Doctor, Patient, Treatment, User
+from utils.archive import archive_old_appointments
+from utils.migrations import MigrationContext, discover_migrations
+
+
+def _reset_database():
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+    department = Department(name='Cardiology')
+    db.session.add(department)
+    db.session.flush()
+    doctor_user = User(username='doctor', email='doctor@example.com', role='doctor', password_hash='x')
+    patient_user = User(username='patient', email='patient@example.com', role='patient', password_hash='x')
+    db.session.add_all([doctor_user, patient_user])
+    db.session.flush()
+    doctor = Doctor(user_id=doctor_user.id, first_name='Test', last_name='Doctor', specialization_id=department.id)
+    patient = Patient(user_id=patient_user.id, first_name='Test', last_name='Patient')
+    db.session.add_all([doctor, patient])
+    db.session.commit()
+    return doctor, patient
+
+
+def _completed_visit(doctor, patient, appointment_date):
+    appointment = Appointment(patient_id=patient.id, doctor_id=doctor.id, appointment_date=appointment_date,
+                              appointment_time=time(10, 0), status='Completed')
+    db.session.add(appointment)
+    db.session.flush()
+    db.session.add(Treatment(appointment_id=appointment.id, diagnosis='Checkup'))
+    db.session.commit()
+    return appointment.id
+
+
+def test_archive_new_booking_archive_again():
+    """A booking made after the newest appointment was archived gets a new id and archives cleanly"""
+    with app.app_context():
+        doctor, patient = _reset_database()
+        old_day = date.today() - timedelta(days=800)
+
+        first_id = _completed_visit(doctor, patient, old_day)
+        assert archive_old_appointments()['appointments'] == 1
+
+        second_id = _completed_visit(doctor, patient, old_day + timedelta(days=1))
+        assert second_id != first_id
+
+        assert archive_old_appointments()['appointments'] == 1
+        assert ArchivedAppointment.query.count() == 2
+        assert ArchivedTreatment.query.count() == 2
+        assert Appointment.query.count() == 0
+
+
+def test_migration_renumbers_collisions_and_stops_reuse():
+    """0007 rebuilds plain INTEGER PRIMARY KEY hot tables so archived ids are not handed out again"""
+    with app.app_context():
+        doctor, patient = _reset_database()
+        with db.engine.begin() as conn:
+            # Hot tables as created before 0007, without AUTOINCREMENT
+            for table in ('treatments', 'appointments'):
+                conn.execute(text(f"ALTER TABLE {table} RENAME TO {table}_autoincrement"))
+            conn.execute(text(
+                "CREATE TABLE appointments (id INTEGER NOT NULL PRIMARY KEY, patient_id INTEGER NOT NULL, "
+                "doctor_id INTEGER NOT NULL, appointment_date DATE NOT NULL, appointment_time TIME NOT NULL, "
+                "visit_type VARCHAR(20), status VARCHAR(20), reason TEXT, created_at DATETIME, updated_at DATETIME)"
+            ))
+            conn.execute(text(
+                "CREATE TABLE treatments (id INTEGER NOT NULL PRIMARY KEY, appointment_id INTEGER NOT NULL UNIQUE, "
+                "diagnosis TEXT NOT NULL, tests_done TEXT, prescription TEXT, medicines TEXT, attachments TEXT, "
+                "notes TEXT, follow_up_date DATE, follow_up_notes TEXT, created_at DATETIME, updated_at DATETIME)"
+            ))
+            for table in ('treatments', 'appointments'):
+                conn.execute(text(f"DROP TABLE {table}_autoincrement"))
+
+        old_day = date.today() - timedelta(days=800)
+        archived_id = _completed_visit(doctor, patient, old_day)
+        archive_old_appointments()
+        colliding_id = _completed_visit(doctor, patient, old_day + timedelta(days=1))
+        assert colliding_id == archived_id  # The reuse the migration repairs
+
+        migration = next(m for m in discover_migrations() if m.version == '0007')
+        migration.module.upgrade(MigrationContext(migration, batch_sleep=0))
+        db.session.expire_all()
+
+        assert Appointment.query.one().id > archived_id
+        assert Treatment.query.one().appointment_id == Appointment.query.one().id
+        assert archive_old_appointments()['appointments'] == 1
+
+        new_id = _completed_visit(doctor, patient, date.today())
+        assert new_id > max(appointment.id for appointment in ArchivedAppointment.query)
@@ -0,0 +1,164 @@
+"""
+API admission control: per-user token buckets and a concurrency cap
+
+Registered in create_app() as a before_request hook, so every request is
+admitted or turned away with 429 + Retry-After before its route runs.
+Routes are grouped into classes:
+- booking: booking, rescheduling and cancelling. Own per-user bucket, no
+  route-wide limit and no concurrency cap, so bulk readers cannot starve it.
+- expensive: analytics, export triggers and unpaged history listings
+  (history endpoints called with ?limit= are paged and count as default).
+  Small per-user buckets, a bucket per route shared by all users, and at most
+  EXPENSIVE_CONCURRENCY of them running at once in each web worker process.
+- default: everything else.
+
+Each user gets one bucket per route class, sized by their role (USER_LIMITS).
+User and role come from the JWT claims without a database lookup; requests
+without a valid token are bucketed per IP as 'anonymous' (the route rejects
+them anyway where a token is required). Login is exempt: it has its own
+limiter (utils/rate_limit.py).
+
+Buckets live in the rate limit store (Redis, or in process), so they hold
+across web workers. Rejections are counted in GET /api/admin/metrics.
+"""
+import logging
+import os
+import threading
+
+from flask import g, jsonify, request
+from flask_jwt_extended import get_jwt, get_jwt_identity, verify_jwt_in_request
+
+from utils.rate_limit import get_rate_limit_store
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_CONTROL = os.environ.get('ADMISSION_CONTROL', '1') != '0'
+EXPENSIVE_CONCURRENCY = int(os.environ.get('EXPENSIVE_CONCURRENCY', '4'))  # Per web worker process
+ADMISSION_BUSY_RETRY_AFTER = 2  # Seconds suggested when the concurrency cap is full
+
+BOOKING = 'booking'
+EXPENSIVE = 'expensive'
+DEFAULT = 'default'
+
+ROUTE_CLASSES = {
+    'patient.book_appointment': BOOKING,
+    'patient.reschedule_appointment': BOOKING,
+    'patient.cancel_appointment': BOOKING,
+    'admin.get_analytics': EXPENSIVE,
+    'export.trigger_treatment_export': EXPENSIVE,
+    'history.admin_appointment_history': EXPENSIVE,
+    'history.view_patient_appointment_history': EXPENSIVE,
+    'history.patient_own_history': EXPENSIVE,
+    'history.admin_treatment_history': EXPENSIVE,
+    'history.view_patient_treatment_history': EXPENSIVE,
+    'history.patient_own_treatments': EXPENSIVE,
+    'history.appointment_statistics': EXPENSIVE,
+}
+EXPENSIVE_UNLESS_PAGED = {endpoint for endpoint in ROUTE_CLASSES if endpoint.startswith('history.')} - {
+    'history.appointment_statistics'
+}
+EXEMPT_ENDPOINTS = {'auth.login', 'static'}
+
+# (role, route class) -> (requests per minute, burst)
+USER_LIMITS = {
+    ('admin', DEFAULT): (600, 120),
+    ('doctor', DEFAULT): (300, 60),
+    ('patient', DEFAULT): (120, 30),
+    ('anonymous', DEFAULT): (60, 20),
+    ('admin', EXPENSIVE): (30, 10),
+    ('doctor', EXPENSIVE): (20, 5),
+    ('patient', EXPENSIVE): (10, 3),
+    ('anonymous', EXPENSIVE): (5, 2),
+    ('admin', BOOKING): (120, 30),
+    ('doctor', BOOKING): (120, 30),
+    ('patient', BOOKING): (60, 20),
+    ('anonymous', BOOKING): (10, 5),
+}
+# Route class -> (requests per minute, burst) for each route, across all users
+ROUTE_LIMITS = {
+    EXPENSIVE: (120, 30),
+}
+
+_expensive_slots = threading.BoundedSemaphore(EXPENSIVE_CONCURRENCY)
+
+
+def route_class(endpoint):
+    route = ROUTE_CLASSES.get(endpoint, DEFAULT)
+    if endpoint in EXPENSIVE_UNLESS_PAGED and request.args.get('limit'):
+        return DEFAULT
+    return route
+
+
+def _caller():
+    """(bucket identity, role) from the JWT claims, or the client IP when there is no valid token"""
+    try:
+        verify_jwt_in_request(optional=True)
+        user_id = get_jwt_identity()
+        if user_id:
+            return f"user:{user_id}", get_jwt().get('role', 'anonymous')
+    except Exception:
+        pass  # Invalid or expired token: the route answers 401 itself
+    return f"ip:{request.remote_addr}", 'anonymous'
+
+
+def _reject(reason, retry_after):
+    get_rate_limit_store().incr_counter(f"admission_rejected_{reason}")
+    response = jsonify({
+        'error': f'Too many requests. Please try again in {retry_after} seconds.',
+        'retry_after': retry_after
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def _admit():
+    if request.method == 'OPTIONS' or request.endpoint is None or request.endpoint in EXEMPT_ENDPOINTS:
+        return None
+
+    store = get_rate_limit_store()
+    route = route_class(request.endpoint)
+    identity, role = _caller()
+
+    per_minute, burst = USER_LIMITS.get((role, route), USER_LIMITS[('anonymous', route)])
+    allowed, retry_after = store.take_token(f"ratelimit:bucket:{identity}:{route}", per_minute / 60, burst)
+    if not allowed:
+        return _reject('user', retry_after)
+
+    if route in ROUTE_LIMITS:
+        per_minute, burst = ROUTE_LIMITS[route]
+        allowed, retry_after = store.take_token(f"ratelimit:bucket:route:{request.endpoint}", per_minute / 60, burst)
+        if not allowed:
+            return _reject('route', retry_after)
+
+    if route == EXPENSIVE:
+        if not _expensive_slots.acquire(blocking=False):
+            return _reject('concurrency', ADMISSION_BUSY_RETRY_AFTER)
+        g.admission_slot = _expensive_slots
+    return None
+
+
+def _release(exc=None):
+    slot = g.pop('admission_slot', None)
+    if slot is not None:
+        slot.release()
+
+
+def init_admission_control(app):
+    """Register the admission hooks on the app (no-op when ADMISSION_CONTROL=0)"""
+    if not ADMISSION_CONTROL:
+        logger.info("API admission control disabled")
+        return
+    app.before_request(_admit)
+    app.teardown_request(_release)
+
+
+def admission_metrics():
+    counters = get_rate_limit_store().counters()
+    return {
+        'expensive_concurrency': EXPENSIVE_CONCURRENCY,
+        'rejected': {
+            name[len('admission_rejected_'):]: count
+            for name, count in counters.items() if name.startswith('admission_rejected_')
+        },
+    }
@@ -0,0 +1,337 @@
+"""
+Admin analytics charts from a daily appointment rollup
+
+Charts never scan the appointment tables. appointment_daily_rollup holds one
+row per (day, doctor, status) with the number of appointments across both
+tiers, so a 12-month chart reads at most 365 x doctors x 3 small rows however
+many appointments there are. Each chart series is one statement over the
+rollup: buckets are computed in SQL (day, ISO week starting Monday, month)
+and doctor, department and user names are joined in the same statement.
+
+The rollup is kept current per (day, doctor): the refresh_rollup_for_event
+outbox consumer recounts the days an appointment event touched, and a nightly
+task recounts recent days and drops rows of deleted doctors. Deleting a
+doctor or patient cascades appointments without events, so the admin
+handlers drop or recount the affected rows themselves. Recounting replaces
+rows rather than adding deltas, so redelivered events are harmless.
+
+Results are cached per (start, end, granularity) and tagged with the months
+they cover; refreshing rollup days drops every cached result covering them.
+
+Long ranges take the days before the nightly columnar extract from the
+extract instead (utils/columnar.py), so only recent days touch the database.
+"""
+import logging
+import os
+from datetime import date, timedelta
+
+from sqlalchemy import Date, and_, cast, delete, func, insert, select, tuple_, union, union_all
+from sqlalchemy.exc import IntegrityError
+
+from database import db
+from models import AppointmentDailyRollup, Department, Doctor, User
+from utils.archive import TIERS
+from utils.cache import cache_get_json, cache_set_json_tagged, cache_invalidate_tags
+from utils.columnar import load_extract
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_CACHE_TTL = int(os.environ.get('ANALYTICS_CACHE_TTL', '900'))  # Bounds staleness from doctor/department edits
+ROLLUP_REFRESH_DAYS = int(os.environ.get('ROLLUP_REFRESH_DAYS', '35'))
+ROLLUP_CHUNK_DAYS = 31
+ROLLUP_WRITE_RETRIES = 3
+ROLLUP_KEY_CHUNK = 400  # (day, doctor) pairs per statement, well under SQLite's bound parameter limit
+GRANULARITIES = ('day', 'week', 'month')
+TOP_DOCTORS_LIMIT = 10
+EXTRACT_MIN_DAYS = int(os.environ.get('ANALYTICS_EXTRACT_MIN_DAYS', '90'))
+
+
+def _month_tag(day):
+    return f"analytics:tag:{day.strftime('%Y-%m')}"
+
+
+def _months(start, end):
+    """First day of each month from start to end"""
+    month = start.replace(day=1)
+    while month <= end:
+        yield month
+        month = (month + timedelta(days=32)).replace(day=1)
+
+
+def _iso(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+
+# ==================== ROLLUP ====================
+
+def _visit_counts(conditions):
+    """INSERT of recounted rollup rows for the appointments in both tiers matching conditions(model)"""
+    visits = union_all(*(
+        select(
+            appointment_model.appointment_date.label('day'),
+            appointment_model.doctor_id,
+            appointment_model.status
+        ).where(*conditions(appointment_model))
+        for appointment_model, _ in TIERS
+    )).subquery('visits')
+    counts = select(visits.c.day, visits.c.doctor_id, visits.c.status, func.count()).group_by(
+        visits.c.day, visits.c.doctor_id, visits.c.status
+    )
+    return insert(AppointmentDailyRollup.__table__).from_select(
+        ['day', 'doctor_id', 'status', 'appointment_count'], counts
+    )
+
+
+def _replace_rollup_rows(statements):
+    """Run the (delete stale rows, insert recounted rows) statements in one transaction"""
+    for attempt in range(ROLLUP_WRITE_RETRIES):
+        try:
+            for statement in statements:
+                db.session.execute(statement)
+            db.session.commit()
+            return
+        except IntegrityError:
+            # A concurrent recount of the same day inserted first; recount again after it
+            db.session.rollback()
+            if attempt == ROLLUP_WRITE_RETRIES - 1:
+                raise
+
+
+def refresh_rollup(day_from, day_to=None, doctor_id=None):
+    """
+    Recount rollup rows for days day_from..day_to (one doctor, or all) from
+    both tiers, replacing what was there, and drop cached charts covering them
+    """
+    day_to = day_to or day_from
+    rollup = AppointmentDailyRollup.__table__
+
+    stale = delete(rollup).where(rollup.c.day >= day_from, rollup.c.day <= day_to)
+    if doctor_id:
+        stale = stale.where(rollup.c.doctor_id == doctor_id)
+    counts = _visit_counts(lambda model: [
+        model.appointment_date >= day_from,
+        model.appointment_date <= day_to,
+        *([model.doctor_id == doctor_id] if doctor_id else [])
+    ])
+    _replace_rollup_rows([stale, counts])
+
+    cache_invalidate_tags([_month_tag(month) for month in _months(day_from, day_to)])
+
+
+def rebuild_rollup(start=None, end=None):
+    """Recount every day from start to end (default: the whole history) in month-sized chunks"""
+    if start is None or end is None:
+        bounds = [
+            db.session.query(func.min(model.appointment_date), func.max(model.appointment_date)).one()
+            for model, _ in TIERS
+        ]
+        days = [day for pair in bounds for day in pair if day is not None]
+        if not days:
+            return 0
+        start, end = start or min(days), end or max(days)
+
+    chunks = 0
+    chunk_start = start
+    while chunk_start <= end:
+        chunk_end = min(chunk_start + timedelta(days=ROLLUP_CHUNK_DAYS - 1), end)
+        refresh_rollup(chunk_start, chunk_end)
+        chunk_start = chunk_end + timedelta(days=1)
+        chunks += 1
+    logger.info(f"Rebuilt appointment rollup {start} to {end} in {chunks} chunks")
+    return chunks
+
+
+def appointment_rollup_keys(patient_id):
+    """Distinct (day, doctor_id) rollup keys of a patient's appointments in both tiers"""
+    keys = union(*(
+        select(appointment_model.appointment_date, appointment_model.doctor_id).where(
+            appointment_model.patient_id == patient_id
+        )
+        for appointment_model, _ in TIERS
+    ))
+    return [tuple(row) for row in db.session.execute(keys).all()]
+
+
+def refresh_rollup_keys(keys):
+    """
+    Recount the rollup for (day, doctor_id) keys after appointments were
+    deleted without events (a patient deletion), all in one transaction with
+    one DELETE and one INSERT ... SELECT per ROLLUP_KEY_CHUNK keys. Best
+    effort: a failure is logged, since the deletion itself has already committed.
+    """
+    keys = sorted(set(keys))
+    if not keys:
+        return
+    rollup = AppointmentDailyRollup.__table__
+    statements = []
+    for position in range(0, len(keys), ROLLUP_KEY_CHUNK):
+        chunk = keys[position:position + ROLLUP_KEY_CHUNK]
+        statements.append(delete(rollup).where(tuple_(rollup.c.day, rollup.c.doctor_id).in_(chunk)))
+        statements.append(_visit_counts(
+            lambda model, chunk=chunk: [tuple_(model.appointment_date, model.doctor_id).in_(chunk)]
+        ))
+    try:
+        _replace_rollup_rows(statements)
+    except Exception as exc:
+        db.session.rollback()
+        logger.warning(f"Failed to recount analytics rollup for {len(keys)} days: {exc}")
+        return
+    cache_invalidate_tags([_month_tag(month) for month in _months(keys[0][0], max(day for day, _ in keys))])
+
+
+def drop_doctor_rollup(doctor_id):
+    """Drop a deleted doctor's rollup rows right away instead of at the nightly purge (best effort, as above)"""
+    try:
+        return purge_deleted_doctors(doctor_id)
+    except Exception as exc:
+        db.session.rollback()
+        logger.warning(f"Failed to drop analytics rollup for doctor {doctor_id}: {exc}")
+        return 0
+
+
+def purge_deleted_doctors(doctor_id=None):
+    """Drop rollup rows of doctors that no longer exist (only `doctor_id`'s when given)"""
+    rollup = AppointmentDailyRollup.__table__
+    orphaned = rollup.c.doctor_id.notin_(select(Doctor.id))
+    if doctor_id is not None:
+        orphaned = and_(rollup.c.doctor_id == doctor_id, orphaned)
+    first_day, last_day = db.session.execute(select(func.min(rollup.c.day), func.max(rollup.c.day)).where(orphaned)).one()
+    if first_day is None:
+        return 0
+    deleted = db.session.execute(delete(rollup).where(orphaned)).rowcount
+    db.session.commit()
+    cache_invalidate_tags([_month_tag(month) for month in _months(first_day, last_day)])
+    return deleted
+
+
+# ==================== CHART SERIES ====================
+
+def _bucket(column, granularity):
+    """SQL expression for the start of the bucket containing `column`"""
+    if granularity == 'day':
+        return column
+    if db.engine.dialect.name == 'postgresql':
+        return cast(func.date_trunc(granularity, column), Date)
+    if granularity == 'week':
+        return func.date(column, 'weekday 0', '-6 days')  # Monday of the ISO week
+    return func.date(column, 'start of month')
+
+
+def build_analytics(start, end, granularity, top_doctors_limit=TOP_DOCTORS_LIMIT):
+    """Every chart series for start..end, one statement per series"""
+    rollup = AppointmentDailyRollup
+    in_range = and_(rollup.day >= start, rollup.day <= end)
+    total = func.sum(rollup.appointment_count)
+
+    bucket = _bucket(rollup.day, granularity).label('bucket')
+    trends = db.session.query(bucket, total).filter(in_range).group_by(bucket).order_by(bucket).all()
+
+    departments = db.session.query(Department.name, total).join(
+        Doctor, Doctor.specialization_id == Department.id
+    ).join(
+        rollup, rollup.doctor_id == Doctor.id
+    ).filter(in_range).group_by(Department.id, Department.name).order_by(total.desc()).all()
+
+    statuses = db.session.query(rollup.status, total).filter(in_range).group_by(rollup.status).all()
+
+    top_doctors = db.session.query(
+        Doctor.id, Doctor.first_name, Doctor.last_name, User.email, Department.name, total.label('appointment_count')
+    ).join(
+        rollup, rollup.doctor_id == Doctor.id
+    ).outerjoin(
+        User, User.id == Doctor.user_id
+    ).outerjoin(
+        Department, Department.id == Doctor.specialization_id
+    ).filter(
+        in_range, Doctor.is_active == True
+    ).group_by(
+        Doctor.id, Doctor.first_name, Doctor.last_name, User.email, Department.name
+    ).order_by(total.desc(), Doctor.id).limit(top_doctors_limit).all()
+
+    return {
+        'appointment_trends': {
+            'labels': [_iso(day) for day, _ in trends],
+            'data': [int(count) for _, count in trends]
+        },
+        'specialization_demand': {
+            'labels': [name for name, _ in departments],
+            'data': [int(count) for _, count in departments]
+        },
+        'status_distribution': {
+            'labels': [status for status, _ in statuses],
+            'data': [int(count) for _, count in statuses]
+        },
+        'top_doctors': [
+            {
+                'id': doctor_id,
+                'first_name': first_name,
+                'last_name': last_name,
+                'full_name': f"{first_name} {last_name}",
+                'email': email,
+                'specialization': department or 'N/A',
+                'appointment_count': int(count)
+            }
+            for doctor_id, first_name, last_name, email, department, count in top_doctors
+        ],
+    }
+
+
+def _merge_series(parts):
+    """Add up chart series computed for adjacent date ranges"""
+    trends, departments, statuses, doctors = {}, {}, {}, {}
+    for part in parts:
+        for series, totals in ((part['appointment_trends'], trends), (part['specialization_demand'], departments),
+                               (part['status_distribution'], statuses)):
+            for label, count in zip(series['labels'], series['data']):
+                totals[label] = totals.get(label, 0) + count
+        for doctor in part['top_doctors']:
+            merged = doctors.setdefault(doctor['id'], {**doctor, 'appointment_count': 0})
+            merged['appointment_count'] += doctor['appointment_count']
+
+    ranked_departments = sorted(departments.items(), key=lambda item: item[1], reverse=True)
+    return {
+        'appointment_trends': {'labels': sorted(trends), 'data': [trends[label] for label in sorted(trends)]},
+        'specialization_demand': {
+            'labels': [name for name, _ in ranked_departments],
+            'data': [count for _, count in ranked_departments]
+        },
+        'status_distribution': {'labels': sorted(statuses), 'data': [statuses[label] for label in sorted(statuses)]},
+        'top_doctors': sorted(
+            doctors.values(), key=lambda doctor: (-doctor['appointment_count'], doctor['id'])
+        )[:TOP_DOCTORS_LIMIT],
+    }
+
+
+def get_analytics_series(start, end, granularity):
+    """
+    Cached chart series for start..end; dropped when rollup days in the range are refreshed.
+    Ranges of EXTRACT_MIN_DAYS or more read the days before the nightly columnar
+    extract from it (utils/columnar.py) and only the days since from the rollup.
+    """
+    extract = load_extract() if (end - start).days >= EXTRACT_MIN_DAYS else None
+    if extract is not None and extract.as_of <= start:
+        extract = None
+
+    cache_key = f"analytics:{start.isoformat()}:{end.isoformat()}:{granularity}:{extract.name if extract else 'rollup'}"
+    cached = cache_get_json(cache_key)
+    if cached is not None:
+        return cached
+
+    if extract is None:
+        analytics = build_analytics(start, end, granularity)
+    else:
+        parts = [extract.analytics(start, min(end, extract.as_of - timedelta(days=1)), granularity)]
+        if end >= extract.as_of:
+            parts.append(build_analytics(extract.as_of, end, granularity, top_doctors_limit=None))
+        analytics = _merge_series(parts)
+    cache_set_json_tagged(
+        cache_key, analytics, [_month_tag(month) for month in _months(start, end)], ttl=ANALYTICS_CACHE_TTL
+    )
+    return analytics
+
+
+def refresh_recent_rollup(days=ROLLUP_REFRESH_DAYS, today=None):
+    """Nightly safety net: recount recent days (edits that emit no event) and drop deleted doctors"""
+    today = today or date.today()
+    rebuild_rollup(today - timedelta(days=days), today + timedelta(days=days))
+    return {'days': days, 'purged': purge_deleted_doctors()}
@@ -0,0 +1,107 @@
+"""
+Appointment list rows without ORM hydration
+
+The appointment list endpoints used to load Appointment objects, then lazy
+load each one's patient, doctor and treatment for to_dict(): one object per
+row plus up to three more queries per row. appointment_rows() selects the
+columns to_dict() needs in a single Core statement (names and the treatment
+joined in) and shapes each row tuple straight into the same dict. The
+dicts come out identical to Appointment.to_dict() (and Treatment.to_dict()
+under 'treatment'), so responses do not change; with the orjson provider
+(utils/json_provider.py) they are then serialized without another pass
+through Python.
+
+benchmarks/bench_json.py compares ORM + to_dict(), Core rows + the default
+provider and Core rows + orjson.
+"""
+from sqlalchemy import select
+
+from database import db
+from models import Appointment, Doctor, Patient, Treatment
+
+_APPOINTMENT_COLUMNS = (
+    Appointment.id, Appointment.patient_id, Appointment.doctor_id,
+    Patient.first_name, Patient.last_name, Doctor.first_name, Doctor.last_name,
+    Appointment.appointment_date, Appointment.appointment_time, Appointment.visit_type,
+    Appointment.status, Appointment.reason, Treatment.id,
+    Appointment.created_at, Appointment.updated_at,
+)
+_TREATMENT_COLUMNS = (
+    Treatment.diagnosis, Treatment.tests_done, Treatment.prescription, Treatment.medicines,
+    Treatment.attachments, Treatment.notes, Treatment.follow_up_date, Treatment.follow_up_notes,
+    Treatment.created_at, Treatment.updated_at,
+)
+
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+def _appointment(row):
+    """Appointment.to_dict() from a row of _APPOINTMENT_COLUMNS"""
+    (appointment_id, patient_id, doctor_id, patient_first, patient_last, doctor_first, doctor_last,
+     appointment_date, appointment_time, visit_type, status, reason, treatment_id, created_at, updated_at) = row[:15]
+    return {
+        'id': appointment_id,
+        'patient_id': patient_id,
+        'doctor_id': doctor_id,
+        'patient_name': f"{patient_first} {patient_last}" if patient_first is not None else None,
+        'doctor_name': f"{doctor_first} {doctor_last}" if doctor_first is not None else None,
+        'appointment_date': _iso(appointment_date),
+        'appointment_time': appointment_time.strftime('%H:%M') if appointment_time else None,
+        'visit_type': visit_type,
+        'status': status,
+        'reason': reason,
+        'has_treatment': treatment_id is not None,
+        'created_at': _iso(created_at),
+        'updated_at': _iso(updated_at)
+    }
+
+
+def _treatment(row, appointment):
+    """Treatment.to_dict() from the _TREATMENT_COLUMNS part of a row"""
+    (diagnosis, tests_done, prescription, medicines, attachments, notes, follow_up_date, follow_up_notes,
+     created_at, updated_at) = row[15:]
+    return {
+        'id': row[12],
+        'appointment_id': appointment['id'],
+        'diagnosis': diagnosis,
+        'tests_done': tests_done,
+        'prescription': prescription,
+        'medicines': medicines,
+        'attachments': attachments,
+        'notes': notes,
+        'follow_up_date': _iso(follow_up_date),
+        'follow_up_notes': follow_up_notes,
+        'created_at': _iso(created_at),
+        'updated_at': _iso(updated_at),
+        'appointment': dict(appointment)
+    }
+
+
+def appointment_rows(*conditions, include_treatment=False):
+    """
+    Appointments matching `conditions` (SQLAlchemy expressions on the
+    appointment, patient, doctor or treatment columns), newest first, as
+    to_dict() dicts. With include_treatment, appointments that have one
+    carry Treatment.to_dict() under 'treatment'.
+    """
+    columns = _APPOINTMENT_COLUMNS + (_TREATMENT_COLUMNS if include_treatment else ())
+    statement = select(*columns).select_from(Appointment).outerjoin(
+        Patient, Patient.id == Appointment.patient_id
+    ).outerjoin(
+        Doctor, Doctor.id == Appointment.doctor_id
+    ).outerjoin(
+        Treatment, Treatment.appointment_id == Appointment.id
+    ).where(*conditions).order_by(
+        Appointment.appointment_date.desc(),
+        Appointment.appointment_time.desc()
+    )
+
+    appointments = []
+    for row in db.session.execute(statement):
+        appointment = _appointment(row)
+        if include_treatment and row[12] is not None:
+            appointment['treatment'] = _treatment(row, appointment)
+        appointments.append(appointment)
+    return appointments
@@ -2,92 +2,72 @@
 Utility functions for appointment conflict prevention and validation
 """
 from database import db
-from models import Appointment, DoctorAvailability
+from models import Appointment, Doctor, DoctorAvailability
 from datetime import date, time, datetime
-from sqlalchemy import and_
+from sqlalchemy import and_, select, update
+from utils.availability import materialization_pending
 
-def check_appointment_conflict(doctor_id, appointment_date, appointment_time, exclude_appointment_id=None):
+def check_booking(doctor_id, patient_id, appointment_date, appointment_time, exclude_appointment_id=None):
     """
-    Check if there's a conflict for a doctor at a specific date and time
-    Returns: (has_conflict: bool, conflict_appointment: Appointment or None, error_message: str or None)
+    Everything booking validation needs, in one SELECT of scalar subqueries:
+    the doctor's availability, doctor and patient double bookings, whether
+    the doctor is active and whether their recurring templates still need
+    expanding. Each subquery is an indexed lookup. This is the only
+    implementation of the booking checks; validate_appointment_booking()
+    turns its result into error messages.
+    Returns a row with: doctor_active (None if no such doctor), slot_id (the
+    open availability slot covering the time, or None), doctor_conflict_id,
+    patient_conflict_id (booked appointments at that time, or None) and
+    needs_materialization
     """
-    try:
-        # Check if doctor has another booked appointment at the same time
-        query = Appointment.query.filter(
-            Appointment.doctor_id == doctor_id,
+    def booked_at(*conditions):
+        query = select(Appointment.id).where(
+            *conditions,
             Appointment.appointment_date == appointment_date,
             Appointment.appointment_time == appointment_time,
             Appointment.status == 'Booked'
         )
-        
         if exclude_appointment_id:
-            query = query.filter(Appointment.id != exclude_appointment_id)
-        
-        conflict = query.first()
-        
-        if conflict:
-            return True, conflict, f"Doctor already has a booked appointment at {appointment_time} on {appointment_date}"
-        
-        return False, None, None
-        
-    except Exception as e:
-        return True, None, f"Error checking conflict: {str(e)}"
-
-def check_patient_conflict(patient_id, appointment_date, appointment_time, exclude_appointment_id=None):
-    """
-    Check if patient already has an appointment at the same time
-    Returns: (has_conflict: bool, conflict_appointment: Appointment or None, error_message: str or None)
-    """
-    try:
-        query = Appointment.query.filter(
-            Appointment.patient_id == patient_id,
-            Appointment.appointment_date == appointment_date,
-            Appointment.appointment_time == appointment_time,
-            Appointment.status == 'Booked'
-        )
-        
-        if exclude_appointment_id:
-            query = query.filter(Appointment.id != exclude_appointment_id)
-        
-        conflict = query.first()
-        
-        if conflict:
-            return True, conflict, f"Patient already has a booked appointment at {appointment_time} on {appointment_date}"
-        
-        return False, None, None
-        
-    except Exception as e:
-        return True, None, f"Error checking conflict: {str(e)}"
-
-def check_doctor_availability(doctor_id, appointment_date, appointment_time):
-    """
-    Check if doctor has availability set for the given date and time
-    Returns: (is_available: bool, availability_slot: DoctorAvailability or None, error_message: str or None)
-    """
-    try:
-        availability = DoctorAvailability.query.filter(
+            query = query.where(Appointment.id != exclude_appointment_id)
+        return query.limit(1).scalar_subquery()
+    
+    return db.session.execute(select(
+        select(Doctor.is_active).where(Doctor.id == doctor_id).scalar_subquery().label('doctor_active'),
+        select(DoctorAvailability.id).where(
             DoctorAvailability.doctor_id == doctor_id,
             DoctorAvailability.date == appointment_date,
             DoctorAvailability.start_time <= appointment_time,
             DoctorAvailability.end_time >= appointment_time,
             DoctorAvailability.is_available == True
-        ).first()
-        
-        if not availability:
-            return False, None, f"Doctor does not have availability set for {appointment_time} on {appointment_date}"
-        
-        return True, availability, None
-        
-    except Exception as e:
-        return False, None, f"Error checking availability: {str(e)}"
+        ).limit(1).scalar_subquery().label('slot_id'),
+        booked_at(Appointment.doctor_id == doctor_id).label('doctor_conflict_id'),
+        booked_at(Appointment.patient_id == patient_id).label('patient_conflict_id'),
+        materialization_pending(doctor_id).label('needs_materialization')
+    )).one()
+
+def take_availability_slot(slot_id):
+    """
+    Mark the slot found by check_booking() unavailable with one UPDATE (no
+    reload). Returns False if another booking took it since the check.
+    """
+    result = db.session.execute(
+        update(DoctorAvailability).where(
+            DoctorAvailability.id == slot_id,
+            DoctorAvailability.is_available == True
+        ).values(is_available=False),
+        execution_options={'synchronize_session': False}
+    )
+    return result.rowcount == 1
 
-def validate_appointment_booking(doctor_id, patient_id, appointment_date, appointment_time, exclude_appointment_id=None):
+def validate_appointment_booking(doctor_id, patient_id, appointment_date, appointment_time, exclude_appointment_id=None,
+                                 check=None):
     """
     Comprehensive validation for appointment booking
     Checks:
     1. Doctor availability
     2. Doctor conflict (double booking)
     3. Patient conflict (patient double booking)
+    Pass `check` (from check_booking) to reuse a check already made.
     
     Returns: (is_valid: bool, error_message: str or None, conflict_details: dict or None)
     """
@@ -98,33 +78,29 @@ def validate_appointment_booking(doctor_id, patient_id, appointment_date, appoin
     if appointment_date < date.today():
         return False, "Cannot book appointment in the past", None
     
+    if check is None:
+        check = check_booking(doctor_id, patient_id, appointment_date, appointment_time, exclude_appointment_id)
+    
     # Check doctor availability
-    is_available, availability_slot, avail_error = check_doctor_availability(
-        doctor_id, appointment_date, appointment_time
-    )
-    if not is_available:
-        errors.append(avail_error)
+    if check.slot_id is None:
+        errors.append(f"Doctor does not have availability set for {appointment_time} on {appointment_date}")
         conflict_details['availability'] = False
     
     # Check doctor conflict
-    has_conflict, conflict_apt, conflict_error = check_appointment_conflict(
-        doctor_id, appointment_date, appointment_time, exclude_appointment_id
-    )
-    if has_conflict:
+    if check.doctor_conflict_id is not None:
+        conflict_error = f"Doctor already has a booked appointment at {appointment_time} on {appointment_date}"
         errors.append(conflict_error)
         conflict_details['doctor_conflict'] = {
-            'appointment_id': conflict_apt.id if conflict_apt else None,
+            'appointment_id': check.doctor_conflict_id,
             'message': conflict_error
         }
     
     # Check patient conflict
-    has_patient_conflict, patient_conflict_apt, patient_error = check_patient_conflict(
-        patient_id, appointment_date, appointment_time, exclude_appointment_id
-    )
-    if has_patient_conflict:
+    if check.patient_conflict_id is not None:
+        patient_error = f"Patient already has a booked appointment at {appointment_time} on {appointment_date}"
         errors.append(patient_error)
         conflict_details['patient_conflict'] = {
-            'appointment_id': patient_conflict_apt.id if patient_conflict_apt else None,
+            'appointment_id': check.patient_conflict_id,
             'message': patient_error
         }
     
@@ -0,0 +1,425 @@
+"""
+Hot/cold archival of historical appointments and treatments
+
+Completed and cancelled appointments older than ARCHIVE_AFTER_DAYS are moved,
+with their treatments, from appointments/treatments into appointments_archive/
+treatments_archive (same ids, same columns) by a nightly Celery task. The hot
+tables then only hold recent and upcoming rows, which keeps dashboard counts,
+conflict checks and booking validation fast.
+
+History readers go through fetch_appointment_history() and
+fetch_treatment_history(), which query both tiers with the same filters and
+merge them newest first. Paging uses an opaque keyset cursor over
+(appointment_date, appointment_time, id), so each page is an index range scan
+on both tiers no matter how deep it is.
+"""
+import heapq
+import logging
+import os
+from datetime import date, datetime, time as dt_time, timedelta
+
+from sqlalchemy import and_, case, delete, desc, func, insert, literal, select, tuple_, union, union_all
+from sqlalchemy.orm import contains_eager, joinedload
+
+from database import db
+from models import Appointment, Treatment, ArchivedAppointment, ArchivedTreatment, Patient
+from utils.cache import cache_get_json, cache_set_json, cache_delete_pattern, bump_generation
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', '365'))
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', '500'))
+ARCHIVABLE_STATUSES = ('Completed', 'Cancelled')
+ARCHIVE_COUNTS_TTL = 24 * 3600  # Archive only changes when the archival task runs
+
+# (appointment model, treatment model) for the hot and cold tier
+TIERS = ((Appointment, Treatment), (ArchivedAppointment, ArchivedTreatment))
+
+
+def archive_cutoff(days=None):
+    """Appointments dated before this are eligible for archival"""
+    return date.today() - timedelta(days=ARCHIVE_AFTER_DAYS if days is None else days)
+
+
+# ==================== MOVING ROWS ====================
+
+def _copy_statement(target, source, ids, id_column, extra=None):
+    """INSERT INTO target (...) SELECT ... FROM source WHERE id_column IN ids"""
+    columns = [column.name for column in target.__table__.columns if not extra or column.name not in extra]
+    selected = [source.__table__.c[name] for name in columns]
+    if extra:
+        columns += list(extra)
+        selected += [literal(value) for value in extra.values()]
+    return insert(target).from_select(
+        columns,
+        select(*selected).where(id_column.in_(ids))
+    )
+
+
+def archive_old_appointments(before=None, batch_size=ARCHIVE_BATCH_SIZE, max_batches=None):
+    """
+    Move completed/cancelled appointments dated before `before` (default:
+    archive_cutoff()) and their treatments into the archive tables.
+    Runs in batches of `batch_size`, one transaction per batch, so the hot
+    tables are never locked for long. Returns counts of moved rows.
+    """
+    before = before or archive_cutoff()
+    moved_appointments = moved_treatments = batches = 0
+    last_id = 0
+
+    while max_batches is None or batches < max_batches:
+        ids = [row[0] for row in db.session.query(Appointment.id).filter(
+            Appointment.id > last_id,
+            Appointment.status.in_(ARCHIVABLE_STATUSES),
+            Appointment.appointment_date < before
+        ).order_by(Appointment.id).limit(batch_size).all()]
+        if not ids:
+            break
+
+        try:
+            archived_at = datetime.utcnow()
+            db.session.execute(_copy_statement(ArchivedAppointment, Appointment, ids, Appointment.id,
+                                               extra={'archived_at': archived_at}))
+            result = db.session.execute(_copy_statement(ArchivedTreatment, Treatment, ids, Treatment.appointment_id))
+            moved_treatments += result.rowcount
+            db.session.execute(delete(Treatment).where(Treatment.appointment_id.in_(ids)),
+                               execution_options={'synchronize_session': False})
+            db.session.execute(delete(Appointment).where(Appointment.id.in_(ids)),
+                               execution_options={'synchronize_session': False})
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        moved_appointments += len(ids)
+        last_id = ids[-1]
+        batches += 1
+
+    if moved_appointments:
+        invalidate_archive_counts()  # History responses now mark these rows archived
+        db.session.expire_all()
+    logger.info(f"Archived {moved_appointments} appointments and {moved_treatments} treatments dated before {before}")
+    return {
+        'appointments': moved_appointments,
+        'treatments': moved_treatments,
+        'before': before.isoformat()
+    }
+
+
+def delete_archived_appointments(patient_id=None, doctor_id=None):
+    """
+    Delete a patient's or doctor's archived appointments and their treatments
+    in the current transaction, before the patient or doctor row itself (the
+    hot tier goes with it through the ORM cascade). Call
+    invalidate_archive_counts() after committing. Returns the appointments deleted.
+    """
+    if not patient_id and not doctor_id:
+        raise ValueError('patient_id or doctor_id is required')
+    ids = select(ArchivedAppointment.id).where(
+        *_appointment_conditions(ArchivedAppointment, patient_id=patient_id, doctor_id=doctor_id)
+    )
+    db.session.execute(delete(ArchivedTreatment).where(ArchivedTreatment.appointment_id.in_(ids)),
+                       execution_options={'synchronize_session': False})
+    return db.session.execute(delete(ArchivedAppointment).where(ArchivedAppointment.id.in_(ids)),
+                              execution_options={'synchronize_session': False}).rowcount
+
+
+def invalidate_archive_counts():
+    cache_delete_pattern('archive:status_counts:*')
+    bump_generation('archive')
+
+
+# ==================== READING BOTH TIERS ====================
+
+def encode_cursor(appointment):
+    return f"{appointment.appointment_date.isoformat()}|{appointment.appointment_time.strftime('%H:%M:%S')}|{appointment.id}"
+
+
+def decode_cursor(cursor):
+    """Parse a cursor from encode_cursor(); raises ValueError when malformed"""
+    date_part, time_part, id_part = cursor.split('|')
+    return (
+        datetime.strptime(date_part, '%Y-%m-%d').date(),
+        dt_time.fromisoformat(time_part),
+        int(id_part)
+    )
+
+
+def _sort_key(appointment):
+    return appointment.appointment_date, appointment.appointment_time, appointment.id
+
+
+def _appointment_conditions(model, patient_id=None, doctor_id=None, status=None, date_from=None, date_to=None,
+                            cursor=None):
+    conditions = []
+    if patient_id:
+        conditions.append(model.patient_id == patient_id)
+    if doctor_id:
+        conditions.append(model.doctor_id == doctor_id)
+    if status:
+        conditions.append(model.status == status)
+    if date_from:
+        conditions.append(model.appointment_date >= date_from)
+    if date_to:
+        conditions.append(model.appointment_date <= date_to)
+    if cursor:
+        conditions.append(tuple_(model.appointment_date, model.appointment_time, model.id) < tuple_(*cursor))
+    return conditions
+
+
+def _with_related(appointment_model):
+    """Eager-load what Appointment.to_dict() and the history routes touch"""
+    return (
+        joinedload(appointment_model.patient),
+        joinedload(appointment_model.doctor),
+        joinedload(appointment_model.treatment),
+    )
+
+
+def _newest_first(model):
+    return desc(model.appointment_date), desc(model.appointment_time), desc(model.id)
+
+
+def _archive_may_match(status=None, date_from=None):
+    """Skip the cold tier when the filters can only match hot rows"""
+    if status and status not in ARCHIVABLE_STATUSES:
+        return False
+    if date_from:
+        if isinstance(date_from, str):
+            date_from = datetime.strptime(date_from, '%Y-%m-%d').date()
+        # Only rows dated before today can ever have been archived
+        if date_from >= archive_cutoff(0):
+            return False
+    return True
+
+
+def _merge_page(tier_results, key, limit):
+    merged = list(heapq.merge(*tier_results, key=key, reverse=True))
+    if limit is None or len(merged) <= limit:
+        return merged, None
+    page = merged[:limit]
+    return page, page[-1]
+
+
+def fetch_appointment_history(patient_id=None, doctor_id=None, status=None, date_from=None, date_to=None,
+                              limit=None, cursor=None):
+    """
+    Appointments from both tiers matching the filters, newest first.
+    With `limit`, returns one page and the cursor for the next page (None
+    on the last page). Returns (appointments, next_cursor).
+    """
+    filters = dict(patient_id=patient_id, doctor_id=doctor_id, status=status, date_from=date_from, date_to=date_to,
+                   cursor=decode_cursor(cursor) if cursor else None)
+    tiers = TIERS if _archive_may_match(status, date_from) else TIERS[:1]
+
+    results = []
+    for appointment_model, _ in tiers:
+        query = appointment_model.query.options(*_with_related(appointment_model)).filter(
+            *_appointment_conditions(appointment_model, **filters)
+        ).order_by(*_newest_first(appointment_model))
+        if limit is not None:
+            query = query.limit(limit + 1)
+        results.append(query.all())
+
+    page, last = _merge_page(results, _sort_key, limit)
+    return page, encode_cursor(last) if last is not None else None
+
+
+def fetch_treatment_history(patient_id=None, doctor_id=None, date_from=None, date_to=None, limit=None, cursor=None):
+    """
+    Treatments from both tiers (joined to their appointment) newest first.
+    Returns (treatments, next_cursor) like fetch_appointment_history().
+    """
+    filters = dict(patient_id=patient_id, doctor_id=doctor_id, date_from=date_from, date_to=date_to,
+                   cursor=decode_cursor(cursor) if cursor else None)
+    tiers = TIERS if _archive_may_match(date_from=date_from) else TIERS[:1]
+
+    results = []
+    for appointment_model, treatment_model in tiers:
+        query = treatment_model.query.join(
+            appointment_model, treatment_model.appointment_id == appointment_model.id
+        ).options(
+            contains_eager(treatment_model.appointment).options(*_with_related(appointment_model))
+        ).filter(
+            *_appointment_conditions(appointment_model, **filters)
+        ).order_by(*_newest_first(appointment_model))
+        if limit is not None:
+            query = query.limit(limit + 1)
+        results.append(query.all())
+
+    page, last = _merge_page(results, lambda treatment: _sort_key(treatment.appointment), limit)
+    return page, encode_cursor(last.appointment) if last is not None else None
+
+
+def status_counts(patient_id=None, doctor_id=None):
+    """Appointment counts by status across both tiers"""
+    counts = {}
+    for appointment_model, _ in TIERS:
+        query = db.session.query(appointment_model.status, func.count(appointment_model.id))
+        if patient_id:
+            query = query.filter(appointment_model.patient_id == patient_id)
+        if doctor_id:
+            query = query.filter(appointment_model.doctor_id == doctor_id)
+        for status, count in query.group_by(appointment_model.status).all():
+            counts[status] = counts.get(status, 0) + count
+    return counts
+
+
+def treatment_count(patient_id=None):
+    """Number of treatment records across both tiers"""
+    total = 0
+    for appointment_model, treatment_model in TIERS:
+        query = db.session.query(func.count(treatment_model.id))
+        if patient_id:
+            query = query.join(appointment_model, treatment_model.appointment_id == appointment_model.id).filter(
+                appointment_model.patient_id == patient_id
+            )
+        total += query.scalar() or 0
+    return total
+
+
+def patient_summary(patient_id, today=None, status=None, date_from=None, date_to=None):
+    """
+    Appointment counts for one patient across both tiers in one grouped
+    query: by status, total, with a treatment record, and upcoming bookings.
+    status/date_from/date_to restrict the counts as they do the history.
+    """
+    today = today or date.today()
+    filters = dict(patient_id=patient_id, status=status, date_from=date_from, date_to=date_to)
+    tiers = TIERS if _archive_may_match(status, date_from) else TIERS[:1]
+    visits = union_all(*(
+        select(
+            appointment_model.status,
+            appointment_model.appointment_date,
+            treatment_model.id.label('treatment_id')
+        ).select_from(appointment_model).outerjoin(
+            treatment_model, treatment_model.appointment_id == appointment_model.id
+        ).where(*_appointment_conditions(appointment_model, **filters))
+        for appointment_model, treatment_model in tiers
+    )).subquery('visits')
+
+    rows = db.session.execute(select(
+        visits.c.status,
+        func.count(),
+        func.count(visits.c.treatment_id),
+        func.sum(case((visits.c.appointment_date >= today, 1), else_=0))
+    ).group_by(visits.c.status)).all()
+
+    by_status = {status: count for status, count, _, _ in rows}
+    return {
+        'date': today.isoformat(),
+        'by_status': by_status,
+        'total': sum(by_status.values()),
+        'with_treatment': sum(treated for _, _, treated, _ in rows),
+        'upcoming': next((int(on_or_after or 0) for status, _, _, on_or_after in rows if status == 'Booked'), 0),
+    }
+
+
+def archived_status_counts(doctor_id=None):
+    """
+    Archived appointment counts by status, cached until the next archival run.
+    Dashboards add these to their hot-table counts so totals stay complete.
+    """
+    cache_key = f"archive:status_counts:{doctor_id or 'all'}"
+    cached = cache_get_json(cache_key)
+    if cached is not None:
+        return cached
+
+    query = db.session.query(ArchivedAppointment.status, func.count(ArchivedAppointment.id))
+    if doctor_id:
+        query = query.filter(ArchivedAppointment.doctor_id == doctor_id)
+    counts = {status: count for status, count in query.group_by(ArchivedAppointment.status).all()}
+    cache_set_json(cache_key, counts, ttl=ARCHIVE_COUNTS_TTL)
+    return counts
+
+
+def doctor_has_seen_patient(doctor_id, patient_id):
+    """True if the doctor has any appointment with the patient in either tier"""
+    return any(
+        db.session.query(
+            appointment_model.query.filter(
+                appointment_model.doctor_id == doctor_id,
+                appointment_model.patient_id == patient_id
+            ).exists()
+        ).scalar()
+        for appointment_model, _ in TIERS
+    )
+
+
+def doctor_patient_ids(doctor_id):
+    """Distinct ids of patients the doctor has seen, across both tiers"""
+    return [row[0] for row in db.session.execute(union(*(
+        select(appointment_model.patient_id).where(appointment_model.doctor_id == doctor_id)
+        for appointment_model, _ in TIERS
+    ))).all()]
+
+
+def _patient_visits(doctor_id):
+    """
+    One row per patient the doctor has seen (both tiers): last visit,
+    number of visits and the diagnosis of the latest completed visit.
+    ROW_NUMBER() ranks each patient's visits newest first, overall and
+    within each status, so a single pass picks both rows.
+    """
+    visits = union_all(*(
+        select(
+            appointment_model.patient_id,
+            appointment_model.appointment_date.label('visit_date'),
+            appointment_model.appointment_time.label('visit_time'),
+            appointment_model.id.label('appointment_id'),
+            appointment_model.status,
+            treatment_model.diagnosis
+        ).select_from(appointment_model).outerjoin(
+            treatment_model, treatment_model.appointment_id == appointment_model.id
+        ).where(appointment_model.doctor_id == doctor_id)
+        for appointment_model, treatment_model in TIERS
+    )).subquery('visits')
+
+    newest_first = (desc(visits.c.visit_date), desc(visits.c.visit_time), desc(visits.c.appointment_id))
+    ranked = select(
+        visits,
+        func.row_number().over(partition_by=visits.c.patient_id, order_by=newest_first).label('visit_rank'),
+        func.row_number().over(partition_by=(visits.c.patient_id, visits.c.status),
+                               order_by=newest_first).label('status_rank'),
+        func.count().over(partition_by=visits.c.patient_id).label('visit_count')
+    ).subquery('ranked')
+
+    is_last = ranked.c.visit_rank == 1
+    return select(
+        ranked.c.patient_id,
+        func.max(case((is_last, ranked.c.visit_date))).label('last_visit_date'),
+        func.max(case((is_last, ranked.c.visit_time))).label('last_visit_time'),
+        func.max(ranked.c.visit_count).label('visit_count'),
+        func.max(case((and_(ranked.c.status == 'Completed', ranked.c.status_rank == 1),
+                       ranked.c.diagnosis))).label('latest_diagnosis')
+    ).group_by(ranked.c.patient_id).subquery('patient_visits')
+
+
+def fetch_doctor_patients(doctor_id, limit, cursor=None, ascending=False, name=None):
+    """
+    One page of the doctor's patients sorted by last visit (newest first
+    unless `ascending`), with their latest diagnosis, in a single statement.
+    `cursor` is the next_cursor of the previous page ("date|time|patient_id").
+    Returns ([(patient, last_visit_date, last_visit_time, visit_count, latest_diagnosis)], next_cursor).
+    """
+    summary = _patient_visits(doctor_id)
+    sort_key = (summary.c.last_visit_date, summary.c.last_visit_time, summary.c.patient_id)
+
+    query = db.session.query(
+        Patient, summary.c.last_visit_date, summary.c.last_visit_time, summary.c.visit_count,
+        summary.c.latest_diagnosis
+    ).join(summary, Patient.id == summary.c.patient_id).options(joinedload(Patient.user))
+    if name:
+        pattern = f"%{name}%"
+        query = query.filter((Patient.first_name + ' ' + Patient.last_name).ilike(pattern))
+    if cursor:
+        position = tuple_(*decode_cursor(cursor))
+        query = query.filter(tuple_(*sort_key) > position if ascending else tuple_(*sort_key) < position)
+    query = query.order_by(*(sort_key if ascending else [desc(column) for column in sort_key]))
+
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    patient, last_date, last_time, _, _ = rows[-1]
+    return rows, f"{last_date.isoformat()}|{last_time.strftime('%H:%M:%S')}|{patient.id}"
@@ -0,0 +1,405 @@
+"""
+Bulk availability engine
+- Diffs submitted availability slots against existing rows and writes only
+  what changed, in batched statements
+- Expands weekly recurring templates into concrete slots lazily, up to a
+  per-doctor materialization watermark
+"""
+import os
+from datetime import date, datetime, timedelta
+from sqlalchemy import insert, update, delete, or_, select
+from sqlalchemy.exc import IntegrityError
+from database import db
+from utils.cache import invalidate_doctor_availability_dates
+from models import (
+    Appointment,
+    DoctorAvailability,
+    AvailabilityTemplate,
+    AvailabilityException,
+    AvailabilityMaterialization,
+)
+
+# How far ahead recurring templates are materialized into slots
+MATERIALIZE_DAYS = int(os.environ.get('AVAILABILITY_MATERIALIZE_DAYS', '14'))
+
+
+def parse_slot(slot_data):
+    """
+    Parse a submitted slot into (date, start_time, end_time, is_available)
+    Raises ValueError/KeyError on malformed input
+    """
+    slot_date = datetime.strptime(slot_data['date'], '%Y-%m-%d').date()
+    start_time = datetime.strptime(slot_data['start_time'], '%H:%M').time()
+    end_time = datetime.strptime(slot_data['end_time'], '%H:%M').time()
+    if end_time <= start_time:
+        raise ValueError(f"end_time must be after start_time for slot on {slot_data['date']}")
+    return slot_date, start_time, end_time, bool(slot_data.get('is_available', True))
+
+
+def _booked_times_by_date(doctor_id, window_start, window_end):
+    """Booked appointment times for the doctor in the window, grouped by date"""
+    rows = db.session.query(Appointment.appointment_date, Appointment.appointment_time).filter(
+        Appointment.doctor_id == doctor_id,
+        Appointment.appointment_date >= window_start,
+        Appointment.appointment_date <= window_end,
+        Appointment.status == 'Booked'
+    ).all()
+    booked = {}
+    for appointment_date, appointment_time in rows:
+        booked.setdefault(appointment_date, []).append(appointment_time)
+    return booked
+
+
+def _has_booking(booked, slot_date, start_time, end_time):
+    return any(start_time <= t <= end_time for t in booked.get(slot_date, ()))
+
+
+def apply_availability(doctor_id, submitted_slots, window_start, window_end):
+    """
+    Make the doctor's availability in [window_start, window_end] match the
+    submitted slots, keyed by (date, start_time, end_time):
+    - new slots are inserted
+    - existing slots whose is_available changed are updated
+    - existing slots that were not submitted are deleted
+    Slots covering a booked appointment keep is_available=False and are
+    never deleted, so booking markers survive a save.
+    Submitted slots outside the window are ignored.
+
+    Does not commit. Returns a summary dict with counts and affected dates.
+    """
+    existing = {
+        (slot.date, slot.start_time, slot.end_time): slot
+        for slot in DoctorAvailability.query.filter(
+            DoctorAvailability.doctor_id == doctor_id,
+            DoctorAvailability.date >= window_start,
+            DoctorAvailability.date <= window_end
+        ).all()
+    }
+    existing_by_id = {slot.id: slot for slot in existing.values()}
+    booked = _booked_times_by_date(doctor_id, window_start, window_end)
+
+    desired = {}
+    for slot_data in submitted_slots:
+        slot_date, start_time, end_time, is_available = parse_slot(slot_data)
+        if slot_date < window_start or slot_date > window_end:
+            continue
+        if _has_booking(booked, slot_date, start_time, end_time):
+            is_available = False
+        desired[(slot_date, start_time, end_time)] = is_available
+
+    to_insert = []
+    to_update = []
+    to_delete = []
+    affected_dates = set()
+    kept_booked = 0
+
+    for key, is_available in desired.items():
+        slot = existing.get(key)
+        if slot is None:
+            to_insert.append({
+                'doctor_id': doctor_id,
+                'date': key[0],
+                'start_time': key[1],
+                'end_time': key[2],
+                'is_available': is_available,
+                'created_at': datetime.utcnow()
+            })
+            affected_dates.add(key[0])
+        elif bool(slot.is_available) != is_available:
+            to_update.append({'id': slot.id, 'is_available': is_available})
+            affected_dates.add(key[0])
+
+    for key, slot in existing.items():
+        if key in desired:
+            continue
+        if _has_booking(booked, *key):
+            kept_booked += 1
+            continue
+        to_delete.append(slot.id)
+        affected_dates.add(key[0])
+
+    if to_insert:
+        db.session.execute(insert(DoctorAvailability), to_insert)
+    if to_update:
+        db.session.execute(update(DoctorAvailability), to_update)
+        for row in to_update:
+            db.session.expire(existing_by_id[row['id']])
+    if to_delete:
+        db.session.execute(
+            delete(DoctorAvailability).where(DoctorAvailability.id.in_(to_delete)),
+            execution_options={'synchronize_session': False}
+        )
+
+    return {
+        'inserted': len(to_insert),
+        'updated': len(to_update),
+        'deleted': len(to_delete),
+        'unchanged': len(desired) - len(to_insert) - len(to_update),
+        'kept_booked': kept_booked,
+        'affected_dates': sorted(affected_dates)
+    }
+
+
+# ==================== RECURRING TEMPLATES ====================
+
+def parse_template(template_data):
+    """
+    Parse a submitted template into (weekday, start_time, end_time)
+    Raises ValueError/KeyError on malformed input
+    """
+    weekday = int(template_data['weekday'])
+    if weekday < 0 or weekday > 6:
+        raise ValueError('weekday must be between 0 (Monday) and 6 (Sunday)')
+    start_time = datetime.strptime(template_data['start_time'], '%H:%M').time()
+    end_time = datetime.strptime(template_data['end_time'], '%H:%M').time()
+    if end_time <= start_time:
+        raise ValueError(f"end_time must be after start_time for weekday {weekday}")
+    return weekday, start_time, end_time
+
+
+def expand_templates(doctor_id, start, end):
+    """
+    Insert concrete slots for the doctor's active templates on each date in
+    [start, end], skipping slots blocked by leave/holiday exceptions and
+    slots that already exist. Does not commit. Returns inserted dates.
+    """
+    templates = AvailabilityTemplate.query.filter(
+        AvailabilityTemplate.doctor_id == doctor_id,
+        AvailabilityTemplate.is_active == True,
+        AvailabilityTemplate.valid_from <= end,
+        or_(AvailabilityTemplate.valid_until == None, AvailabilityTemplate.valid_until >= start)
+    ).all()
+    if not templates:
+        return set()
+
+    exceptions = {}
+    for exception in AvailabilityException.query.filter(
+        or_(AvailabilityException.doctor_id == doctor_id, AvailabilityException.doctor_id == None),
+        AvailabilityException.date >= start,
+        AvailabilityException.date <= end
+    ).all():
+        exceptions.setdefault(exception.date, []).append(exception)
+
+    existing = set(db.session.query(
+        DoctorAvailability.date, DoctorAvailability.start_time, DoctorAvailability.end_time
+    ).filter(
+        DoctorAvailability.doctor_id == doctor_id,
+        DoctorAvailability.date >= start,
+        DoctorAvailability.date <= end
+    ).all())
+
+    by_weekday = {}
+    for template in templates:
+        by_weekday.setdefault(template.weekday, []).append(template)
+
+    rows = []
+    day = start
+    while day <= end:
+        for template in by_weekday.get(day.weekday(), ()):
+            if template.valid_from > day or (template.valid_until and template.valid_until < day):
+                continue
+            if (day, template.start_time, template.end_time) in existing:
+                continue
+            if any(exc.blocks(template.start_time, template.end_time) for exc in exceptions.get(day, ())):
+                continue
+            rows.append({
+                'doctor_id': doctor_id,
+                'date': day,
+                'start_time': template.start_time,
+                'end_time': template.end_time,
+                'is_available': True,
+                'template_id': template.id,
+                'created_at': datetime.utcnow()
+            })
+        day += timedelta(days=1)
+
+    if rows:
+        db.session.execute(insert(DoctorAvailability), rows)
+    return {row['date'] for row in rows}
+
+
+def _claim_window(doctor_id, current_until, through):
+    """
+    Advance the doctor's watermark from current_until to through.
+    Compare-and-set, so concurrent readers never expand the same window twice.
+    """
+    if current_until is None:
+        try:
+            with db.session.begin_nested():
+                db.session.add(AvailabilityMaterialization(doctor_id=doctor_id, materialized_until=through))
+            return True
+        except IntegrityError:
+            return False
+    result = db.session.execute(
+        update(AvailabilityMaterialization).where(
+            AvailabilityMaterialization.doctor_id == doctor_id,
+            AvailabilityMaterialization.materialized_until == current_until
+        ).values(materialized_until=through, updated_at=datetime.utcnow()),
+        execution_options={'synchronize_session': False}
+    )
+    return result.rowcount == 1
+
+
+def materialization_pending(doctor_id, through=None):
+    """
+    EXISTS expression, true while ensure_materialized() would expand templates
+    for the doctor (active templates, watermark missing or before `through`).
+    Lets callers fold the check into a query they already run.
+    """
+    through = through or date.today() + timedelta(days=MATERIALIZE_DAYS)
+    return select(AvailabilityTemplate.id).outerjoin(
+        AvailabilityMaterialization,
+        AvailabilityMaterialization.doctor_id == AvailabilityTemplate.doctor_id
+    ).where(
+        AvailabilityTemplate.doctor_id == doctor_id,
+        AvailabilityTemplate.is_active == True,
+        or_(
+            AvailabilityMaterialization.materialized_until == None,
+            AvailabilityMaterialization.materialized_until < through
+        )
+    ).exists()
+
+
+def ensure_materialized(doctor_ids=None, through=None):
+    """
+    Make sure recurring templates are expanded into slots up to `through`
+    (default: MATERIALIZE_DAYS ahead) for the given doctors, or for every
+    doctor with templates. Only windows past each doctor's watermark are
+    expanded. Commits, and invalidates caches for dates that received slots.
+    Returns {doctor_id: set of dates that received new slots}.
+    """
+    today = date.today()
+    through = through or today + timedelta(days=MATERIALIZE_DAYS)
+
+    query = db.session.query(
+        AvailabilityTemplate.doctor_id,
+        AvailabilityMaterialization.materialized_until
+    ).outerjoin(
+        AvailabilityMaterialization,
+        AvailabilityMaterialization.doctor_id == AvailabilityTemplate.doctor_id
+    ).filter(
+        AvailabilityTemplate.is_active == True,
+        or_(
+            AvailabilityMaterialization.materialized_until == None,
+            AvailabilityMaterialization.materialized_until < through
+        )
+    ).distinct()
+    if doctor_ids is not None:
+        doctor_ids = list(doctor_ids)
+        if not doctor_ids:
+            return {}
+        query = query.filter(AvailabilityTemplate.doctor_id.in_(doctor_ids))
+
+    pending = query.all()
+    if not pending:
+        return {}
+
+    expanded = {}
+    for doctor_id, until in pending:
+        start = today if until is None or until < today else until + timedelta(days=1)
+        if not _claim_window(doctor_id, until, through):
+            continue
+        dates = expand_templates(doctor_id, start, through)
+        if dates:
+            expanded[doctor_id] = dates
+    db.session.commit()
+    
+    for doctor_id, dates in expanded.items():
+        invalidate_doctor_availability_dates(doctor_id, dates)
+    return expanded
+
+
+def rewind_materialization(from_date, doctor_id=None):
+    """
+    Move watermarks back to the day before from_date so the next read
+    re-expands templates from that date (e.g. after an exception is removed).
+    Applies to one doctor, or to all doctors when doctor_id is None. Does not commit.
+    """
+    query = update(AvailabilityMaterialization).where(
+        AvailabilityMaterialization.materialized_until >= from_date
+    )
+    if doctor_id is not None:
+        query = query.where(AvailabilityMaterialization.doctor_id == doctor_id)
+    db.session.execute(
+        query.values(materialized_until=from_date - timedelta(days=1), updated_at=datetime.utcnow()),
+        execution_options={'synchronize_session': False}
+    )
+
+
+def replace_templates(doctor_id, submitted_templates):
+    """
+    Replace the doctor's weekly templates. Old templates are closed (kept for
+    history, since booked slots reference them), their unbooked future slots
+    are removed, and the watermark is rewound so new slots are expanded.
+    Does not commit. Returns the new templates.
+    """
+    today = date.today()
+    parsed = {parse_template(template_data) for template_data in submitted_templates}
+
+    db.session.execute(
+        update(AvailabilityTemplate).where(
+            AvailabilityTemplate.doctor_id == doctor_id,
+            AvailabilityTemplate.is_active == True
+        ).values(is_active=False, valid_until=today - timedelta(days=1)),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.execute(
+        delete(DoctorAvailability).where(
+            DoctorAvailability.doctor_id == doctor_id,
+            DoctorAvailability.template_id != None,
+            DoctorAvailability.is_available == True,
+            DoctorAvailability.date >= today
+        ),
+        execution_options={'synchronize_session': False}
+    )
+
+    templates = [
+        AvailabilityTemplate(
+            doctor_id=doctor_id,
+            weekday=weekday,
+            start_time=start_time,
+            end_time=end_time,
+            valid_from=today
+        )
+        for weekday, start_time, end_time in sorted(parsed)
+    ]
+    db.session.add_all(templates)
+    rewind_materialization(today, doctor_id)
+    return templates
+
+
+def apply_exception(exception):
+    """
+    Remove unbooked recurring slots blocked by a new leave/holiday exception.
+    Booked slots are kept. Does not commit. Returns the number of slots removed.
+    """
+    query = delete(DoctorAvailability).where(
+        DoctorAvailability.date == exception.date,
+        DoctorAvailability.template_id != None,
+        DoctorAvailability.is_available == True
+    )
+    if exception.doctor_id is not None:
+        query = query.where(DoctorAvailability.doctor_id == exception.doctor_id)
+    if exception.start_time is not None and exception.end_time is not None:
+        query = query.where(
+            DoctorAvailability.start_time < exception.end_time,
+            DoctorAvailability.end_time > exception.start_time
+        )
+    result = db.session.execute(query, execution_options={'synchronize_session': False})
+    return result.rowcount
+
+
+def parse_exception(exception_data):
+    """
+    Parse a submitted exception into (date, start_time, end_time, reason, notes)
+    start_time/end_time are None for a whole-day exception
+    """
+    exception_date = datetime.strptime(exception_data['date'], '%Y-%m-%d').date()
+    start_time = end_time = None
+    if exception_data.get('start_time') or exception_data.get('end_time'):
+        start_time = datetime.strptime(exception_data['start_time'], '%H:%M').time()
+        end_time = datetime.strptime(exception_data['end_time'], '%H:%M').time()
+        if end_time <= start_time:
+            raise ValueError('end_time must be after start_time')
+    notes = (exception_data.get('notes') or '').strip() or None
+    return exception_date, start_time, end_time, exception_data.get('reason'), notes
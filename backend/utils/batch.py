@@ -0,0 +1,109 @@
+"""
+Batched GET requests: several API reads in one HTTP round trip
+
+A dashboard page load used to make four or five GETs (profile, dashboard,
+departments, appointments, availability), each paying for its own TLS/HTTP
+round trip, token check and user lookup. POST /api/batch takes a list of
+GET paths and runs each one through the app's normal dispatch
+(before_request hooks, the route and its decorators, after_request hooks)
+inside the batch request's app context:
+- every sub-request carries the batch request's Authorization header and
+  client address, so each route still checks roles and admission control
+  still charges every sub-request to the caller's buckets
+- the SQLAlchemy session belongs to the app context, so the user loaded by
+  the batch request's own token check is served from the session's
+  identity map to every sub-request instead of being reloaded
+- sub-requests run in order; one failing does not stop the rest
+
+Only GET is allowed, at most BATCH_MAX_REQUESTS per batch. Streams, file
+downloads and the batch endpoint itself cannot be batched.
+"""
+import logging
+import os
+from urllib.parse import urlsplit
+
+from flask import current_app, request
+from werkzeug.exceptions import HTTPException
+from werkzeug.routing import RequestRedirect
+
+from database import db
+
+logger = logging.getLogger(__name__)
+
+BATCH_MAX_REQUESTS = int(os.environ.get('BATCH_MAX_REQUESTS', '10'))
+BATCH_EXCLUDED_ENDPOINTS = {
+    'batch.run_batch_requests',
+    'live.appointment_stream',
+    'export.download_export',
+    'static',
+}
+
+
+def parse_batch(data):
+    """
+    [(id, path, query_string)] from a batch body
+    {"requests": [{"id": "...", "path": "/api/...?..."}]}; raises ValueError
+    """
+    items = (data or {}).get('requests')
+    if not isinstance(items, list) or not items:
+        raise ValueError('requests must be a non-empty list')
+    if len(items) > BATCH_MAX_REQUESTS:
+        raise ValueError(f'At most {BATCH_MAX_REQUESTS} requests per batch')
+
+    parsed, seen = [], set()
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not isinstance(item.get('path'), str):
+            raise ValueError(f'Request {index} needs a path')
+        if item.get('method', 'GET').upper() != 'GET':
+            raise ValueError(f'Request {index}: only GET requests can be batched')
+        request_id = str(item.get('id', index))
+        if request_id in seen:
+            raise ValueError(f'Duplicate request id: {request_id}')
+        seen.add(request_id)
+        url = urlsplit(item['path'])
+        if url.scheme or url.netloc or not url.path.startswith('/api/'):
+            raise ValueError(f'Request {index}: path must start with /api/')
+        parsed.append((request_id, url.path, url.query))
+    return parsed
+
+
+def _error(status, message):
+    return {'status': status, 'body': {'error': message}}
+
+
+def run_subrequest(path, query_string):
+    """Dispatch one GET inside the current app context; returns {'status', 'body'}"""
+    app = current_app._get_current_object()
+    try:
+        endpoint, _ = app.url_map.bind('localhost').match(path, method='GET')
+    except RequestRedirect:
+        return _error(404, 'Not found')  # Path differs from the route only by a trailing slash
+    except HTTPException as exc:
+        return _error(exc.code, exc.description)
+    if endpoint in BATCH_EXCLUDED_ENDPOINTS:
+        return _error(400, 'This endpoint cannot be batched')
+
+    headers = {'Authorization': request.headers['Authorization']} if 'Authorization' in request.headers else {}
+    with app.test_request_context(path, method='GET', query_string=query_string, headers=headers,
+                                  environ_base={'REMOTE_ADDR': request.remote_addr}):
+        try:
+            response = app.full_dispatch_request()
+        except Exception as exc:
+            logger.exception("Batched request %s failed", path)
+            db.session.rollback()  # Leave the shared session usable for the rest of the batch
+            return _error(500, f'Failed to run request: {str(exc)}')
+        body = response.get_json(silent=True)
+        if body is None:
+            body = {'error': response.status} if response.status_code >= 400 else None
+        result = {'status': response.status_code, 'body': body}
+        if response.headers.get('Retry-After'):
+            result['retry_after'] = int(response.headers['Retry-After'])
+        return result
+
+
+def run_batch(items):
+    """[{'id', 'status', 'body'}, ...] for parse_batch() output, in order"""
+    responses = []
+    for request_id, path, query_string in items:
+        responses.append({'id': request_id, **run_subrequest(path, query_string)})
+    return responses
@@ -4,6 +4,7 @@ Redis caching utilities for API performance
 import os
 import json
 import logging
+import time
 from typing import Any, Optional
 
 import redis
@@ -35,6 +36,16 @@ def cache_get(key: str) -> Optional[str]:
         return None
 
 
+def cache_get_bytes(key: str) -> Optional[bytes]:
+    if not is_cache_available():
+        return None
+    try:
+        return redis_client.get(key)
+    except redis.RedisError as exc:
+        logger.warning("Redis GET failed for key %s: %s", key, exc)
+        return None
+
+
 def cache_get_json(key: str) -> Optional[Any]:
     value = cache_get(key)
     if value is None:
@@ -95,8 +106,124 @@ def cache_delete_pattern(pattern: str) -> int:
 
 def invalidate_doctor_availability_cache(doctor_id: int) -> None:
     cache_delete_pattern(f"doctor:availability:{doctor_id}*")
+    bump_generation(f"availability:{doctor_id}", "availability")
 
 
 def invalidate_doctor_search_cache() -> None:
     cache_delete_pattern("doctors:search:*")
+    bump_generation("doctors", "departments")
+
+
+# Generations: per-resource change stamps (microseconds since the epoch) used
+# as HTTP validators (utils/conditional.py). Writers bump them; a missing
+# stamp is created on first read, which only costs clients one full response.
+GENERATION_TTL = 30 * 24 * 3600
+
+
+def _generation_key(name: str) -> str:
+    return f"generation:{name}"
+
+
+def bump_generation(*names: str) -> None:
+    if not is_cache_available() or not names:
+        return
+    now = int(time.time() * 1_000_000)
+    try:
+        pipe = redis_client.pipeline()
+        for name in names:
+            pipe.setex(_generation_key(name), GENERATION_TTL, now)
+        pipe.execute()
+    except redis.RedisError as exc:
+        logger.warning("Redis generation bump failed for %s: %s", list(names), exc)
+
+
+def get_generations(names) -> Optional[list]:
+    """Current stamp of each generation, or None if Redis is unavailable"""
+    if not is_cache_available():
+        return None
+    keys = [_generation_key(name) for name in names]
+    try:
+        values = redis_client.mget(keys)
+        missing = [key for key, value in zip(keys, values) if value is None]
+        if missing:
+            now = int(time.time() * 1_000_000)
+            pipe = redis_client.pipeline()
+            for key in missing:
+                pipe.set(key, now, ex=GENERATION_TTL, nx=True)
+            pipe.execute()
+            values = redis_client.mget(keys)
+        return [int(value) for value in values]
+    except (redis.RedisError, TypeError, ValueError) as exc:
+        logger.warning("Redis generation read failed for %s: %s", list(names), exc)
+        return None
+
 
+
+def cache_set_json_tagged(key: str, value: Any, tags, ttl: int = 300) -> bool:
+    """
+    Cache a JSON value and register the key under each tag set so it can
+    be invalidated by tag without a SCAN.
+    """
+    if not is_cache_available():
+        return False
+    try:
+        serialized = json.dumps(value)
+    except (TypeError, ValueError) as exc:
+        logger.warning("Failed to serialize value for key %s: %s", key, exc)
+        return False
+    return cache_set_tagged(key, serialized, tags, ttl)
+
+
+def cache_set_tagged(key: str, value, tags, ttl: int = 300) -> bool:
+    """Cache a str/bytes value under the given tag sets (see cache_set_json_tagged)"""
+    if not is_cache_available():
+        return False
+    try:
+        pipe = redis_client.pipeline()
+        pipe.setex(key, ttl, value)
+        for tag in tags:
+            pipe.sadd(tag, key)
+            pipe.expire(tag, ttl)
+        pipe.execute()
+        return True
+    except redis.RedisError as exc:
+        logger.warning("Redis tagged SET failed for key %s: %s", key, exc)
+        return False
+
+
+def cache_invalidate_tags(tags) -> int:
+    """Delete every key registered under the given tag sets, and the tags"""
+    if not is_cache_available():
+        return 0
+    deleted = 0
+    try:
+        for tag in tags:
+            keys = redis_client.smembers(tag)
+            if keys:
+                deleted += redis_client.delete(*keys)
+            redis_client.delete(tag)
+    except redis.RedisError as exc:
+        logger.warning("Redis tag invalidation failed for %s: %s", list(tags), exc)
+    return deleted
+
+
+def doctor_search_date_tag(date_key: str) -> str:
+    """Tag for cached doctor searches filtered by available_date ('any' = unfiltered)"""
+    return f"doctors:search:tag:{date_key}"
+
+
+def invalidate_doctor_availability_dates(doctor_id: int, dates) -> None:
+    """
+    Invalidate caches affected by availability changes on specific dates:
+    the doctor's availability window and doctor searches for those dates
+    (plus unfiltered searches, which embed each doctor's availability;
+    date-filtered searches are also tagged with every date they embed).
+    """
+    dates = list(dates)
+    if not dates:
+        return
+    cache_delete(f"doctor:availability:{doctor_id}")
+    bump_generation(f"availability:{doctor_id}", "availability")
+    cache_invalidate_tags(
+        [doctor_search_date_tag('any')] + [doctor_search_date_tag(d.isoformat()) for d in dates]
+    )
@@ -0,0 +1,312 @@
+"""
+Nightly columnar extract of appointments for heavy reporting
+
+A nightly task copies appointments (both tiers) with their treatment
+diagnosis, plus the doctor and department dimensions, into a directory of
+NumPy .npy files, one per column, sorted by day. Reports and long-range
+analytics memory-map those files and aggregate them with vectorized NumPy
+operations instead of scanning the tables the booking path depends on.
+
+Columns use compact types instead of general-purpose compression, so they
+stay memory-mappable: statuses and diagnoses are dictionary-encoded into
+small integer codes, dates are datetime64[D] and times are minutes since
+midnight. 10M appointments take about 310 MB.
+
+Each run writes a new extract-<timestamp> directory and then atomically
+repoints the CURRENT file at it, so readers never see a half-written extract;
+the previous EXTRACT_KEEP extracts are kept for readers still mapping them.
+
+The extract reflects the tables when it was written (`as_of`). Callers serve
+days before as_of from it and anything newer from the database.
+
+NumPy is optional: without it, write_extract() and load_extract() return
+None and callers stay on the database.
+"""
+import json
+import logging
+import os
+import shutil
+import threading
+from datetime import date, datetime
+
+from sqlalchemy import select
+
+from database import db
+from models import Department, Doctor, User
+from utils.archive import TIERS
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+EXTRACT_DIR = os.environ.get(
+    'ANALYTICS_EXTRACT_DIR', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'extracts')
+)
+EXTRACT_BATCH_SIZE = int(os.environ.get('EXTRACT_BATCH_SIZE', '50000'))
+EXTRACT_KEEP = 2
+DIAGNOSIS_KEY_LENGTH = 50  # Diagnoses are grouped by their first 50 characters, as in the monthly report
+
+COLUMNS = ('id', 'patient_id', 'doctor_id', 'day', 'minute', 'status', 'diagnosis')
+DTYPES = {
+    'id': 'int64',
+    'patient_id': 'int32',
+    'doctor_id': 'int32',
+    'day': 'datetime64[D]',
+    'minute': 'int16',
+    'status': 'int8',
+    'diagnosis': 'int32',  # -1 when there is no treatment
+}
+
+
+def _pointer_path(directory):
+    return os.path.join(directory, 'CURRENT')
+
+
+# ==================== WRITE ====================
+
+def _appointment_batches(batch_size):
+    """Appointment rows with their diagnosis, tier by tier, in id order"""
+    for appointment_model, treatment_model in TIERS:
+        last_id = 0
+        while True:
+            rows = db.session.execute(
+                select(
+                    appointment_model.id,
+                    appointment_model.patient_id,
+                    appointment_model.doctor_id,
+                    appointment_model.appointment_date,
+                    appointment_model.appointment_time,
+                    appointment_model.status,
+                    treatment_model.diagnosis
+                ).outerjoin(
+                    treatment_model, treatment_model.appointment_id == appointment_model.id
+                ).where(appointment_model.id > last_id).order_by(appointment_model.id).limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            yield rows
+            last_id = rows[-1][0]
+
+
+def _dimensions():
+    doctors = db.session.execute(
+        select(Doctor.id, Doctor.first_name, Doctor.last_name, User.email, Doctor.specialization_id, Doctor.is_active)
+        .outerjoin(User, User.id == Doctor.user_id)
+    ).all()
+    departments = db.session.execute(select(Department.id, Department.name)).all()
+    return (
+        [
+            {'id': doctor_id, 'first_name': first_name, 'last_name': last_name, 'email': email,
+             'department_id': department_id, 'is_active': bool(is_active)}
+            for doctor_id, first_name, last_name, email, department_id, is_active in doctors
+        ],
+        [{'id': department_id, 'name': name} for department_id, name in departments],
+    )
+
+
+def write_extract(directory=EXTRACT_DIR, batch_size=EXTRACT_BATCH_SIZE):
+    """Write a new extract and make it current; returns its metadata (None without NumPy)"""
+    if np is None:
+        logger.warning("numpy not installed. Columnar extract disabled.")
+        return None
+
+    started, as_of = datetime.utcnow(), date.today()
+    statuses, diagnoses = {}, {}
+    chunks = {column: [] for column in COLUMNS}
+
+    for rows in _appointment_batches(batch_size):
+        count = len(rows)
+        chunks['id'].append(np.fromiter((row[0] for row in rows), dtype=DTYPES['id'], count=count))
+        chunks['patient_id'].append(np.fromiter((row[1] for row in rows), dtype=DTYPES['patient_id'], count=count))
+        chunks['doctor_id'].append(np.fromiter((row[2] for row in rows), dtype=DTYPES['doctor_id'], count=count))
+        chunks['day'].append(np.array([row[3] for row in rows], dtype=DTYPES['day']))
+        chunks['minute'].append(np.fromiter(
+            (row[4].hour * 60 + row[4].minute if row[4] is not None else -1 for row in rows),
+            dtype=DTYPES['minute'], count=count
+        ))
+        chunks['status'].append(np.fromiter(
+            (statuses.setdefault(row[5], len(statuses)) for row in rows), dtype=DTYPES['status'], count=count
+        ))
+        chunks['diagnosis'].append(np.fromiter(
+            (diagnoses.setdefault(row[6][:DIAGNOSIS_KEY_LENGTH], len(diagnoses)) if row[6] is not None else -1 for row in rows),
+            dtype=DTYPES['diagnosis'], count=count
+        ))
+
+    columns = {
+        column: np.concatenate(parts) if parts else np.empty(0, dtype=DTYPES[column])
+        for column, parts in chunks.items()
+    }
+    # A row archived mid-run can be read from both tiers; keep one copy
+    _, unique_rows = np.unique(columns['id'], return_index=True)
+    order = unique_rows[np.argsort(columns['day'][unique_rows], kind='stable')]
+
+    doctors, departments = _dimensions()
+    meta = {
+        'as_of': as_of.isoformat(),
+        'created_at': started.isoformat(),
+        'rows': int(order.size),
+        'statuses': list(statuses),
+        'diagnoses': list(diagnoses),
+        'doctors': doctors,
+        'departments': departments,
+    }
+
+    os.makedirs(directory, exist_ok=True)
+    name = f"extract-{started.strftime('%Y%m%d%H%M%S%f')}"
+    staging = os.path.join(directory, f".{name}.tmp")
+    os.makedirs(staging, exist_ok=True)
+    for column, values in columns.items():
+        np.save(os.path.join(staging, f"{column}.npy"), values[order])
+    with open(os.path.join(staging, 'meta.json'), 'w') as meta_file:
+        json.dump(meta, meta_file)
+    os.replace(staging, os.path.join(directory, name))
+
+    pointer = _pointer_path(directory)
+    with open(f"{pointer}.tmp", 'w') as pointer_file:
+        pointer_file.write(name)
+    os.replace(f"{pointer}.tmp", pointer)
+
+    _purge_old_extracts(directory, keep=name)
+    logger.info(f"Wrote columnar extract {name}: {meta['rows']} appointments")
+    return {'name': name, 'as_of': meta['as_of'], 'rows': meta['rows']}
+
+
+def _purge_old_extracts(directory, keep):
+    names = sorted(entry for entry in os.listdir(directory) if entry.startswith('extract-'))
+    for name in names[:-EXTRACT_KEEP]:
+        if name != keep:
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+# ==================== QUERY ====================
+
+class ColumnarExtract:
+    """Read-only, memory-mapped view of one extract with vectorized aggregations"""
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        with open(os.path.join(path, 'meta.json')) as meta_file:
+            meta = json.load(meta_file)
+        self.as_of = date.fromisoformat(meta['as_of'])
+        self.statuses = meta['statuses']
+        self.diagnoses = meta['diagnoses']
+        self.doctors = {doctor['id']: doctor for doctor in meta['doctors']}
+        self.departments = {department['id']: department['name'] for department in meta['departments']}
+        for column in COLUMNS:
+            setattr(self, column, np.load(os.path.join(path, f"{column}.npy"), mmap_mode='r'))
+
+    def _window(self, start, end):
+        """Row range for days start..end; rows are sorted by day"""
+        days = np.array([start, end], dtype='datetime64[D]')
+        low = int(np.searchsorted(self.day, days[0], side='left'))
+        high = int(np.searchsorted(self.day, days[1], side='right'))
+        return slice(low, high)
+
+    @staticmethod
+    def _buckets(days, granularity):
+        if granularity == 'day':
+            return days
+        if granularity == 'week':
+            # 1970-01-01 was a Thursday: shift each day back to its Monday
+            return days - ((days.astype('int64') + 3) % 7).astype('timedelta64[D]')
+        return days.astype('datetime64[M]').astype('datetime64[D]')
+
+    def analytics(self, start, end, granularity):
+        """
+        Chart series for start..end in the shape of utils.analytics.build_analytics(),
+        with every active doctor in top_doctors rather than the first few
+        """
+        window = self._window(start, end)
+        days, doctor_ids, statuses = self.day[window], self.doctor_id[window], self.status[window]
+
+        labels, trend_counts = np.unique(self._buckets(days, granularity), return_counts=True)
+        status_counts = np.bincount(statuses, minlength=len(self.statuses)) if statuses.size else []
+        doctor_values, doctor_counts = np.unique(doctor_ids, return_counts=True)
+
+        departments, top_doctors = {}, []
+        for doctor_id, count in zip(doctor_values.tolist(), doctor_counts.tolist()):
+            doctor = self.doctors.get(doctor_id)
+            if doctor is None:
+                continue  # Deleted since; the database queries drop these too
+            department = self.departments.get(doctor['department_id'])
+            if department is not None:
+                departments[department] = departments.get(department, 0) + count
+            if doctor['is_active']:
+                top_doctors.append({
+                    'id': doctor_id,
+                    'first_name': doctor['first_name'],
+                    'last_name': doctor['last_name'],
+                    'full_name': f"{doctor['first_name']} {doctor['last_name']}",
+                    'email': doctor['email'],
+                    'specialization': department or 'N/A',
+                    'appointment_count': count
+                })
+
+        ranked_departments = sorted(departments.items(), key=lambda item: item[1], reverse=True)
+        return {
+            'appointment_trends': {
+                'labels': [str(label) for label in labels],
+                'data': trend_counts.tolist()
+            },
+            'specialization_demand': {
+                'labels': [name for name, _ in ranked_departments],
+                'data': [count for _, count in ranked_departments]
+            },
+            'status_distribution': {
+                'labels': [status for status, count in zip(self.statuses, status_counts) if count],
+                'data': [int(count) for count in status_counts if count]
+            },
+            'top_doctors': sorted(top_doctors, key=lambda doctor: (-doctor['appointment_count'], doctor['id'])),
+        }
+
+    def doctor_summary(self, doctor_id, start, end):
+        """Monthly report statistics and diagnosis summary for one doctor"""
+        window = self._window(start, end)
+        mine = self.doctor_id[window] == doctor_id
+        statuses = np.bincount(self.status[window][mine], minlength=len(self.statuses))
+        by_status = dict(zip(self.statuses, statuses.tolist()))
+        diagnoses = self.diagnosis[window][mine]
+        treated = diagnoses[diagnoses >= 0]
+        codes, counts = np.unique(treated, return_counts=True)
+        return {
+            'statistics': {
+                'total_appointments': int(mine.sum()),
+                'completed': by_status.get('Completed', 0),
+                'cancelled': by_status.get('Cancelled', 0),
+                'booked': by_status.get('Booked', 0),
+                'unique_patients': int(np.unique(self.patient_id[window][mine]).size),
+                'treatments_provided': int(treated.size)
+            },
+            'diagnosis_summary': {
+                self.diagnoses[code]: count for code, count in zip(codes.tolist(), counts.tolist()) if self.diagnoses[code]
+            },
+        }
+
+
+_loaded = None
+_load_lock = threading.Lock()
+
+
+def load_extract(directory=EXTRACT_DIR):
+    """The current extract (reloaded when a newer one is written), or None"""
+    global _loaded
+    if np is None:
+        return None
+    try:
+        with open(_pointer_path(directory)) as pointer_file:
+            name = pointer_file.read().strip()
+    except FileNotFoundError:
+        return None
+
+    with _load_lock:
+        if _loaded is None or _loaded.name != name:
+            try:
+                _loaded = ColumnarExtract(os.path.join(directory, name))
+            except (OSError, ValueError) as exc:
+                logger.warning("Could not load columnar extract %s: %s", name, exc)
+                return None
+        return _loaded
@@ -0,0 +1,190 @@
+"""
+Response compression (gzip/brotli) and pre-compressed cached responses
+
+init_compression() registers an after_request hook that compresses JSON,
+CSV, text and event-stream responses for clients that send Accept-Encoding:
+- brotli when the client accepts it and the brotli package is installed,
+  otherwise gzip
+- bodies under COMPRESS_MIN_SIZE bytes are sent as they are (compressing a
+  small error or 304-sized body costs more CPU than it saves on the wire)
+- streamed responses (live updates) are compressed chunk by chunk, flushing
+  after each chunk so every event still reaches the client immediately
+- responses that are already encoded, file downloads (send_file), HEAD
+  requests and Cache-Control: no-transform are left alone
+Compressed responses carry Vary: Accept-Encoding, and a strong ETag becomes
+weak (the bytes differ per encoding; the content does not).
+
+Cached responses are stored in Redis already gzipped (cache_response()), so
+a cache hit goes out as stored to clients that accept gzip (nearly all)
+without serializing or compressing anything; other clients get it
+decompressed. Brotli is only used for responses built per request.
+
+RESPONSE_COMPRESSION=0 turns compression off. brotli is optional.
+benchmarks/bench_compression.py reports bytes on the wire and CPU per request.
+"""
+import gzip
+import logging
+import os
+import zlib
+
+from flask import current_app, request
+
+from utils.cache import cache_get_bytes, cache_set_tagged
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_COMPRESSION = os.environ.get('RESPONSE_COMPRESSION', '1') != '0'
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', '1024'))  # Bytes
+COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', '6'))  # gzip, per request
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '4'))  # brotli, per request
+COMPRESS_CACHE_LEVEL = 9  # gzip for cached responses: compressed once, served many times
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json', 'text/csv', 'text/plain', 'text/html', 'text/event-stream',
+}
+ENCODINGS = ['br', 'gzip'] if brotli is not None else ['gzip']
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+# ==================== COMPRESSORS ====================
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=COMPRESS_LEVEL, mtime=0)
+
+
+class _StreamCompressor:
+    """Incremental gzip/brotli that flushes after every chunk"""
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._brotli = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._zlib = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip container
+
+    def chunk(self, data):
+        if self.encoding == 'br':
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.encoding == 'br':
+            return self._brotli.finish()
+        return self._zlib.flush()
+
+
+class CompressedStream:
+    """Wraps a streamed response body; closing it closes the original body"""
+
+    def __init__(self, chunks, encoding):
+        self.chunks = chunks
+        self.encoding = encoding
+
+    def __iter__(self):
+        compressor = _StreamCompressor(self.encoding)
+        for chunk in self.chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = compressor.chunk(chunk)
+            if data:
+                yield data
+        yield compressor.finish()
+
+    def close(self):
+        close = getattr(self.chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+# ==================== MIDDLEWARE ====================
+
+def _should_compress(response):
+    return (
+        200 <= response.status_code < 300
+        and response.status_code not in (204, 206)
+        and request.method != 'HEAD'
+        and response.mimetype in COMPRESSIBLE_MIMETYPES
+        and not response.direct_passthrough
+        and 'Content-Encoding' not in response.headers
+        and 'no-transform' not in response.headers.get('Cache-Control', '')
+    )
+
+
+def _mark_encoded(response, encoding):
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+
+
+def compress_response(response):
+    if not _should_compress(response):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = request.accept_encodings.best_match(ENCODINGS)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = CompressedStream(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        body = response.get_data()
+        if len(body) < COMPRESS_MIN_SIZE:
+            return response
+        response.set_data(compress(body, encoding))
+    _mark_encoded(response, encoding)
+    return response
+
+
+def init_compression(app):
+    """Register the compression hook on the app (no-op when RESPONSE_COMPRESSION=0)"""
+    if not RESPONSE_COMPRESSION:
+        logger.info("Response compression disabled")
+        return
+    app.after_request(compress_response)
+
+
+# ==================== PRE-COMPRESSED CACHE ====================
+
+def compress_for_cache(payload):
+    """Gzipped JSON body (as jsonify() would send it) for storing in the cache"""
+    body = current_app.json.dumps(payload).encode('utf-8') + b"\n"
+    return gzip.compress(body, compresslevel=COMPRESS_CACHE_LEVEL, mtime=0)
+
+
+def precompressed_response(gzipped):
+    """JSON response from a compress_for_cache() body, sent as is when the client accepts gzip"""
+    response = current_app.response_class(mimetype=current_app.json.mimetype)
+    response.vary.add('Accept-Encoding')
+    if RESPONSE_COMPRESSION and request.accept_encodings.quality('gzip') > 0:
+        response.set_data(gzipped)
+        _mark_encoded(response, 'gzip')
+    else:
+        response.set_data(gzip.decompress(gzipped))
+    return response
+
+
+def cache_response(key, payload, tags, ttl=300):
+    """Cache a JSON payload gzipped, registered under `tags` (see cache_set_tagged)"""
+    try:
+        gzipped = compress_for_cache(payload)
+    except (TypeError, ValueError) as exc:
+        logger.warning("Failed to serialize value for key %s: %s", key, exc)
+        return False
+    return cache_set_tagged(key, gzipped, tags, ttl)
+
+
+def cached_response(key):
+    """Response for a cache_response() entry, or None on a miss"""
+    gzipped = cache_get_bytes(key)
+    if not gzipped or not gzipped.startswith(GZIP_MAGIC):
+        return None  # Missing, or written by an older release as plain JSON
+    return precompressed_response(gzipped)
@@ -0,0 +1,138 @@
+"""
+HTTP conditional GETs (ETag / Last-Modified) for read-heavy routes
+
+The frontend re-fetches department lists, doctor details, availability and
+history on every navigation. @conditional works out a validator for the
+response from cheap inputs *before* the view runs:
+- generations: change stamps kept in Redis per resource ("doctors",
+  "appointments:patient:7", ...; see bump_generation() in utils/cache.py),
+  bumped by every write that changes what the route returns
+- rows: updated_at values of rows the caller already has loaded
+- the date, for routes whose output moves at midnight (upcoming/past splits)
+
+The ETag hashes those with the path, query string and caller; Last-Modified
+is the newest of them. When the request's If-None-Match (or, without one,
+If-Modified-Since) still matches, the route answers 304 without querying or
+serializing anything. Otherwise the view runs as before and its 200 response
+gets the validators and the route's Cache-Control policy.
+
+Appointment events bump the generations of the doctor, the patient and the
+global appointment list through an in-process outbox consumer
+(bump_generations_for_event). If Redis is unavailable, responses carry no
+validators and every request gets a full 200.
+"""
+import hashlib
+import logging
+from datetime import date, datetime, time, timezone
+from functools import wraps
+
+from flask import current_app, request
+from werkzeug.http import is_resource_modified
+
+from utils.cache import bump_generation, get_generations
+
+logger = logging.getLogger(__name__)
+
+NO_CACHE = 'private, no-cache'  # Revalidate every time; the default for anything that changes with bookings
+SHORT_CACHE = 'private, max-age=60'  # Reference data: reuse for a minute, then revalidate
+
+
+# ==================== GENERATION NAMES ====================
+# Callables take the view's keyword arguments (including current_user)
+
+def own_patient_appointments(current_user, **kwargs):
+    return f"appointments:patient:{current_user.patient_profile.id}"
+
+
+def own_doctor_appointments(current_user, **kwargs):
+    return f"appointments:doctor:{current_user.doctor_profile.id}"
+
+
+def own_doctor_availability(current_user, **kwargs):
+    return f"availability:{current_user.doctor_profile.id}"
+
+
+def patient_appointments(current_user, patient_id=None, **kwargs):
+    """The patient_id route argument, or the caller's own record"""
+    if patient_id is None:
+        patient_id = current_user.patient_profile.id
+    return f"appointments:patient:{patient_id}"
+
+
+def doctor_availability(current_user, doctor_id, **kwargs):
+    return f"availability:{doctor_id}"
+
+
+def bump_generations_for_event(message):
+    """In-process outbox consumer: an appointment was booked, changed or cancelled"""
+    payload = message['payload']
+    names = ['appointments']
+    if payload.get('doctor_id'):
+        names += [f"appointments:doctor:{payload['doctor_id']}", f"availability:{payload['doctor_id']}", 'availability']
+    if payload.get('patient_id'):
+        names.append(f"appointments:patient:{payload['patient_id']}")
+    bump_generation(*names)
+
+
+def bump_appointment_generations(appointment):
+    """For appointment writes that emit no event (treatment edits)"""
+    bump_generation(
+        'appointments',
+        f"appointments:doctor:{appointment.doctor_id}",
+        f"appointments:patient:{appointment.patient_id}"
+    )
+
+
+# ==================== DECORATOR ====================
+
+def _as_datetime(value):
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    if isinstance(value, date):
+        return datetime.combine(value, time.min, tzinfo=timezone.utc)
+    return datetime.fromtimestamp(value / 1_000_000, tz=timezone.utc)  # Generation stamp
+
+
+def conditional(*generations, rows=None, daily=False, cache_control=NO_CACHE):
+    """
+    Answer 304 when the client's copy is current. `generations` are names or
+    callables returning names; `rows` is a callable returning updated_at
+    values; `daily` adds today's date. Place below the role decorator.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                names = [name(**kwargs) if callable(name) else name for name in generations]
+                parts = get_generations(names) if names else []
+                if parts is not None:
+                    parts += [value for value in (rows(**kwargs) if rows else []) if value is not None]
+                    if daily:
+                        parts.append(date.today())
+            except Exception as exc:
+                logger.warning("No validators for %s: %s", request.endpoint, exc)
+                parts = None
+            if parts is None:
+                return view(*args, **kwargs)  # Redis down or no profile: plain response
+
+            current_user = kwargs.get('current_user')
+            identity = '|'.join([
+                request.path, request.query_string.decode('latin-1'),
+                str(current_user.id if current_user is not None else ''),
+            ] + [str(part) for part in parts])
+            etag = hashlib.sha1(identity.encode()).hexdigest()
+            last_modified = max((_as_datetime(part) for part in parts), default=None)
+
+            if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            response.headers['Cache-Control'] = cache_control
+            return response
+        return wrapper
+    return decorator
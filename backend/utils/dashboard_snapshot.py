@@ -0,0 +1,289 @@
+"""
+Per-doctor dashboard snapshot cache with write-through updates
+
+The doctor dashboard (counts, today's and this week's booked appointments,
+recent patients) is kept in Redis under dashboard:doctor:<id>:<date>, so a
+dashboard load is a single cache fetch. The snapshot is built with four
+queries on a miss and then kept current by apply_appointment_event(), which
+runs in the web process right after every appointment write commits (it is
+registered as an in-process outbox consumer) and patches the snapshot in
+place instead of dropping it.
+
+Writers update the snapshot in a WATCH/MULTI transaction and bump a per-doctor
+version key; a rebuild only stores its result if the version did not move
+while it was querying, so a rebuild racing a write never caches stale data.
+"""
+import json
+import logging
+import os
+from datetime import date, datetime, timedelta
+
+import redis
+from sqlalchemy import case, desc, func
+from sqlalchemy.orm import joinedload
+
+from database import db
+from models import Appointment, ArchivedAppointment, Patient
+from utils.archive import archived_status_counts
+from utils.cache import redis_client, is_cache_available
+
+logger = logging.getLogger(__name__)
+
+DASHBOARD_CACHE_TTL = int(os.environ.get('DASHBOARD_CACHE_TTL', '600'))  # Bounds staleness from non-event edits
+VERSION_TTL = 7 * 24 * 3600
+RECENT_PATIENTS_LIMIT = 20
+UPCOMING_DAYS = 7
+WRITE_RETRIES = 3
+
+
+def _snapshot_key(doctor_id, day):
+    return f"dashboard:doctor:{doctor_id}:{day.isoformat()}"
+
+
+def _version_key(doctor_id):
+    return f"dashboard:doctor:{doctor_id}:version"
+
+
+def _appointment_query():
+    return Appointment.query.options(
+        joinedload(Appointment.patient).joinedload(Patient.user),
+        joinedload(Appointment.doctor),
+        joinedload(Appointment.treatment)
+    )
+
+
+# ==================== BUILD ====================
+
+def build_doctor_snapshot(doctor_id, today=None):
+    """Query the snapshot from the database"""
+    from utils.live_updates import latest_event_id
+
+    today = today or date.today()
+    week_end = today + timedelta(days=UPCOMING_DAYS)
+    last_event_id = latest_event_id()  # Before the queries: replay from here covers anything they miss
+
+    # This week's booked appointments (today's are a subset)
+    upcoming = _appointment_query().filter(
+        Appointment.doctor_id == doctor_id,
+        Appointment.appointment_date >= today,
+        Appointment.appointment_date <= week_end,
+        Appointment.status == 'Booked'
+    ).order_by(Appointment.appointment_date, Appointment.appointment_time).all()
+
+    # All counts in one grouped pass over the doctor's hot rows
+    totals = db.session.query(
+        Appointment.status,
+        func.count(Appointment.id),
+        func.sum(case((Appointment.appointment_date == today, 1), else_=0))
+    ).filter(Appointment.doctor_id == doctor_id).group_by(Appointment.status).all()
+    hot_counts = {status: count for status, count, _ in totals}
+    completed_today = next((int(on_day or 0) for status, _, on_day in totals if status == 'Completed'), 0)
+    archived_counts = archived_status_counts(doctor_id)  # Cached until the next archival run
+
+    # Most recently seen patients; the archive only holds older visits
+    last_dates = {}
+    for model in (Appointment, ArchivedAppointment):
+        remaining = RECENT_PATIENTS_LIMIT - len(last_dates)
+        if remaining <= 0:
+            break
+        last_visit = func.max(model.appointment_date).label('last_visit')
+        query = db.session.query(model.patient_id, last_visit).filter(model.doctor_id == doctor_id)
+        if last_dates:
+            query = query.filter(model.patient_id.notin_(list(last_dates)))
+        for patient_id, last in query.group_by(model.patient_id).order_by(desc(last_visit)).limit(remaining).all():
+            last_dates[patient_id] = last.isoformat() if hasattr(last, 'isoformat') else str(last)
+    patients = Patient.query.options(joinedload(Patient.user)).filter(Patient.id.in_(list(last_dates))).all() \
+        if last_dates else []
+
+    snapshot = {
+        'date': today.isoformat(),
+        'last_event_id': last_event_id,
+        'today_appointments': [apt.to_dict() for apt in upcoming if apt.appointment_date == today],
+        'upcoming_appointments': [apt.to_dict() for apt in upcoming],
+        'completed_today': completed_today,
+        'total_appointments': sum(hot_counts.values()) + sum(archived_counts.values()),
+        'completed_appointments': hot_counts.get('Completed', 0) + archived_counts.get('Completed', 0),
+        'recent_patients': [
+            {'patient': patient.to_dict(), 'last_visit': last_dates[patient.id]} for patient in patients
+        ],
+    }
+    _sort_recent(snapshot)
+    return snapshot
+
+
+def get_doctor_snapshot(doctor_id):
+    """The cached snapshot for today, built and stored on a miss"""
+    today = date.today()
+    key = _snapshot_key(doctor_id, today)
+    if not is_cache_available():
+        return build_doctor_snapshot(doctor_id, today)
+
+    try:
+        cached = redis_client.get(key)
+        if cached is not None:
+            return json.loads(cached)
+        version = redis_client.get(_version_key(doctor_id))
+    except redis.RedisError as exc:
+        logger.warning("Redis read failed for dashboard snapshot %s: %s", key, exc)
+        return build_doctor_snapshot(doctor_id, today)
+
+    snapshot = build_doctor_snapshot(doctor_id, today)
+    try:
+        with redis_client.pipeline() as pipe:
+            pipe.watch(_version_key(doctor_id))
+            if pipe.get(_version_key(doctor_id)) == version:
+                pipe.multi()
+                pipe.setex(key, DASHBOARD_CACHE_TTL, json.dumps(snapshot))
+                pipe.execute()
+    except redis.WatchError:
+        pass  # A write landed while building; the next read rebuilds
+    except redis.RedisError as exc:
+        logger.warning("Redis write failed for dashboard snapshot %s: %s", key, exc)
+    return snapshot
+
+
+# ==================== WRITE-THROUGH ====================
+
+def _parse_date(value):
+    if value is None:
+        return None
+    return value if isinstance(value, date) else datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+
+
+def _sort_recent(snapshot):
+    snapshot['recent_patients'].sort(key=lambda entry: entry['last_visit'], reverse=True)
+    del snapshot['recent_patients'][RECENT_PATIENTS_LIMIT:]
+
+
+def _apply(snapshot, appointment_id, old, new, event_id):
+    """
+    Patch the snapshot for one appointment going from `old` to `new`.
+    Each is (date, status), or None for a new / no longer visible appointment;
+    `new` also carries the appointment and patient dicts.
+    """
+    today = date.fromisoformat(snapshot['date'])
+    week_end = today + timedelta(days=UPCOMING_DAYS)
+
+    def completed_on_today(version):
+        return bool(version and version[1] == 'Completed' and version[0] == today)
+
+    def completed(version):
+        return bool(version and version[1] == 'Completed')
+
+    snapshot['completed_today'] += completed_on_today(new) - completed_on_today(old)
+    snapshot['completed_appointments'] += completed(new) - completed(old)
+    if old is None and new is not None:
+        snapshot['total_appointments'] += 1
+
+    for list_name in ('today_appointments', 'upcoming_appointments'):
+        snapshot[list_name] = [apt for apt in snapshot[list_name] if apt['id'] != appointment_id]
+    if new is not None and new[1] == 'Booked':
+        appointment_dict = new[2]
+        if new[0] == today:
+            snapshot['today_appointments'].append(appointment_dict)
+            snapshot['today_appointments'].sort(key=lambda apt: apt['appointment_time'] or '')
+        if today <= new[0] <= week_end:
+            snapshot['upcoming_appointments'].append(appointment_dict)
+            snapshot['upcoming_appointments'].sort(
+                key=lambda apt: (apt['appointment_date'] or '', apt['appointment_time'] or '')
+            )
+
+    if new is not None and new[3] is not None:
+        patient_dict = new[3]
+        entries = {entry['patient']['id']: entry for entry in snapshot['recent_patients']}
+        entry = entries.get(patient_dict['id'])
+        visit = new[0].isoformat()
+        if entry is None:
+            snapshot['recent_patients'].append({'patient': patient_dict, 'last_visit': visit})
+        else:
+            entry['patient'] = patient_dict
+            entry['last_visit'] = max(entry['last_visit'], visit)
+        _sort_recent(snapshot)
+
+    snapshot['last_event_id'] = max(snapshot.get('last_event_id') or 0, event_id)
+
+
+def _write_through(doctor_id, patch):
+    """Apply `patch(snapshot)` to today's cached snapshot, if there is one, atomically"""
+    if not is_cache_available():
+        return
+    key = _snapshot_key(doctor_id, date.today())
+    version_key = _version_key(doctor_id)
+    try:
+        with redis_client.pipeline() as pipe:
+            for _ in range(WRITE_RETRIES):
+                try:
+                    pipe.watch(key)
+                    cached = pipe.get(key)
+                    ttl = pipe.ttl(key)
+                    pipe.multi()
+                    if cached is not None:
+                        snapshot = json.loads(cached)
+                        patch(snapshot)
+                        pipe.setex(key, ttl if ttl and ttl > 0 else DASHBOARD_CACHE_TTL, json.dumps(snapshot))
+                    pipe.incr(version_key)  # Fences off rebuilds that started before this write
+                    pipe.expire(version_key, VERSION_TTL)
+                    pipe.execute()
+                    return
+                except redis.WatchError:
+                    continue
+        logger.info("Dashboard snapshot %s contended, dropping it", key)
+    except redis.RedisError as exc:
+        logger.warning("Redis write-through failed for dashboard snapshot %s: %s", key, exc)
+        return
+    except Exception as exc:
+        logger.warning("Could not patch dashboard snapshot %s, dropping it: %s", key, exc)
+    invalidate_doctor_snapshot(doctor_id)
+
+
+def invalidate_doctor_snapshot(doctor_id):
+    """Drop today's snapshot; the next dashboard load rebuilds it"""
+    if not is_cache_available():
+        return
+    try:
+        pipe = redis_client.pipeline()
+        pipe.delete(_snapshot_key(doctor_id, date.today()))
+        pipe.incr(_version_key(doctor_id))
+        pipe.expire(_version_key(doctor_id), VERSION_TTL)
+        pipe.execute()
+    except redis.RedisError as exc:
+        logger.warning("Redis delete failed for dashboard snapshot of doctor %s: %s", doctor_id, exc)
+
+
+def apply_appointment_event(message):
+    """In-process outbox consumer: patch the doctor's snapshot for one committed appointment change"""
+    payload = message['payload']
+    appointment = _appointment_query().filter(Appointment.id == message['aggregate_id']).first()
+
+    old = None
+    if payload.get('previous_status') is not None:
+        old = (_parse_date(payload.get('previous_date') or payload.get('appointment_date')), payload['previous_status'])
+    new = None
+    if appointment is not None:
+        new = (
+            _parse_date(appointment.appointment_date),
+            appointment.status,
+            appointment.to_dict(),
+            appointment.patient.to_dict() if appointment.patient else None
+        )
+
+    _write_through(payload['doctor_id'], lambda snapshot: _apply(snapshot, message['aggregate_id'], old, new, message['id']))
+
+
+def snapshot_response(snapshot):
+    """Dashboard fields derived from a snapshot"""
+    assigned_patients = [entry['patient'] for entry in snapshot['recent_patients']]
+    return {
+        'last_event_id': snapshot['last_event_id'],
+        'statistics': {
+            'appointments_today': len(snapshot['today_appointments']),
+            'completed_today': snapshot['completed_today'],
+            'upcoming_this_week': len(snapshot['upcoming_appointments']),
+            'total_patients': len(assigned_patients),
+            'total_appointments': snapshot['total_appointments'],
+            'completed_appointments': snapshot['completed_appointments']
+        },
+        'today_appointments': snapshot['today_appointments'],
+        'upcoming_appointments': snapshot['upcoming_appointments'],
+        'assigned_patients': assigned_patients
+    }
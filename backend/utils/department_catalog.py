@@ -0,0 +1,165 @@
+"""
+In-process department catalog with precomputed doctor counts
+
+Department.to_dict() counts the department's doctors with its own query,
+and the patient department list ran a second count (active doctors) per
+department, so every dashboard and department list load cost 1 + 2N
+queries. The catalog loads all departments with both counts in one
+GROUP BY statement and keeps the resulting dicts in process memory; the
+department routes and dashboards serve them without touching the database.
+
+The catalog is dropped when a session commits a department insert, update
+or delete, or a doctor insert, delete or change of department or active
+flag (ORM events, as for the suggest index), and rebuilt on the next read.
+Writes made by other worker processes are picked up after
+DEPARTMENT_CATALOG_TTL seconds, the same window the department routes
+already allow clients to cache for (Cache-Control max-age=60). A lookup
+of an unknown id rebuilds early, at most once per
+DEPARTMENT_CATALOG_MISS_INTERVAL seconds.
+
+Returned dicts are shared: copy one before adding keys to it.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import case, event, func, inspect, select
+from sqlalchemy.orm import Session
+
+from database import db
+from models import Department, Doctor
+
+logger = logging.getLogger(__name__)
+
+DEPARTMENT_CATALOG_TTL = int(os.environ.get('DEPARTMENT_CATALOG_TTL', '60'))  # seconds
+# Least time between rebuilds forced by lookups of unknown department ids
+DEPARTMENT_CATALOG_MISS_INTERVAL = float(os.environ.get('DEPARTMENT_CATALOG_MISS_INTERVAL', '5'))  # seconds
+
+
+class DepartmentCatalog:
+    """All departments as Department.to_dict() dicts, plus active doctor counts"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._departments: List[dict] = []
+        self._with_active_counts: List[dict] = []
+        self._by_id: Dict[int, dict] = {}
+        self._built_at: Optional[float] = None
+        self._miss_rebuilt_at: Optional[float] = None
+        self._version = 0  # Bumped by invalidate(); a rebuild that raced one is not marked fresh
+
+    def is_stale(self) -> bool:
+        built_at = self._built_at
+        return built_at is None or time.monotonic() - built_at > DEPARTMENT_CATALOG_TTL
+
+    def rebuild(self) -> None:
+        """Load every department with its doctor counts (requires app context)"""
+        start = time.perf_counter()
+        version = self._version
+        rows = db.session.execute(
+            select(
+                Department.id, Department.name, Department.category, Department.description,
+                Department.created_at,
+                func.count(Doctor.id),
+                func.count(case((Doctor.is_active == True, Doctor.id)))
+            ).outerjoin(
+                Doctor, Doctor.specialization_id == Department.id
+            ).group_by(Department.id).order_by(Department.id)
+        ).all()
+
+        departments, with_active_counts = [], []
+        for department_id, name, category, description, created_at, doctors_count, active_count in rows:
+            department = {
+                'id': department_id,
+                'name': name,
+                'category': category,
+                'description': description,
+                'doctors_count': doctors_count,
+                'created_at': created_at.isoformat() if created_at else None
+            }
+            departments.append(department)
+            with_active_counts.append({**department, 'active_doctors_count': active_count})
+
+        with self._lock:
+            self._departments = departments
+            self._with_active_counts = with_active_counts
+            self._by_id = {department['id']: department for department in departments}
+            self._built_at = time.monotonic() if version == self._version else None
+        logger.info("Rebuilt department catalog (%d departments) in %.1f ms",
+                    len(departments), (time.perf_counter() - start) * 1000)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._version += 1
+            self._built_at = None
+
+    def _fresh(self) -> None:
+        if self.is_stale():
+            self.rebuild()
+
+    def departments(self, active_counts: bool = False) -> List[dict]:
+        """Every department in id order; with active_counts, each also has 'active_doctors_count'"""
+        self._fresh()
+        return self._with_active_counts if active_counts else self._departments
+
+    def get(self, department_id: int) -> Optional[dict]:
+        """One department's dict, or None if it does not exist"""
+        self._fresh()
+        department = self._by_id.get(department_id)
+        if department is None and self._may_rebuild_for_miss():
+            self.rebuild()  # Possibly created by another worker since the last build
+            department = self._by_id.get(department_id)
+        return department
+
+    def _may_rebuild_for_miss(self) -> bool:
+        """Allow at most one miss-driven rebuild per DEPARTMENT_CATALOG_MISS_INTERVAL,
+        so repeated lookups of a nonexistent id cannot rebuild on every request"""
+        now = time.monotonic()
+        with self._lock:
+            last = self._miss_rebuilt_at
+            if last is not None and now - last < DEPARTMENT_CATALOG_MISS_INTERVAL:
+                return False
+            self._miss_rebuilt_at = now
+            return True
+
+    def count(self) -> int:
+        self._fresh()
+        return len(self._departments)
+
+
+department_catalog = DepartmentCatalog()
+
+
+# ==================== INVALIDATION ====================
+
+def _catalog_changed(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        session.info['department_catalog_dirty'] = True
+
+
+def _doctor_updated(mapper, connection, target):
+    """Only department moves and (de)activations change the counts"""
+    state = inspect(target)
+    if state.attrs.specialization_id.history.has_changes() or state.attrs.is_active.history.has_changes():
+        _catalog_changed(mapper, connection, target)
+
+
+for _event in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(Department, _event, _catalog_changed)
+event.listen(Doctor, 'after_insert', _catalog_changed)
+event.listen(Doctor, 'after_delete', _catalog_changed)
+event.listen(Doctor, 'after_update', _doctor_updated)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_department_catalog(session):
+    if session.info.pop('department_catalog_dirty', False):
+        department_catalog.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_department_catalog_changes(session):
+    session.info.pop('department_catalog_dirty', None)
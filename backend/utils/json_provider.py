@@ -0,0 +1,69 @@
+"""
+orjson-backed JSON provider for jsonify() and request.get_json()
+
+Serializing large appointment/history lists with the standard library json
+module is a big share of a list endpoint's CPU time. OrjsonProvider swaps
+in orjson, which writes bytes straight into the response without the
+intermediate str. Output matches the default provider:
+- dates, times and datetimes still go through Flask's default hook (HTTP
+  date strings), so no response changes shape; routes format their own
+  dates as before (to_dict() / utils/appointment_rows.py)
+- Decimal, UUID, dataclasses and __html__ objects use the same hook
+- non-string dict keys are allowed, as with json.dumps
+Keys keep the order the route built them in (sort_keys = False) and output
+is indented in debug mode, as with the default provider.
+
+orjson is optional: without it init_json_provider() keeps Flask's default
+provider. JSON_PROVIDER=default also keeps it.
+"""
+import logging
+import os
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+JSON_PROVIDER = os.environ.get('JSON_PROVIDER', 'orjson')
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """DefaultJSONProvider with orjson doing the encoding and decoding"""
+
+    sort_keys = False
+
+    def _options(self, indent=False):
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if indent:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps_bytes(self, obj, indent=False):
+        return orjson.dumps(obj, default=self.default, option=self._options(indent))
+
+    def dumps(self, obj, **kwargs):
+        return self.dumps_bytes(obj, indent=bool(kwargs.get('indent'))).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(self.dumps_bytes(obj, indent) + b"\n", mimetype=self.mimetype)
+
+
+def init_json_provider(app):
+    """Use OrjsonProvider for the app when orjson is installed"""
+    if JSON_PROVIDER != 'orjson':
+        return
+    if orjson is None:
+        logger.warning("orjson is not installed; using the standard library JSON provider")
+        return
+    app.json = OrjsonProvider(app)
@@ -0,0 +1,305 @@
+"""
+Live appointment updates for dashboards over Server-Sent Events
+
+Dashboards load a snapshot once (GET /api/doctor/dashboard, /api/admin/dashboard)
+and then apply deltas streamed from GET /api/live/appointments instead of
+polling. Every outbox event (utils/outbox.py) becomes one delta, published to
+the doctor's channel and to the hospital-wide channel. The SSE event id is the
+outbox event id, so a reconnecting client sends Last-Event-ID and gets the
+deltas it missed replayed from the outbox (or a `resync` event telling it to
+reload the snapshot when the gap is too old or too large).
+
+Fan-out goes through Redis pub/sub (LIVE_UPDATES_BROKER=redis, the default),
+fed by the tasks.event_tasks.publish_live_update consumer, so every web
+process sees every change. LIVE_UPDATES_BROKER=memory uses an in-process
+broker instead, fed straight from the request that made the change; it only
+suits a single-process dev server.
+
+Each delta carries the appointment's current state: clients upsert it by id,
+so a delta delivered twice (replay overlapping the live feed) is harmless.
+
+EventSource cannot send an Authorization header, and an access token in the
+URL would end up in access logs, proxy logs and browser history. Clients
+POST /api/live/tickets with their token instead and open the stream with
+?ticket=<ticket>: a random value that is valid for STREAM_TICKET_TTL seconds
+and can be redeemed once. Tickets are kept by the broker (Redis, or process
+memory for LIVE_UPDATES_BROKER=memory).
+"""
+import json
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
+
+from database import db
+from models import Appointment, OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+LIVE_UPDATES_BROKER = os.environ.get('LIVE_UPDATES_BROKER', 'redis')
+LIVE_HEARTBEAT_SECONDS = float(os.environ.get('LIVE_HEARTBEAT_SECONDS', '15'))
+LIVE_STREAM_MAX_SECONDS = float(os.environ.get('LIVE_STREAM_MAX_SECONDS', '600'))  # Client reconnects after this
+LIVE_REPLAY_LIMIT = int(os.environ.get('LIVE_REPLAY_LIMIT', '500'))
+LIVE_RETRY_MS = 3000
+STREAM_TICKET_TTL = int(os.environ.get('STREAM_TICKET_TTL', '30'))  # seconds
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+ALL_CHANNEL = 'live:appointments:all'
+
+
+def doctor_channel(doctor_id):
+    return f'live:appointments:doctor:{doctor_id}'
+
+
+# ==================== BROKERS ====================
+
+class InMemoryBroker:
+    """Process-local fan-out: one bounded queue per subscriber"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}  # channel -> set of Subscription
+        self._tickets = {}  # ticket -> (user id, expiry)
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.push(message)
+        return len(subscribers)
+
+    def subscribe(self, channels):
+        subscription = InMemoryBroker.Subscription(self, channels)
+        with self._lock:
+            for channel in channels:
+                self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def store_ticket(self, ticket, user_id, ttl):
+        now = time.monotonic()
+        with self._lock:
+            self._tickets = {key: value for key, value in self._tickets.items() if value[1] > now}
+            self._tickets[ticket] = (user_id, now + ttl)
+
+    def redeem_ticket(self, ticket):
+        with self._lock:
+            user_id, expires = self._tickets.pop(ticket, (None, 0))
+        return user_id if expires > time.monotonic() else None
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[channel]
+
+    class Subscription:
+        def __init__(self, broker, channels):
+            self.broker = broker
+            self.channels = list(channels)
+            self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+            self.overflowed = False
+
+        def push(self, message):
+            try:
+                self.queue.put_nowait(message)
+            except queue.Full:
+                self.overflowed = True  # Too slow: the stream tells the client to resync
+
+        def get(self, timeout):
+            try:
+                return self.queue.get(timeout=timeout)
+            except queue.Empty:
+                return None
+
+        def close(self):
+            self.broker._unsubscribe(self)
+
+
+class RedisBroker:
+    """Redis pub/sub fan-out shared by every web process"""
+
+    def publish(self, channel, message):
+        from utils.cache import redis_client
+        return redis_client.publish(channel, message)
+
+    def subscribe(self, channels):
+        from utils.cache import redis_client
+        pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(*channels)  # Raises redis.RedisError when Redis is down
+        return RedisBroker.Subscription(pubsub)
+
+    def store_ticket(self, ticket, user_id, ttl):
+        from utils.cache import redis_client
+        redis_client.set(_ticket_key(ticket), user_id, ex=ttl)
+
+    def redeem_ticket(self, ticket):
+        from utils.cache import redis_client
+        pipe = redis_client.pipeline()  # MULTI: only one redeemer sees the value
+        pipe.get(_ticket_key(ticket))
+        pipe.delete(_ticket_key(ticket))
+        user_id, _ = pipe.execute()
+        return int(user_id) if user_id is not None else None
+
+    class Subscription:
+        overflowed = False
+
+        def __init__(self, pubsub):
+            self.pubsub = pubsub
+
+        def get(self, timeout):
+            message = self.pubsub.get_message(timeout=timeout)
+            if message is None:
+                return None
+            data = message['data']
+            return data.decode('utf-8') if isinstance(data, bytes) else data
+
+        def close(self):
+            self.pubsub.close()
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        _broker = InMemoryBroker() if LIVE_UPDATES_BROKER == 'memory' else RedisBroker()
+    return _broker
+
+
+# ==================== STREAM TICKETS ====================
+
+def _ticket_key(ticket):
+    return f'live:ticket:{ticket}'
+
+
+def issue_stream_ticket(user_id):
+    """Single-use ticket that opens one stream for user_id within STREAM_TICKET_TTL seconds"""
+    ticket = secrets.token_urlsafe(32)
+    get_broker().store_ticket(ticket, user_id, STREAM_TICKET_TTL)
+    return ticket
+
+
+def redeem_stream_ticket(ticket):
+    """The ticket's user id, or None if it is unknown, expired or already used"""
+    return get_broker().redeem_ticket(ticket)
+
+
+# ==================== DELTAS ====================
+
+def _load_appointments(ids):
+    return {
+        appointment.id: appointment
+        for appointment in Appointment.query.options(
+            joinedload(Appointment.patient), joinedload(Appointment.doctor), joinedload(Appointment.treatment)
+        ).filter(Appointment.id.in_(ids)).all()
+    } if ids else {}
+
+
+def build_delta(message, appointment=None):
+    """Delta for one outbox message; falls back to the event payload once the appointment is archived"""
+    payload = message['payload']
+    return {
+        'id': message['id'],
+        'type': message['event_type'],
+        'occurred_at': payload.get('occurred_at'),
+        'doctor_id': payload.get('doctor_id'),
+        'appointment': appointment.to_dict() if appointment else {
+            key: payload.get(key)
+            for key in ('patient_id', 'doctor_id', 'appointment_date', 'appointment_time', 'status')
+        } | {'id': message['aggregate_id']},
+        'previous_date': payload.get('previous_date'),
+        'previous_time': payload.get('previous_time'),
+    }
+
+
+def publish_event(message):
+    """Publish one outbox message to its doctor's channel and the hospital channel"""
+    appointment = _load_appointments([message['aggregate_id']]).get(message['aggregate_id'])
+    delta = build_delta(message, appointment)
+    data = json.dumps(delta)
+    broker = get_broker()
+    broker.publish(doctor_channel(delta['doctor_id']), data)
+    broker.publish(ALL_CHANNEL, data)
+    return delta
+
+
+def latest_event_id():
+    """
+    Id of the newest outbox event. Dashboards return it with their snapshot
+    (read before the snapshot) so the client can open the stream from there.
+    """
+    return db.session.query(func.max(OutboxEvent.id)).scalar() or 0
+
+
+def replay_since(last_event_id, doctor_id=None):
+    """
+    Deltas after `last_event_id` from the outbox, for a reconnecting client.
+    Returns None when the client must reload its snapshot instead (events
+    already purged, or more than LIVE_REPLAY_LIMIT to scan).
+    """
+    oldest = OutboxEvent.query.order_by(OutboxEvent.id).first()
+    if oldest is not None and oldest.id > last_event_id + 1:
+        return None
+    events = OutboxEvent.query.filter(OutboxEvent.id > last_event_id).order_by(OutboxEvent.id).limit(
+        LIVE_REPLAY_LIMIT + 1
+    ).all()
+    if len(events) > LIVE_REPLAY_LIMIT:
+        return None
+
+    messages = [event.to_dict() for event in events]
+    if doctor_id is not None:
+        messages = [message for message in messages if message['payload'].get('doctor_id') == doctor_id]
+    appointments = _load_appointments({message['aggregate_id'] for message in messages})
+    return [build_delta(message, appointments.get(message['aggregate_id'])) for message in messages]
+
+
+# ==================== STREAM ====================
+
+def sse_frame(data, event=None, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    if event:
+        lines.append(f'event: {event}')
+    lines.append(f'data: {data}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def stream(subscription, replay=None):
+    """
+    SSE frames: replayed deltas (or a resync), then live deltas with
+    heartbeats until LIVE_STREAM_MAX_SECONDS. Runs outside the app context;
+    everything needing the database is done before streaming starts.
+    """
+    try:
+        yield f'retry: {LIVE_RETRY_MS}\n\n'
+        if replay is None:
+            yield sse_frame('{}', event='resync')
+        else:
+            for delta in replay:
+                yield sse_frame(json.dumps(delta), event='appointment', event_id=delta['id'])
+
+        deadline = time.monotonic() + LIVE_STREAM_MAX_SECONDS
+        last_sent = time.monotonic()
+        while time.monotonic() < deadline:
+            if subscription.overflowed:
+                yield sse_frame('{}', event='resync')
+                return
+            data = subscription.get(timeout=1.0)
+            if data is not None:
+                yield sse_frame(data, event='appointment', event_id=json.loads(data)['id'])
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent >= LIVE_HEARTBEAT_SECONDS:
+                yield ': keep-alive\n\n'
+                last_sent = time.monotonic()
+    finally:
+        subscription.close()
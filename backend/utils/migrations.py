@@ -0,0 +1,317 @@
+"""
+Versioned schema migrations with online, batched data backfills
+
+Migrations live in backend/migrations/ as NNNN_short_name.py modules with an
+`upgrade(ctx)` function. Applied versions are recorded in schema_migrations;
+`python migrate.py upgrade` applies the pending ones in order.
+
+Schema steps (ctx.add_column, ctx.create_index, ...) are idempotent, so a
+migration interrupted half way can simply be run again. Each migration
+declares the tables and indexes it creates on its own MetaData, as they were
+when it was written, never through the live models: a migration must build
+the same schema however the models change afterwards. Data steps go through
+ctx.backfill(), which walks the table in primary-key order in small batches,
+one short transaction per batch, sleeping between batches so the app keeps
+getting the write lock. Progress is checkpointed in migration_checkpoints
+after every batch; a crashed or time-boxed run resumes from the last batch.
+"""
+import importlib.util
+import logging
+import os
+import re
+import time
+from datetime import datetime
+
+from sqlalchemy import bindparam, inspect, text
+
+from database import db
+from models import SchemaMigration, MigrationCheckpoint
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+MIGRATION_FILENAME = re.compile(r'^(\d{4})_(\w+)\.py$')
+
+DEFAULT_BATCH_SIZE = int(os.environ.get('MIGRATION_BATCH_SIZE', '1000'))
+DEFAULT_BATCH_SLEEP = float(os.environ.get('MIGRATION_BATCH_SLEEP', '0.05'))  # seconds between batches
+
+
+class MigrationPaused(Exception):
+    """Raised when a run reaches its time budget; rerun to resume from the checkpoint"""
+
+
+class Migration:
+    """A migration module loaded from the migrations directory"""
+
+    def __init__(self, version, name, path):
+        self.version = version
+        self.name = name
+        self.path = path
+        self._module = None
+
+    @property
+    def module(self):
+        if self._module is None:
+            spec = importlib.util.spec_from_file_location(f'migrations.m{self.version}_{self.name}', self.path)
+            self._module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(self._module)
+        return self._module
+
+    @property
+    def description(self):
+        return (self.module.__doc__ or self.name).strip().splitlines()[0]
+
+    def __repr__(self):
+        return f'<Migration {self.version} {self.name}>'
+
+
+def discover_migrations(directory=MIGRATIONS_DIR):
+    """Return migrations in version order"""
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        match = MIGRATION_FILENAME.match(filename)
+        if match:
+            migrations.append(Migration(match.group(1), match.group(2), os.path.join(directory, filename)))
+    versions = [migration.version for migration in migrations]
+    duplicates = {version for version in versions if versions.count(version) > 1}
+    if duplicates:
+        raise ValueError(f"Duplicate migration versions: {', '.join(sorted(duplicates))}")
+    return migrations
+
+
+class MigrationContext:
+    """Helpers passed to each migration's upgrade(ctx)"""
+
+    def __init__(self, migration, batch_size=DEFAULT_BATCH_SIZE, batch_sleep=DEFAULT_BATCH_SLEEP, deadline=None):
+        self.migration = migration
+        self.batch_size = batch_size
+        self.batch_sleep = batch_sleep
+        self.deadline = deadline  # time.monotonic() value after which backfills pause
+        self.engine = db.engine
+
+    @property
+    def dialect(self):
+        return self.engine.dialect.name
+
+    def log(self, message):
+        print(f"  [{self.migration.version}] {message}")
+
+    # ---------- schema steps (idempotent) ----------
+
+    def has_table(self, table):
+        return inspect(self.engine).has_table(table)
+
+    def has_column(self, table, column):
+        return any(col['name'] == column for col in inspect(self.engine).get_columns(table))
+
+    def has_index(self, table, index_name):
+        return any(index['name'] == index_name for index in inspect(self.engine).get_indexes(table))
+
+    def execute(self, sql, params=None):
+        with self.engine.begin() as conn:
+            return conn.execute(text(sql), params or {})
+
+    def reflect(self, metadata, *table_names):
+        """Load existing tables into a migration's MetaData so its foreign keys resolve"""
+        metadata.reflect(bind=self.engine, only=table_names)
+
+    def create_tables(self, *tables):
+        """Create the migration's own Table definitions (with their indexes) if missing"""
+        tables[0].metadata.create_all(bind=self.engine, tables=list(tables), checkfirst=True)
+        self.log(f"tables ready: {', '.join(table.name for table in tables)}")
+
+    def add_column(self, table, column, ddl_type):
+        """
+        Add a nullable column without a default. Adding a column with a
+        default rewrites every row on some databases; fill existing rows with
+        ctx.backfill() instead.
+        """
+        if self.has_column(table, column):
+            self.log(f"column {table}.{column} already exists")
+            return False
+        self.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}")
+        self.log(f"added column {table}.{column}")
+        return True
+
+    def create_index(self, index):
+        """
+        Create an Index declared in the migration. On PostgreSQL it is built
+        CONCURRENTLY so writes are not blocked; SQLite holds the write lock
+        while it builds (seconds per million rows).
+        """
+        index_name = index.name
+        if self.has_index(index.table.name, index_name):
+            self.log(f"index {index_name} already exists")
+            return False
+        start = time.perf_counter()
+        if self.dialect == 'postgresql':
+            index.dialect_options['postgresql']['concurrently'] = True
+            try:
+                with self.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                    index.create(bind=conn)
+            finally:
+                index.dialect_options['postgresql']['concurrently'] = False
+        else:
+            with self.engine.begin() as conn:
+                index.create(bind=conn)
+        self.log(f"created index {index_name} ({time.perf_counter() - start:.1f}s)")
+        return True
+
+    def analyze(self):
+        """Refresh planner statistics"""
+        self.execute("ANALYZE")
+        self.log("updated planner statistics")
+
+    # ---------- data steps (batched, resumable) ----------
+
+    def _checkpoint(self, step):
+        checkpoint = db.session.get(MigrationCheckpoint, (self.migration.version, step))
+        if checkpoint is None:
+            checkpoint = MigrationCheckpoint(version=self.migration.version, step=step, last_key=0, rows_done=0)
+            db.session.add(checkpoint)
+            db.session.commit()
+        return checkpoint
+
+    def backfill(self, step, table, where, set_sql=None, params=None, update=None, key='id'):
+        """
+        Update rows matching `where` in batches of batch_size, in `key` order.
+
+        Either `set_sql` (e.g. "visit_type = 'In-person'") is applied to each
+        batch, or `update(conn, ids)` is called to transform the batch in
+        Python. `where` must stop matching once a row is done, so re-running
+        a batch after a crash is harmless. Returns the rows updated so far.
+        """
+        if (set_sql is None) == (update is None):
+            raise ValueError('Pass exactly one of set_sql or update')
+
+        checkpoint = self._checkpoint(step)
+        if checkpoint.completed:
+            self.log(f"{step}: already done ({checkpoint.rows_done} rows)")
+            return checkpoint.rows_done
+        if checkpoint.last_key:
+            self.log(f"{step}: resuming after {key} {checkpoint.last_key} ({checkpoint.rows_done} rows done)")
+
+        select_batch = text(
+            f"SELECT {key} FROM {table} WHERE {key} > :last_key AND ({where}) ORDER BY {key} LIMIT :batch_size"
+        )
+        update_batch = None
+        if set_sql is not None:
+            update_batch = text(f"UPDATE {table} SET {set_sql} WHERE {key} IN :ids").bindparams(
+                bindparam('ids', expanding=True)
+            )
+        save_checkpoint = text(
+            "UPDATE migration_checkpoints SET last_key = :last_key, rows_done = rows_done + :rows, "
+            "updated_at = :now WHERE version = :version AND step = :step"
+        )
+
+        last_key, rows_done, batches = checkpoint.last_key or 0, checkpoint.rows_done or 0, 0
+        started = time.perf_counter()
+        while True:
+            if self.deadline is not None and time.monotonic() >= self.deadline:
+                self.log(f"{step}: time budget reached after {rows_done} rows, rerun to resume")
+                raise MigrationPaused(step)
+
+            # One short transaction per batch: rows and checkpoint move together
+            with self.engine.begin() as conn:
+                ids = conn.execute(select_batch, {**(params or {}), 'last_key': last_key,
+                                                  'batch_size': self.batch_size}).scalars().all()
+                if not ids:
+                    break
+                if update_batch is not None:
+                    conn.execute(update_batch, {**(params or {}), 'ids': ids})
+                else:
+                    update(conn, ids)
+                conn.execute(save_checkpoint, {'last_key': ids[-1], 'rows': len(ids), 'now': datetime.utcnow(),
+                                               'version': self.migration.version, 'step': step})
+            last_key = ids[-1]
+            rows_done += len(ids)
+            batches += 1
+            if batches % 50 == 0:
+                rate = rows_done / max(time.perf_counter() - started, 1e-9)
+                self.log(f"{step}: {rows_done} rows ({rate:.0f} rows/s)")
+            if self.batch_sleep:
+                time.sleep(self.batch_sleep)
+
+        self.execute(
+            "UPDATE migration_checkpoints SET completed = :done, updated_at = :now WHERE version = :version AND step = :step",
+            {'done': True, 'now': datetime.utcnow(), 'version': self.migration.version, 'step': step}
+        )
+        db.session.expire_all()
+        self.log(f"{step}: done, {rows_done} rows in {time.perf_counter() - started:.1f}s")
+        return rows_done
+
+
+# ==================== RUNNER ====================
+
+def ensure_migration_tables():
+    for model in (SchemaMigration, MigrationCheckpoint):
+        model.__table__.create(bind=db.engine, checkfirst=True)
+
+
+def applied_versions():
+    ensure_migration_tables()
+    return {row.version for row in SchemaMigration.query.all()}
+
+
+def pending_migrations(target=None):
+    applied = applied_versions()
+    return [
+        migration for migration in discover_migrations()
+        if migration.version not in applied and (target is None or migration.version <= target)
+    ]
+
+
+def upgrade(target=None, batch_size=DEFAULT_BATCH_SIZE, batch_sleep=DEFAULT_BATCH_SLEEP, max_seconds=None):
+    """
+    Apply pending migrations in order (up to `target` if given).
+    Returns the list of applied versions. Stops at the first failure; a
+    migration paused by max_seconds is left pending and resumes on rerun.
+    """
+    deadline = time.monotonic() + max_seconds if max_seconds else None
+    applied = []
+    for migration in pending_migrations(target):
+        print(f"Applying {migration.version}_{migration.name}: {migration.description}")
+        ctx = MigrationContext(migration, batch_size=batch_size, batch_sleep=batch_sleep, deadline=deadline)
+        start = time.perf_counter()
+        try:
+            migration.module.upgrade(ctx)
+        except MigrationPaused:
+            db.session.rollback()
+            print(f"[INFO] Paused in {migration.version}; run again to resume.")
+            return applied
+        except Exception:
+            db.session.rollback()
+            logger.exception(f"Migration {migration.version} failed")
+            raise
+        db.session.add(SchemaMigration(
+            version=migration.version,
+            name=migration.name,
+            duration_ms=int((time.perf_counter() - start) * 1000)
+        ))
+        db.session.commit()
+        applied.append(migration.version)
+        print(f"[OK] {migration.version}_{migration.name}")
+    return applied
+
+
+def stamp(version):
+    """Mark migrations up to `version` as applied without running them"""
+    stamped = []
+    for migration in pending_migrations(version):
+        db.session.add(SchemaMigration(version=migration.version, name=migration.name, duration_ms=0))
+        stamped.append(migration.version)
+    db.session.commit()
+    return stamped
+
+
+def status():
+    """Return [(migration, SchemaMigration or None, [in-progress checkpoints])]"""
+    ensure_migration_tables()
+    applied = {row.version: row for row in SchemaMigration.query.all()}
+    checkpoints = {}
+    for checkpoint in MigrationCheckpoint.query.filter_by(completed=False).all():
+        checkpoints.setdefault(checkpoint.version, []).append(checkpoint)
+    return [
+        (migration, applied.get(migration.version), checkpoints.get(migration.version, []))
+        for migration in discover_migrations()
+    ]
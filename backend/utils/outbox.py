@@ -0,0 +1,223 @@
+"""
+Transactional outbox for appointment side effects
+
+Request handlers only make the essential writes (the appointment row and the
+slot flag) and call emit_appointment_event() before committing, so the event
+row is committed atomically with the change it describes: no event is lost if
+the process dies after the commit, and no event exists for a rolled back
+change. After the commit they call kick_dispatcher() to get it delivered
+promptly; the dispatcher also runs on a short beat schedule, which catches
+anything the kick missed (broker down, worker restart).
+
+dispatch_pending_events() hands each pending event to every consumer task
+registered for its type in EVENT_CONSUMERS and marks it dispatched. Delivery is
+at least once: a consumer may see the same event twice, so consumers must be
+idempotent (cache invalidation is, the audit log dedupes on the event id).
+"""
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import inspect
+
+from database import db
+from models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', '100'))
+OUTBOX_RETENTION_DAYS = int(os.environ.get('OUTBOX_RETENTION_DAYS', '7'))
+EVENTS_QUEUE = 'events'
+
+APPOINTMENT_BOOKED = 'appointment.booked'
+APPOINTMENT_RESCHEDULED = 'appointment.rescheduled'
+APPOINTMENT_CANCELLED = 'appointment.cancelled'
+APPOINTMENT_COMPLETED = 'appointment.completed'
+
+_CACHE = 'tasks.event_tasks.invalidate_appointment_caches'
+_NOTIFY = 'tasks.event_tasks.send_appointment_notification'
+_AUDIT = 'tasks.event_tasks.record_audit_entry'
+_LIVE = 'tasks.event_tasks.publish_live_update'
+_ROLLUP = 'tasks.analytics_tasks.refresh_rollup_for_event'
+
+# Consumer task names per event type
+EVENT_CONSUMERS = {
+    APPOINTMENT_BOOKED: [_CACHE, _NOTIFY, _AUDIT, _LIVE, _ROLLUP],
+    APPOINTMENT_RESCHEDULED: [_CACHE, _NOTIFY, _AUDIT, _LIVE, _ROLLUP],
+    APPOINTMENT_CANCELLED: [_CACHE, _NOTIFY, _AUDIT, _LIVE, _ROLLUP],
+    APPOINTMENT_COMPLETED: [_CACHE, _AUDIT, _LIVE, _ROLLUP],
+}
+
+# Callables run in the web process right after the commit (see register_in_process_consumer)
+IN_PROCESS_CONSUMERS = []
+
+STATUS_EVENTS = {
+    'Booked': APPOINTMENT_BOOKED,
+    'Cancelled': APPOINTMENT_CANCELLED,
+    'Completed': APPOINTMENT_COMPLETED,
+}
+
+
+def _iso(value):
+    """Dates/times may still be request strings on objects that were not reloaded"""
+    if value is None:
+        return None
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+
+def emit_appointment_event(event_type, appointment, actor=None, **extra):
+    """
+    Add an event for `appointment` to the current session. The caller
+    commits it together with the appointment change.
+    """
+    if event_type not in EVENT_CONSUMERS:
+        raise ValueError(f'Unknown event type: {event_type}')
+
+    # Status before this change (None for a new appointment), for consumers keeping counts.
+    # A booking may already be flushed (autoflush), so "booked without a status change" means new.
+    state = inspect(appointment)
+    history = state.attrs.status.history
+    if history.deleted:
+        previous_status = history.deleted[0]
+    elif state.transient or state.pending or event_type == APPOINTMENT_BOOKED:
+        previous_status = None
+    else:
+        previous_status = appointment.status
+
+    if appointment.id is None:
+        db.session.flush()  # New appointment: need its id for the payload
+
+    payload = {
+        'appointment_id': appointment.id,
+        'doctor_id': appointment.doctor_id,
+        'patient_id': appointment.patient_id,
+        'appointment_date': _iso(appointment.appointment_date),
+        'appointment_time': _iso(appointment.appointment_time),
+        'status': appointment.status,
+        'previous_status': previous_status,
+        'actor_user_id': actor.id if actor else None,
+        'actor_role': actor.role if actor else None,
+        'occurred_at': datetime.utcnow().isoformat(),
+    }
+    payload.update({key: _iso(value) for key, value in extra.items()})
+
+    event = OutboxEvent(event_type=event_type, aggregate_id=appointment.id, payload=json.dumps(payload))
+    db.session.add(event)
+    db.session.info.setdefault('outbox_emitted', []).append(event)
+    return event
+
+
+def emit_status_event(appointment, actor=None, **extra):
+    """Emit the event for the appointment's current status, if it has one"""
+    event_type = STATUS_EVENTS.get(appointment.status)
+    if event_type:
+        return emit_appointment_event(event_type, appointment, actor=actor, **extra)
+    return None
+
+
+_kick_lock = threading.Lock()
+_kick_pending = threading.Event()
+
+
+def _kick_loop():
+    try:
+        while _kick_pending.is_set():
+            _kick_pending.clear()
+            try:
+                from tasks.event_tasks import dispatch_outbox
+                dispatch_outbox.apply_async(queue=EVENTS_QUEUE, retry=False)
+            except Exception as e:
+                logger.warning(f"Could not kick outbox dispatcher, events wait for the beat run: {str(e)}")
+                break
+    finally:
+        _kick_lock.release()
+
+
+def register_in_process_consumer(consumer):
+    """
+    Run `consumer(message)` in the web process for every event the request
+    committed, before the response. Only for work that must be visible to
+    the next request (write-through caches) or cannot go through Celery (the
+    in-memory live updates broker); everything else belongs in EVENT_CONSUMERS.
+    """
+    if consumer not in IN_PROCESS_CONSUMERS:
+        IN_PROCESS_CONSUMERS.append(consumer)
+
+
+def kick_dispatcher():
+    """
+    Ask a worker to dispatch now instead of waiting for the next beat.
+    Publishes from a background thread so the request never waits on the
+    broker; kicks that arrive while one is in flight are coalesced.
+    """
+    emitted = db.session.info.pop('outbox_emitted', [])
+    for consumer in IN_PROCESS_CONSUMERS:
+        for event in emitted:
+            try:
+                consumer(event.to_dict())
+            except Exception as e:
+                logger.warning(f"In-process consumer failed for outbox event {event.id}: {str(e)}")
+
+    _kick_pending.set()
+    if _kick_lock.acquire(blocking=False):
+        threading.Thread(target=_kick_loop, name='outbox-kick', daemon=True).start()
+
+
+def _send(task_name, message):
+    from celery_app import celery_app
+    celery_app.send_task(task_name, args=[message], queue=EVENTS_QUEUE, retry=False, ignore_result=True)
+
+
+def dispatch_pending_events(batch_size=OUTBOX_BATCH_SIZE, max_batches=None, send=_send):
+    """
+    Deliver pending events, oldest first, to their consumers.
+    Stops at the first delivery failure so events keep their order; the
+    failed event is retried on the next run. Returns counts.
+    """
+    dispatched = batches = 0
+    failed = False
+
+    while not failed and (max_batches is None or batches < max_batches):
+        query = OutboxEvent.query.filter(OutboxEvent.dispatched_at.is_(None)).order_by(OutboxEvent.id)
+        if db.engine.dialect.name == 'postgresql':
+            # Concurrent dispatchers (beat run + kick) take disjoint batches
+            query = query.with_for_update(skip_locked=True)
+        events = query.limit(batch_size).all()
+        if not events:
+            break
+
+        for event in events:
+            message = event.to_dict()
+            try:
+                for task_name in EVENT_CONSUMERS.get(event.event_type, []):
+                    send(task_name, message)
+            except Exception as e:
+                event.attempts = (event.attempts or 0) + 1
+                event.last_error = str(e)[:1000]
+                logger.warning(f"Outbox event {event.id} ({event.event_type}) not delivered: {str(e)}")
+                failed = True
+                break
+            event.dispatched_at = datetime.utcnow()
+            event.attempts = (event.attempts or 0) + 1
+            dispatched += 1
+
+        db.session.commit()
+        batches += 1
+
+    pending = OutboxEvent.query.filter(OutboxEvent.dispatched_at.is_(None)).count()
+    if dispatched or failed:
+        logger.info(f"Dispatched {dispatched} outbox events, {pending} pending")
+    return {'dispatched': dispatched, 'pending': pending, 'failed': failed}
+
+
+def purge_dispatched_events(older_than_days=OUTBOX_RETENTION_DAYS):
+    """Delete dispatched events older than the retention window; the audit log keeps the history"""
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    deleted = OutboxEvent.query.filter(
+        OutboxEvent.dispatched_at.isnot(None),
+        OutboxEvent.dispatched_at < cutoff
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
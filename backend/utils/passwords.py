@@ -0,0 +1,119 @@
+"""
+Password hashing on a bounded process pool
+
+scrypt/pbkdf2 hashing is deliberately slow (tens of milliseconds of pure
+CPU). Run inline, every login holds a web worker thread and the GIL for that
+long, so a login storm at shift change starves every other endpoint. Hashing
+and verification run on a dedicated process pool of PASSWORD_HASH_WORKERS
+processes instead, so web threads only wait on a future.
+
+The pool is bounded: at most PASSWORD_HASH_MAX_PENDING hashes may be queued
+or running. Beyond that, hash_password()/verify_password() raise
+PasswordHashingBusy at once and the route answers 503 with Retry-After,
+instead of letting the backlog grow until every request times out.
+
+The pool is per web worker process, so PASSWORD_HASH_WORKERS defaults to
+at most 2: a host running several web processes would otherwise start
+cores x processes hashing workers. Workers are spawned, not forked, and
+spawn re-imports the main module; app.py skips building the app there.
+
+PASSWORD_HASH_METHOD sets the cost (Werkzeug method string, e.g.
+"scrypt:32768:8:1" or "pbkdf2:sha256:600000"). Hashes made with other
+parameters still verify; login rehashes them (needs_rehash()).
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+logger = logging.getLogger(__name__)
+
+PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', str(min(os.cpu_count() or 1, 2))))  # Per web process
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', str(PASSWORD_HASH_WORKERS * 8)))
+PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', '10'))
+PASSWORD_HASH_RETRY_AFTER = 2  # Seconds suggested to clients when the pool is full
+
+
+class PasswordHashingBusy(Exception):
+    """Too many password hashes queued; retry shortly"""
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(PASSWORD_HASH_MAX_PENDING)
+_current_method = None
+
+
+def _get_pool():
+    """The process pool, created on first use (and again in a forked child)"""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            # spawn: forking a threaded web server can copy held locks into the workers
+            _pool = ProcessPoolExecutor(
+                max_workers=PASSWORD_HASH_WORKERS, mp_context=multiprocessing.get_context('spawn')
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _run(fn, *args):
+    if PASSWORD_HASH_WORKERS <= 0:
+        return fn(*args)  # Pool disabled: hash inline
+    slots = _slots
+    if not slots.acquire(blocking=False):
+        raise PasswordHashingBusy()
+    try:
+        future = _get_pool().submit(fn, *args)
+    except Exception:
+        slots.release()
+        raise
+    # The slot is held until the hash finishes, even if this request gives up waiting
+    future.add_done_callback(lambda _: slots.release())
+    try:
+        return future.result(timeout=PASSWORD_HASH_TIMEOUT)
+    except FutureTimeoutError:
+        raise PasswordHashingBusy()
+    except BrokenProcessPool:
+        logger.warning("Password hashing pool broke (worker died), starting a new one")
+        shutdown_pool()
+        raise
+
+
+def hash_password(password):
+    return _run(generate_password_hash, password, PASSWORD_HASH_METHOD)
+
+
+def verify_password(password_hash, password):
+    return _run(check_password_hash, password_hash, password)
+
+
+def needs_rehash(password_hash):
+    """True if the hash was made with other parameters than PASSWORD_HASH_METHOD"""
+    global _current_method
+    if _current_method is None:
+        # Werkzeug expands bare method names ("scrypt") into full parameters; read them off a sample hash
+        _current_method = generate_password_hash('', method=PASSWORD_HASH_METHOD, salt_length=1).split('$', 1)[0]
+    return password_hash.split('$', 1)[0] != _current_method
+
+
+def configure_pool(workers, max_pending=None):
+    """Resize the pool and its queue bound (default: 8 per worker); the next hash starts the new pool"""
+    global PASSWORD_HASH_WORKERS, _slots
+    shutdown_pool()
+    PASSWORD_HASH_WORKERS = workers
+    _slots = threading.BoundedSemaphore(max_pending or max(workers, 1) * 8)
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
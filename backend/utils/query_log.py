@@ -0,0 +1,71 @@
+"""
+Opt-in SQL query log used to find hot queries
+
+When QUERY_LOG_PATH is set, every SELECT run through SQLAlchemy is appended
+to that file as one JSON object per line: {"sql", "params", "ms"}. The
+index advisor (index_advisor.py) replays the most expensive statements from
+this log with EXPLAIN QUERY PLAN. Leave it unset in production unless you
+are collecting a sample; QUERY_LOG_MIN_MS drops statements faster than that.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+QUERY_LOG_MIN_MS = float(os.environ.get('QUERY_LOG_MIN_MS', '0'))
+
+_lock = threading.Lock()
+_enabled_path = None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_log_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_log_start'].pop()
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if executemany or elapsed_ms < QUERY_LOG_MIN_MS:
+        return
+    if not statement.lstrip()[:6].upper() == 'SELECT':
+        return
+    entry = json.dumps({
+        'sql': statement,
+        'params': list(parameters) if isinstance(parameters, (list, tuple)) else parameters,
+        'ms': round(elapsed_ms, 3)
+    }, default=str)
+    try:
+        with _lock, open(_enabled_path, 'a', encoding='utf-8') as f:
+            f.write(entry + '\n')
+    except OSError as e:
+        logger.warning(f"Query log write failed: {e}")
+
+
+def enable_query_log(path: str) -> None:
+    """Start appending SELECT statements to `path` (idempotent)"""
+    global _enabled_path
+    if _enabled_path is None:
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    _enabled_path = path
+    logger.info(f"Query log enabled: {path}")
+
+
+def read_query_log(path: str):
+    """Yield (sql, params, ms) entries from a query log file"""
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            yield entry['sql'], entry.get('params') or [], float(entry.get('ms', 0))
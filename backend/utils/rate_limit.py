@@ -0,0 +1,398 @@
+"""
+Login rate limiting and brute-force lockout
+
+Every login attempt costs a password hash (utils/passwords.py), so a
+credential-stuffing flood slows logins for everyone. check_login_attempt()
+runs before the user lookup and the hash and rejects an attempt when:
+- its IP made LOGIN_IP_LIMIT attempts in the last LOGIN_IP_WINDOW seconds
+- its (username, IP) pair is locked out
+Once a username got LOGIN_USERNAME_LIMIT attempts in the last
+LOGIN_USERNAME_WINDOW seconds, from any IPs, further attempts are slowed by
+LOGIN_USERNAME_DELAY seconds but not refused: anything that refuses logins
+by username alone would let anyone who knows a username lock its owner out.
+
+Windows are sliding: each key is a log of attempt timestamps (a Redis sorted
+set), so there is no burst allowance at window boundaries. Rejected attempts
+are not logged, so a client that backs off gets through once its window
+drains.
+
+Lockout is exponential: after LOGIN_LOCKOUT_THRESHOLD consecutive failed
+logins for a username from one IP, that IP is locked out of the username for
+LOGIN_LOCKOUT_BASE seconds, doubling with each further failure up to
+LOGIN_LOCKOUT_MAX; the owner logging in from elsewhere is unaffected. A
+successful login clears that IP's failures. Unknown usernames are counted like real ones, so responses do
+not reveal which usernames exist.
+
+The stores also keep the token buckets used for general API admission
+control (utils/admission.py).
+
+State lives in Redis so limits hold across web workers. MemoryRateLimitStore
+keeps the same state in process: it is used when RATE_LIMIT_BACKEND=memory
+(tests, single-process setups) and for any call Redis fails on. Counters of
+attempts, rejections and lockouts are served by GET /api/admin/metrics.
+"""
+import logging
+import math
+import os
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import deque
+from functools import wraps
+from typing import Dict, Tuple
+
+import redis
+
+from utils.cache import redis_client
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'redis')
+LOGIN_IP_LIMIT = int(os.environ.get('LOGIN_IP_LIMIT', '20'))
+LOGIN_IP_WINDOW = int(os.environ.get('LOGIN_IP_WINDOW', '60'))
+LOGIN_USERNAME_LIMIT = int(os.environ.get('LOGIN_USERNAME_LIMIT', '10'))
+LOGIN_USERNAME_WINDOW = int(os.environ.get('LOGIN_USERNAME_WINDOW', '300'))
+LOGIN_USERNAME_DELAY = float(os.environ.get('LOGIN_USERNAME_DELAY', '1'))  # seconds
+LOGIN_LOCKOUT_THRESHOLD = int(os.environ.get('LOGIN_LOCKOUT_THRESHOLD', '5'))
+LOGIN_LOCKOUT_BASE = int(os.environ.get('LOGIN_LOCKOUT_BASE', '30'))
+LOGIN_LOCKOUT_MAX = int(os.environ.get('LOGIN_LOCKOUT_MAX', '3600'))
+LOGIN_FAILURE_TTL = 24 * 3600  # Consecutive failures are forgotten a day after the last one
+MEMORY_SWEEP_EVERY = 1000  # Memory store: drop expired keys every N writes
+
+COUNTERS_KEY = 'metrics:rate_limit'
+
+# Token bucket step run atomically in Redis: the same arithmetic as _refill(),
+# one round trip, no retries however many requests share the bucket.
+# KEYS[1] bucket hash; ARGV rate, capacity, now. Returns {allowed, retry_after}.
+TAKE_TOKEN_SCRIPT = """
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local rate, capacity, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local tokens = tonumber(state[1])
+if tokens == nil then
+    tokens = capacity
+else
+    tokens = math.min(capacity, tokens + math.max(0, now - (tonumber(state[2]) or now)) * rate)
+end
+local allowed, retry_after = 0, 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    retry_after = math.max(1, math.ceil((1 - tokens) / rate))
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', ARGV[3])
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, retry_after}
+"""
+
+
+class RateLimitStore(ABC):
+    """Common interface for rate limit state"""
+
+    name = 'base'
+
+    @abstractmethod
+    def window_hit(self, key: str, window: int, limit: int) -> Tuple[bool, int]:
+        """
+        Log an attempt in the sliding window unless `limit` attempts are already
+        logged; returns (allowed, seconds until the oldest attempt leaves the window)
+        """
+
+    @abstractmethod
+    def take_token(self, key: str, rate: float, capacity: int) -> Tuple[bool, int]:
+        """
+        Take one token from a bucket refilled at `rate` tokens per second up to
+        `capacity`; returns (allowed, seconds until a token is available)
+        """
+
+    @abstractmethod
+    def lock_remaining(self, key: str) -> int:
+        """Seconds left on a lock, 0 if not locked"""
+
+    @abstractmethod
+    def set_lock(self, key: str, seconds: int) -> None:
+        """Lock `key` for `seconds`"""
+
+    @abstractmethod
+    def incr_failures(self, key: str, ttl: int) -> int:
+        """Add one to a failure count and return it"""
+
+    @abstractmethod
+    def clear(self, *keys: str) -> None:
+        """Forget the state under these keys"""
+
+    @abstractmethod
+    def incr_counter(self, name: str, amount: int = 1) -> None:
+        """Add to a metrics counter"""
+
+    @abstractmethod
+    def counters(self) -> Dict[str, int]:
+        """Every metrics counter"""
+
+
+def _refill(tokens, updated, now, rate, capacity):
+    """Token bucket step: (tokens left, allowed, retry_after) after refilling and taking one"""
+    tokens = capacity if tokens is None else min(capacity, float(tokens) + (now - float(updated)) * rate)
+    if tokens >= 1:
+        return tokens - 1, True, 0
+    return tokens, False, max(1, math.ceil((1 - tokens) / rate))
+
+
+class MemoryRateLimitStore(RateLimitStore):
+    """In-process store; limits hold per process only"""
+
+    name = 'memory'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._windows = {}  # key -> (deque of timestamps, window)
+        self._buckets = {}  # key -> (tokens, updated_at, seconds to refill)
+        self._expiring = {}  # key -> (value, expires_at); locks and failure counts
+        self._counters = {}
+        self._writes = 0
+
+    def _sweep(self, now):
+        self._writes += 1
+        if self._writes % MEMORY_SWEEP_EVERY:
+            return
+        for key, (hits, window) in list(self._windows.items()):
+            if not hits or hits[-1] <= now - window:
+                del self._windows[key]
+        for key, (_, expires_at) in list(self._expiring.items()):
+            if expires_at <= now:
+                del self._expiring[key]
+        for key, (_, updated, refill) in list(self._buckets.items()):
+            if updated + refill <= now:
+                del self._buckets[key]  # Full again; same as a fresh bucket
+
+    def _get(self, key, now):
+        value, expires_at = self._expiring.get(key, (None, 0))
+        return value if expires_at > now else None
+
+    def window_hit(self, key, window, limit):
+        now = time.time()
+        with self._lock:
+            hits, _ = self._windows.setdefault(key, (deque(), window))
+            while hits and hits[0] <= now - window:
+                hits.popleft()
+            if len(hits) >= limit:
+                return False, max(1, int(hits[0] + window - now + 1))
+            hits.append(now)
+            self._sweep(now)
+            return True, 0
+
+    def take_token(self, key, rate, capacity):
+        now = time.time()
+        with self._lock:
+            tokens, updated, _ = self._buckets.get(key, (None, now, 0))
+            tokens, allowed, retry_after = _refill(tokens, updated, now, rate, capacity)
+            self._buckets[key] = (tokens, now, capacity / rate)
+            self._sweep(now)
+        return allowed, retry_after
+
+    def lock_remaining(self, key):
+        now = time.time()
+        with self._lock:
+            until = self._get(key, now)
+        return max(1, int(until - now + 1)) if until else 0
+
+    def set_lock(self, key, seconds):
+        now = time.time()
+        with self._lock:
+            self._expiring[key] = (now + seconds, now + seconds)
+            self._sweep(now)
+
+    def incr_failures(self, key, ttl):
+        now = time.time()
+        with self._lock:
+            failures = (self._get(key, now) or 0) + 1
+            self._expiring[key] = (failures, now + ttl)
+            self._sweep(now)
+        return failures
+
+    def clear(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._windows.pop(key, None)
+                self._expiring.pop(key, None)
+
+    def incr_counter(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def counters(self):
+        with self._lock:
+            return dict(self._counters)
+
+
+_memory_store = MemoryRateLimitStore()
+
+
+def _fallback_to_memory(method):
+    """Redis store methods: on a Redis error, use the in-process store for this call"""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        except redis.RedisError as exc:
+            logger.warning("Rate limit store unavailable, limiting in process: %s", exc)
+            return getattr(_memory_store, method.__name__)(*args, **kwargs)
+    return wrapper
+
+
+class RedisRateLimitStore(RateLimitStore):
+    """Shared store; sliding windows are sorted sets of attempt timestamps, token buckets hashes updated by a Lua script"""
+
+    name = 'redis'
+
+    def __init__(self, client):
+        self.client = client
+        self._take_token = client.register_script(TAKE_TOKEN_SCRIPT)  # EVALSHA, loaded on first use
+
+    @_fallback_to_memory
+    def window_hit(self, key, window, limit):
+        now = time.time()
+        member = f"{now}:{uuid.uuid4().hex[:8]}"
+        pipe = self.client.pipeline()
+        pipe.zremrangebyscore(key, 0, now - window)
+        pipe.zadd(key, {member: now})
+        pipe.zcard(key)
+        pipe.zrange(key, 0, 0, withscores=True)
+        pipe.expire(key, window)
+        _, _, count, oldest, _ = pipe.execute()
+        if count > limit:
+            self.client.zrem(key, member)  # Rejected attempts do not extend the window
+            oldest_at = oldest[0][1] if oldest else now
+            return False, max(1, int(oldest_at + window - now + 1))
+        return True, 0
+
+    @_fallback_to_memory
+    def take_token(self, key, rate, capacity):
+        allowed, retry_after = self._take_token(keys=[key], args=[rate, capacity, repr(time.time())])
+        return bool(allowed), int(retry_after)
+
+    @_fallback_to_memory
+    def lock_remaining(self, key):
+        ttl = self.client.ttl(key)
+        return ttl if ttl and ttl > 0 else 0
+
+    @_fallback_to_memory
+    def set_lock(self, key, seconds):
+        self.client.setex(key, seconds, 1)
+
+    @_fallback_to_memory
+    def incr_failures(self, key, ttl):
+        pipe = self.client.pipeline()
+        pipe.incr(key)
+        pipe.expire(key, ttl)
+        failures, _ = pipe.execute()
+        return failures
+
+    @_fallback_to_memory
+    def clear(self, *keys):
+        self.client.delete(*keys)
+
+    @_fallback_to_memory
+    def incr_counter(self, name, amount=1):
+        self.client.hincrby(COUNTERS_KEY, name, amount)
+
+    @_fallback_to_memory
+    def counters(self):
+        return {
+            (name.decode() if isinstance(name, bytes) else name): int(value)
+            for name, value in self.client.hgetall(COUNTERS_KEY).items()
+        }
+
+
+_store = None
+
+
+def get_rate_limit_store() -> RateLimitStore:
+    """Redis store unless RATE_LIMIT_BACKEND=memory or Redis is not configured"""
+    global _store
+    if _store is None:
+        if RATE_LIMIT_BACKEND == 'memory' or redis_client is None:
+            _store = _memory_store
+        else:
+            _store = RedisRateLimitStore(redis_client)
+    return _store
+
+
+def set_rate_limit_store(store: RateLimitStore) -> None:
+    """Swap the store (tests use a fresh MemoryRateLimitStore)"""
+    global _store
+    _store = store
+
+
+# ==================== LOGIN ====================
+
+def _ip_key(ip):
+    return f"ratelimit:login:ip:{ip}"
+
+
+def _username_key(username):
+    return f"ratelimit:login:user:{username}"
+
+
+def _lock_key(ip, username):
+    return f"ratelimit:login:lock:{ip}:{username}"
+
+
+def _failures_key(ip, username):
+    return f"ratelimit:login:failures:{ip}:{username}"
+
+
+def check_login_attempt(ip: str, username: str) -> Tuple[bool, int]:
+    """
+    Decide whether to try this login at all (before any hashing);
+    returns (allowed, retry_after seconds)
+    """
+    store = get_rate_limit_store()
+    store.incr_counter('login_attempts')
+
+    allowed, retry_after = store.window_hit(_ip_key(ip), LOGIN_IP_WINDOW, LOGIN_IP_LIMIT)
+    if not allowed:
+        store.incr_counter('login_rejected_ip')
+        return False, retry_after
+
+    locked_for = store.lock_remaining(_lock_key(ip, username))
+    if locked_for:
+        store.incr_counter('login_rejected_locked')
+        return False, locked_for
+
+    allowed, _ = store.window_hit(_username_key(username), LOGIN_USERNAME_WINDOW, LOGIN_USERNAME_LIMIT)
+    if not allowed:
+        store.incr_counter('login_delayed_username')
+        time.sleep(LOGIN_USERNAME_DELAY)
+    return True, 0
+
+
+def record_login_failure(ip: str, username: str) -> int:
+    """
+    Count a wrong password; locks this IP out of the username once failures
+    pass the threshold. Returns the lock seconds (0 if none)
+    """
+    store = get_rate_limit_store()
+    store.incr_counter('login_failures')
+    failures = store.incr_failures(_failures_key(ip, username), LOGIN_FAILURE_TTL)
+    if failures < LOGIN_LOCKOUT_THRESHOLD:
+        return 0
+    seconds = min(LOGIN_LOCKOUT_BASE * 2 ** min(failures - LOGIN_LOCKOUT_THRESHOLD, 20), LOGIN_LOCKOUT_MAX)
+    store.set_lock(_lock_key(ip, username), seconds)
+    store.incr_counter('lockouts')
+    logger.warning(f"Login locked for {username!r} from {ip} for {seconds}s after {failures} failed attempts")
+    return seconds
+
+
+def record_login_success(ip: str, username: str) -> None:
+    get_rate_limit_store().clear(_failures_key(ip, username), _lock_key(ip, username))
+
+
+def rate_limit_metrics() -> dict:
+    store = get_rate_limit_store()
+    counters = store.counters()
+    return {
+        'backend': store.name,
+        'counters': {name: count for name, count in counters.items() if not name.startswith('admission_')}
+    }
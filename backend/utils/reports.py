@@ -135,7 +135,7 @@ def generate_doctor_report_html(report_data):
     </div>
     
     <div class="section">
-        <h2>Appointments ({len(appointments)})</h2>
+        <h2>Appointments ({stats['total_appointments']})</h2>
         <table>
             <thead>
                 <tr>
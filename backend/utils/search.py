@@ -0,0 +1,401 @@
+"""
+Full-text search for doctors and patients
+
+Replaces ILIKE '%term%' scans with an index-backed search behind a common
+interface:
+- SQLite: FTS5 tables kept in sync by triggers, ranked with bm25(), plus
+  trigram FTS5 tables for substring matches
+- PostgreSQL: pg_trgm GIN indexes, ranked with similarity()
+- Anything else: ILIKE fallback (previous behaviour)
+
+Every backend supports prefix matching ("joh" -> "John"), substring matching
+as ILIKE '%term%' did ("ouse" -> "House", part of a phone or license number)
+and fuzzy matching ("jhon" -> "John") and returns ids ordered by relevance.
+limit=None returns every match (the admin lists are not capped).
+"""
+import difflib
+import logging
+import re
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import or_, text
+
+from database import db
+
+logger = logging.getLogger(__name__)
+
+SEARCH_RESULT_LIMIT = 500
+FUZZY_CUTOFF = 0.75
+FUZZY_CANDIDATES_PER_TOKEN = 3
+
+DOCTOR_FIELDS = ('first_name', 'last_name', 'license_number')
+DOCTOR_NAME_FIELDS = ('first_name', 'last_name')
+PATIENT_FIELDS = ('first_name', 'last_name', 'phone', 'email', 'username')
+
+TOKEN_PATTERN = re.compile(r'[^\W_]+', re.UNICODE)
+TRIGRAM_MIN_LENGTH = 3  # Shorter substrings cannot use a trigram index
+
+
+def tokenize(term: str) -> List[str]:
+    """Split a search string into lowercase word tokens"""
+    return [token.lower() for token in TOKEN_PATTERN.findall(term or '')]
+
+
+class SearchBackend(ABC):
+    """Common interface for doctor/patient search backends"""
+
+    name = 'base'
+
+    def ensure_index(self) -> None:
+        """Create index structures if missing (idempotent)"""
+
+    def rebuild(self) -> None:
+        """Rebuild index contents from the base tables"""
+
+    @abstractmethod
+    def search_doctors(self, term: str, fields: Iterable[str] = DOCTOR_FIELDS,
+                       limit: Optional[int] = SEARCH_RESULT_LIMIT) -> List[int]:
+        """Matching doctor ids, best first (at most `limit`; all when None)"""
+
+    @abstractmethod
+    def search_patients(self, term: str, fields: Iterable[str] = PATIENT_FIELDS,
+                        limit: Optional[int] = SEARCH_RESULT_LIMIT) -> List[int]:
+        """Matching patient ids, best first (at most `limit`; all when None)"""
+
+
+def _limit_clause(limit: Optional[int]) -> str:
+    return '' if limit is None else ' LIMIT :limit'
+
+
+class SQLiteFTSBackend(SearchBackend):
+    """
+    SQLite FTS5 backend. Index tables are maintained by triggers on
+    doctors, patients and users, so every write path stays in sync.
+
+    The *_fts tables (unicode61 words) rank word and prefix matches; the
+    *_sub tables (trigram tokenizer) find substrings inside words and
+    identifiers, which word tokens cannot.
+    """
+
+    name = 'sqlite-fts5'
+
+    SCHEMA = [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS doctors_fts USING fts5("
+        "first_name, last_name, license_number, tokenize='unicode61 remove_diacritics 2')",
+        "CREATE VIRTUAL TABLE IF NOT EXISTS doctors_fts_vocab USING fts5vocab(doctors_fts, 'row')",
+        "CREATE VIRTUAL TABLE IF NOT EXISTS patients_fts USING fts5("
+        "first_name, last_name, phone, email, username, tokenize='unicode61 remove_diacritics 2')",
+        "CREATE VIRTUAL TABLE IF NOT EXISTS patients_fts_vocab USING fts5vocab(patients_fts, 'row')",
+        # Doctors
+        "CREATE TRIGGER IF NOT EXISTS doctors_fts_ai AFTER INSERT ON doctors BEGIN "
+        "INSERT INTO doctors_fts(rowid, first_name, last_name, license_number) "
+        "VALUES (new.id, new.first_name, new.last_name, new.license_number); END",
+        "CREATE TRIGGER IF NOT EXISTS doctors_fts_ad AFTER DELETE ON doctors BEGIN "
+        "DELETE FROM doctors_fts WHERE rowid = old.id; END",
+        "CREATE TRIGGER IF NOT EXISTS doctors_fts_au AFTER UPDATE OF first_name, last_name, license_number "
+        "ON doctors BEGIN "
+        "DELETE FROM doctors_fts WHERE rowid = old.id; "
+        "INSERT INTO doctors_fts(rowid, first_name, last_name, license_number) "
+        "VALUES (new.id, new.first_name, new.last_name, new.license_number); END",
+        # Patients (email/username come from users)
+        "CREATE TRIGGER IF NOT EXISTS patients_fts_ai AFTER INSERT ON patients BEGIN "
+        "INSERT INTO patients_fts(rowid, first_name, last_name, phone, email, username) "
+        "VALUES (new.id, new.first_name, new.last_name, new.phone, "
+        "(SELECT email FROM users WHERE id = new.user_id), "
+        "(SELECT username FROM users WHERE id = new.user_id)); END",
+        "CREATE TRIGGER IF NOT EXISTS patients_fts_ad AFTER DELETE ON patients BEGIN "
+        "DELETE FROM patients_fts WHERE rowid = old.id; END",
+        "CREATE TRIGGER IF NOT EXISTS patients_fts_au AFTER UPDATE OF first_name, last_name, phone, user_id "
+        "ON patients BEGIN "
+        "DELETE FROM patients_fts WHERE rowid = old.id; "
+        "INSERT INTO patients_fts(rowid, first_name, last_name, phone, email, username) "
+        "VALUES (new.id, new.first_name, new.last_name, new.phone, "
+        "(SELECT email FROM users WHERE id = new.user_id), "
+        "(SELECT username FROM users WHERE id = new.user_id)); END",
+        "CREATE TRIGGER IF NOT EXISTS users_patients_fts_au AFTER UPDATE OF email, username ON users BEGIN "
+        "DELETE FROM patients_fts WHERE rowid IN (SELECT id FROM patients WHERE user_id = new.id); "
+        "INSERT INTO patients_fts(rowid, first_name, last_name, phone, email, username) "
+        "SELECT id, first_name, last_name, phone, new.email, new.username "
+        "FROM patients WHERE user_id = new.id; END",
+    ]
+
+    SUBSTRING_SCHEMA = [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS doctors_sub USING fts5("
+        "first_name, last_name, license_number, tokenize='trigram')",
+        "CREATE VIRTUAL TABLE IF NOT EXISTS patients_sub USING fts5("
+        "first_name, last_name, phone, email, username, tokenize='trigram')",
+        # Doctors
+        "CREATE TRIGGER IF NOT EXISTS doctors_sub_ai AFTER INSERT ON doctors BEGIN "
+        "INSERT INTO doctors_sub(rowid, first_name, last_name, license_number) "
+        "VALUES (new.id, new.first_name, new.last_name, new.license_number); END",
+        "CREATE TRIGGER IF NOT EXISTS doctors_sub_ad AFTER DELETE ON doctors BEGIN "
+        "DELETE FROM doctors_sub WHERE rowid = old.id; END",
+        "CREATE TRIGGER IF NOT EXISTS doctors_sub_au AFTER UPDATE OF first_name, last_name, license_number "
+        "ON doctors BEGIN "
+        "DELETE FROM doctors_sub WHERE rowid = old.id; "
+        "INSERT INTO doctors_sub(rowid, first_name, last_name, license_number) "
+        "VALUES (new.id, new.first_name, new.last_name, new.license_number); END",
+        # Patients
+        "CREATE TRIGGER IF NOT EXISTS patients_sub_ai AFTER INSERT ON patients BEGIN "
+        "INSERT INTO patients_sub(rowid, first_name, last_name, phone, email, username) "
+        "VALUES (new.id, new.first_name, new.last_name, new.phone, "
+        "(SELECT email FROM users WHERE id = new.user_id), "
+        "(SELECT username FROM users WHERE id = new.user_id)); END",
+        "CREATE TRIGGER IF NOT EXISTS patients_sub_ad AFTER DELETE ON patients BEGIN "
+        "DELETE FROM patients_sub WHERE rowid = old.id; END",
+        "CREATE TRIGGER IF NOT EXISTS patients_sub_au AFTER UPDATE OF first_name, last_name, phone, user_id "
+        "ON patients BEGIN "
+        "DELETE FROM patients_sub WHERE rowid = old.id; "
+        "INSERT INTO patients_sub(rowid, first_name, last_name, phone, email, username) "
+        "VALUES (new.id, new.first_name, new.last_name, new.phone, "
+        "(SELECT email FROM users WHERE id = new.user_id), "
+        "(SELECT username FROM users WHERE id = new.user_id)); END",
+        "CREATE TRIGGER IF NOT EXISTS users_patients_sub_au AFTER UPDATE OF email, username ON users BEGIN "
+        "DELETE FROM patients_sub WHERE rowid IN (SELECT id FROM patients WHERE user_id = new.id); "
+        "INSERT INTO patients_sub(rowid, first_name, last_name, phone, email, username) "
+        "SELECT id, first_name, last_name, phone, new.email, new.username "
+        "FROM patients WHERE user_id = new.id; END",
+    ]
+
+    def ensure_index(self) -> None:
+        with db.engine.begin() as conn:
+            existing = {row[0] for row in conn.execute(text(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ('doctors_fts', 'doctors_sub')"
+            )).all()}
+            for statement in self.SCHEMA + self.SUBSTRING_SCHEMA:
+                conn.execute(text(statement))
+        if len(existing) < 2:
+            self.rebuild()
+
+    def rebuild(self) -> None:
+        with db.engine.begin() as conn:
+            conn.execute(text("DELETE FROM doctors_fts"))
+            conn.execute(text(
+                "INSERT INTO doctors_fts(rowid, first_name, last_name, license_number) "
+                "SELECT id, first_name, last_name, license_number FROM doctors"
+            ))
+            conn.execute(text("DELETE FROM patients_fts"))
+            conn.execute(text(
+                "INSERT INTO patients_fts(rowid, first_name, last_name, phone, email, username) "
+                "SELECT p.id, p.first_name, p.last_name, p.phone, u.email, u.username "
+                "FROM patients p LEFT JOIN users u ON u.id = p.user_id"
+            ))
+            conn.execute(text("DELETE FROM doctors_sub"))
+            conn.execute(text(
+                "INSERT INTO doctors_sub(rowid, first_name, last_name, license_number) "
+                "SELECT rowid, first_name, last_name, license_number FROM doctors_fts"
+            ))
+            conn.execute(text("DELETE FROM patients_sub"))
+            conn.execute(text(
+                "INSERT INTO patients_sub(rowid, first_name, last_name, phone, email, username) "
+                "SELECT rowid, first_name, last_name, phone, email, username FROM patients_fts"
+            ))
+            for table in ('doctors_fts', 'patients_fts', 'doctors_sub', 'patients_sub'):
+                conn.execute(text(f"INSERT INTO {table}({table}) VALUES ('optimize')"))
+        logger.info("Rebuilt SQLite FTS5 search index")
+
+    @staticmethod
+    def _match_expression(token_groups: List[List[str]], fields: Iterable[str], prefix: bool) -> str:
+        """
+        Build an FTS5 MATCH expression: every token must match (AND),
+        alternatives for one token (fuzzy candidates) are OR-ed
+        """
+        suffix = '*' if prefix else ''
+        clauses = []
+        for group in token_groups:
+            alternatives = ['"{}"{}'.format(token.replace('"', '""'), suffix) for token in group]
+            clauses.append(alternatives[0] if len(alternatives) == 1 else '(' + ' OR '.join(alternatives) + ')')
+        return '{%s} : (%s)' % (' '.join(fields), ' AND '.join(clauses))
+
+    def _fuzzy_candidates(self, vocab_table: str, token: str) -> List[str]:
+        """Close vocabulary terms sharing the token's first character"""
+        first = token[0]
+        rows = db.session.execute(
+            text(f"SELECT term FROM {vocab_table} WHERE term >= :lo AND term < :hi"),
+            {'lo': first, 'hi': chr(ord(first) + 1)}
+        ).all()
+        return difflib.get_close_matches(token, [row[0] for row in rows],
+                                         n=FUZZY_CANDIDATES_PER_TOKEN, cutoff=FUZZY_CUTOFF)
+
+    @staticmethod
+    def _substring_ids(table: str, term: str, fields: Iterable[str], limit: Optional[int]) -> List[int]:
+        """Rows with `term` inside one of `fields`, as ILIKE '%term%' on each field"""
+        if len(term) >= TRIGRAM_MIN_LENGTH:
+            condition = f"{table} MATCH :match"
+            params = {'match': '{%s} : "%s"' % (' '.join(fields), term.replace('"', '""'))}
+        else:
+            condition = ' OR '.join(f"{field} LIKE :pattern" for field in fields)
+            params = {'pattern': f'%{term}%'}
+        params['limit'] = limit
+        query = text(f"SELECT rowid FROM {table} WHERE {condition}{_limit_clause(limit)}")
+        return [row[0] for row in db.session.execute(query, params).all()]
+
+    def _search(self, name: str, term: str, fields: Iterable[str], limit: Optional[int]) -> List[int]:
+        tokens = tokenize(term)
+        if not tokens:
+            return []
+        fields = tuple(fields)
+        table = f'{name}_fts'
+        query = text(
+            f"SELECT rowid FROM {table} WHERE {table} MATCH :match "
+            f"ORDER BY bm25({table}){_limit_clause(limit)}"
+        )
+
+        # Word prefix matches first, then substrings the word index cannot find
+        match = self._match_expression([[token] for token in tokens], fields, prefix=True)
+        ids = [row[0] for row in db.session.execute(query, {'match': match, 'limit': limit}).all()]
+        if limit is None or len(ids) < limit:
+            seen = set(ids)
+            ids += [row_id for row_id in self._substring_ids(f'{name}_sub', term.strip(), fields, limit)
+                    if row_id not in seen]
+        if ids:
+            return ids[:limit]
+
+        # Fuzzy fallback: replace each token with close terms from the index vocabulary
+        token_groups = []
+        for token in tokens:
+            candidates = self._fuzzy_candidates(f'{table}_vocab', token)
+            if not candidates:
+                return []
+            token_groups.append(candidates)
+        match = self._match_expression(token_groups, fields, prefix=False)
+        return [row[0] for row in db.session.execute(query, {'match': match, 'limit': limit}).all()]
+
+    def search_doctors(self, term, fields=DOCTOR_FIELDS, limit=SEARCH_RESULT_LIMIT):
+        return self._search('doctors', term, fields, limit)
+
+    def search_patients(self, term, fields=PATIENT_FIELDS, limit=SEARCH_RESULT_LIMIT):
+        return self._search('patients', term, fields, limit)
+
+
+class PostgresTrigramBackend(SearchBackend):
+    """
+    PostgreSQL pg_trgm backend. Expression GIN indexes on the base tables
+    are maintained by PostgreSQL itself, so no sync code is needed.
+    """
+
+    name = 'postgres-trgm'
+
+    SCHEMA = [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        "CREATE INDEX IF NOT EXISTS idx_doctors_search_trgm ON doctors USING gin "
+        "(lower(first_name || ' ' || last_name || ' ' || coalesce(license_number, '')) gin_trgm_ops)",
+        "CREATE INDEX IF NOT EXISTS idx_patients_search_trgm ON patients USING gin "
+        "(lower(first_name || ' ' || last_name || ' ' || coalesce(phone, '')) gin_trgm_ops)",
+        "CREATE INDEX IF NOT EXISTS idx_users_search_trgm ON users USING gin "
+        "(lower(username || ' ' || email) gin_trgm_ops)",
+    ]
+
+    def ensure_index(self) -> None:
+        with db.engine.begin() as conn:
+            for statement in self.SCHEMA:
+                conn.execute(text(statement))
+
+    def _search(self, id_column: str, document_sql: str, from_sql: str, term: str,
+                limit: Optional[int]) -> List[int]:
+        tokens = tokenize(term)
+        if not tokens:
+            return []
+        # Each token must occur in the document (as a substring) or be trigram-similar to it
+        conditions = []
+        params: Dict[str, object] = {'term': ' '.join(tokens), 'limit': limit}
+        for i, token in enumerate(tokens):
+            params[f'p{i}'] = f'%{token}%'
+            params[f't{i}'] = token
+            conditions.append(f"({document_sql} LIKE :p{i} OR :t{i} <% {document_sql})")
+        query = text(
+            f"SELECT id FROM (SELECT {id_column} AS id, {document_sql} AS document "
+            f"FROM {from_sql} WHERE {' AND '.join(conditions)}) matches "
+            f"ORDER BY similarity(document, :term) DESC{_limit_clause(limit)}"
+        )
+        return [row[0] for row in db.session.execute(query, params).all()]
+
+    def search_doctors(self, term, fields=DOCTOR_FIELDS, limit=SEARCH_RESULT_LIMIT):
+        if 'license_number' in fields:
+            document = "lower(doctors.first_name || ' ' || doctors.last_name || ' ' || coalesce(doctors.license_number, ''))"
+        else:
+            document = "lower(doctors.first_name || ' ' || doctors.last_name)"
+        return self._search('doctors.id', document, 'doctors', term, limit)
+
+    def search_patients(self, term, fields=PATIENT_FIELDS, limit=SEARCH_RESULT_LIMIT):
+        document = ("lower(patients.first_name || ' ' || patients.last_name || ' ' || coalesce(patients.phone, '') "
+                    "|| ' ' || coalesce(users.username, '') || ' ' || coalesce(users.email, ''))")
+        return self._search('patients.id', document, 'patients LEFT JOIN users ON users.id = patients.user_id',
+                            term, limit)
+
+
+class LikeSearchBackend(SearchBackend):
+    """ILIKE fallback for databases without a full-text backend"""
+
+    name = 'like'
+
+    def search_doctors(self, term, fields=DOCTOR_FIELDS, limit=SEARCH_RESULT_LIMIT):
+        from models import Doctor
+        pattern = f'%{term.strip()}%'
+        query = db.session.query(Doctor.id).filter(
+            or_(*[getattr(Doctor, field).ilike(pattern) for field in fields])
+        )
+        return [row[0] for row in query.limit(limit).all()]
+
+    def search_patients(self, term, fields=PATIENT_FIELDS, limit=SEARCH_RESULT_LIMIT):
+        from models import Patient, User
+        pattern = f'%{term.strip()}%'
+        columns = [getattr(User if field in ('email', 'username') else Patient, field) for field in fields]
+        query = db.session.query(Patient.id).outerjoin(User, User.id == Patient.user_id).filter(
+            or_(*[column.ilike(pattern) for column in columns])
+        )
+        return [row[0] for row in query.limit(limit).all()]
+
+
+_backends: Dict[str, SearchBackend] = {}
+
+
+def _create_backend() -> SearchBackend:
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        return SQLiteFTSBackend()
+    if dialect == 'postgresql':
+        return PostgresTrigramBackend()
+    return LikeSearchBackend()
+
+
+def get_search_backend() -> SearchBackend:
+    """
+    Return the search backend for the current database, creating its
+    index structures on first use. Falls back to ILIKE if setup fails.
+    """
+    url = str(db.engine.url)
+    backend = _backends.get(url)
+    if backend is None:
+        backend = _create_backend()
+        try:
+            backend.ensure_index()
+        except Exception as exc:
+            logger.warning("Search backend %s unavailable, falling back to ILIKE: %s", backend.name, exc)
+            backend = LikeSearchBackend()
+        _backends[url] = backend
+    return backend
+
+
+def order_by_rank(items: List, ranked_ids: List[int]) -> List:
+    """Order model instances by the rank returned from the search backend"""
+    rank = {item_id: position for position, item_id in enumerate(ranked_ids)}
+    return sorted(items, key=lambda item: rank.get(item.id, len(rank)))
+
+
+def search_doctor_ids(term: str, fields: Iterable[str] = DOCTOR_FIELDS,
+                      limit: Optional[int] = SEARCH_RESULT_LIMIT) -> List[int]:
+    return get_search_backend().search_doctors(term, fields=fields, limit=limit)
+
+
+def search_patient_ids(term: str, fields: Iterable[str] = PATIENT_FIELDS,
+                       limit: Optional[int] = SEARCH_RESULT_LIMIT) -> List[int]:
+    return get_search_backend().search_patients(term, fields=fields, limit=limit)
+
+
+def rebuild_search_index() -> Optional[str]:
+    """Rebuild search index contents; returns the backend name"""
+    backend = get_search_backend()
+    backend.rebuild()
+    return backend.name
@@ -0,0 +1,264 @@
+"""
+In-memory typeahead index for doctors, departments and patients
+
+Each entity kind has its own sorted array of lowercase keys (first name,
+last name, full name, license number) searched with bisect, so a lookup
+costs O(log n + k). The index is built lazily from the database, updated
+incrementally from ORM events after each commit, and fully refreshed every
+SUGGEST_INDEX_TTL seconds to pick up writes made by other worker processes.
+
+A refresh runs in one request at a time; concurrent requests keep using the
+old index until it is swapped out. Changes committed while a rebuild runs
+are replayed onto the new index before the swap.
+"""
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from database import db
+from models import Department, Doctor, Patient
+
+logger = logging.getLogger(__name__)
+
+SUGGEST_INDEX_TTL = int(os.environ.get('SUGGEST_INDEX_TTL', '600'))  # seconds
+SUGGEST_KINDS = ('doctor', 'department', 'patient')
+
+
+class PrefixIndex:
+    """Sorted array of (key, entity id) pairs supporting prefix lookups"""
+
+    def __init__(self):
+        self.keys: List[str] = []
+        self.ids: List[int] = []
+        self.entries: Dict[int, dict] = {}  # id -> {'label', 'active', 'keys'}
+
+    @classmethod
+    def build(cls, records) -> 'PrefixIndex':
+        """Build from (id, label, active, keys) records in one sort"""
+        index = cls()
+        pairs = []
+        for entity_id, label, active, keys in records:
+            index.entries[entity_id] = {'label': label, 'active': active, 'keys': keys}
+            pairs.extend((key, entity_id) for key in keys)
+        pairs.sort()
+        index.keys = [key for key, _ in pairs]
+        index.ids = [entity_id for _, entity_id in pairs]
+        return index
+
+    def add(self, entity_id: int, label: str, active: bool, keys: List[str]) -> None:
+        self.remove(entity_id)
+        self.entries[entity_id] = {'label': label, 'active': active, 'keys': keys}
+        for key in keys:
+            position = bisect_left(self.keys, key)
+            # Keep (key, id) ordering stable for duplicate keys
+            while position < len(self.keys) and self.keys[position] == key and self.ids[position] < entity_id:
+                position += 1
+            self.keys.insert(position, key)
+            self.ids.insert(position, entity_id)
+
+    def remove(self, entity_id: int) -> None:
+        entry = self.entries.pop(entity_id, None)
+        if not entry:
+            return
+        for key in entry['keys']:
+            position = bisect_left(self.keys, key)
+            while position < len(self.keys) and self.keys[position] == key:
+                if self.ids[position] == entity_id:
+                    del self.keys[position]
+                    del self.ids[position]
+                    break
+                position += 1
+
+    def lookup(self, prefix: str, limit: int, active_only: bool) -> List[Tuple[int, str]]:
+        results = []
+        seen = set()
+        position = bisect_left(self.keys, prefix)
+        while position < len(self.keys) and len(results) < limit:
+            if not self.keys[position].startswith(prefix):
+                break
+            entity_id = self.ids[position]
+            position += 1
+            if entity_id in seen:
+                continue
+            seen.add(entity_id)
+            entry = self.entries[entity_id]
+            if active_only and not entry['active']:
+                continue
+            results.append((entity_id, entry['label']))
+        return results
+
+
+def _name_keys(*parts) -> List[str]:
+    """Index keys for a record: each part, plus the full name"""
+    parts = [part.strip().lower() for part in parts if part and part.strip()]
+    keys = set(parts)
+    if len(parts) > 1:
+        keys.add(' '.join(parts))
+    return sorted(keys)
+
+
+def doctor_record(doctor_id, first_name, last_name, license_number, is_active):
+    keys = _name_keys(first_name, last_name)
+    if license_number:
+        keys.append(license_number.strip().lower())
+    return doctor_id, f"Dr. {first_name} {last_name}", bool(is_active), keys
+
+
+def department_record(department_id, name):
+    keys = sorted({name.strip().lower(), *name.lower().split()}) if name else []
+    return department_id, name, True, keys
+
+
+def patient_record(patient_id, first_name, last_name, is_active):
+    return patient_id, f"{first_name} {last_name}", bool(is_active), _name_keys(first_name, last_name)
+
+
+def _apply_changes(indexes: Dict[str, PrefixIndex], changes) -> None:
+    for action, kind, record in changes:
+        index = indexes.get(kind)
+        if index is None:
+            continue
+        if action == 'delete':
+            index.remove(record[0])
+        else:
+            index.add(*record)
+
+
+class SuggestIndex:
+    """Typeahead index over all suggestion kinds"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()  # Held for the whole of a rebuild
+        self._indexes: Dict[str, PrefixIndex] = {}
+        self._built_at: Optional[float] = None
+        self._pending: Optional[List[Tuple[str, str, tuple]]] = None  # Changes applied during a rebuild
+
+    def is_stale(self) -> bool:
+        return self._built_at is None or time.monotonic() - self._built_at > SUGGEST_INDEX_TTL
+
+    def rebuild(self) -> None:
+        """Full rebuild from the database (requires app context)"""
+        with self._rebuild_lock:
+            self._rebuild()
+
+    def refresh(self) -> None:
+        """
+        Rebuild if stale. Only the first build makes callers wait; after that a
+        caller finding a rebuild already running carries on with the old index.
+        """
+        if not self.is_stale():
+            return
+        if not self._rebuild_lock.acquire(blocking=self._built_at is None):
+            return
+        try:
+            if self.is_stale():
+                self._rebuild()
+        finally:
+            self._rebuild_lock.release()
+
+    def _rebuild(self) -> None:
+        start = time.perf_counter()
+        with self._lock:
+            self._pending = []
+        try:
+            indexes = {
+                'doctor': PrefixIndex.build(
+                    doctor_record(*row) for row in db.session.query(
+                        Doctor.id, Doctor.first_name, Doctor.last_name, Doctor.license_number, Doctor.is_active
+                    )
+                ),
+                'department': PrefixIndex.build(
+                    department_record(*row) for row in db.session.query(Department.id, Department.name)
+                ),
+                'patient': PrefixIndex.build(
+                    patient_record(*row) for row in db.session.query(
+                        Patient.id, Patient.first_name, Patient.last_name, Patient.is_active
+                    )
+                ),
+            }
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+        with self._lock:
+            _apply_changes(indexes, self._pending)
+            self._pending = None
+            self._indexes = indexes
+            self._built_at = time.monotonic()
+        logger.info("Rebuilt suggest index in %.1f ms", (time.perf_counter() - start) * 1000)
+
+    def apply(self, changes: List[Tuple[str, str, tuple]]) -> None:
+        """Apply (action, kind, record) changes collected from a committed session"""
+        with self._lock:
+            if self._pending is not None:
+                self._pending.extend(changes)
+            _apply_changes(self._indexes, changes)
+
+    def suggest(self, query: str, kinds=SUGGEST_KINDS, limit: int = 8, include_inactive: bool = False) -> List[dict]:
+        self.refresh()
+        prefix = ' '.join(query.lower().split())
+        if not prefix:
+            return []
+        suggestions = []
+        with self._lock:
+            for kind in kinds:
+                index = self._indexes.get(kind)
+                if index is None:
+                    continue
+                for entity_id, label in index.lookup(prefix, limit - len(suggestions), not include_inactive):
+                    suggestions.append({'type': kind, 'id': entity_id, 'label': label})
+                if len(suggestions) >= limit:
+                    break
+        return suggestions
+
+
+suggest_index = SuggestIndex()
+
+
+# ==================== INCREMENTAL UPDATES ====================
+
+def _record_for(target) -> Optional[Tuple[str, tuple]]:
+    if isinstance(target, Doctor):
+        return 'doctor', doctor_record(target.id, target.first_name, target.last_name,
+                                       target.license_number, target.is_active)
+    if isinstance(target, Department):
+        return 'department', department_record(target.id, target.name)
+    if isinstance(target, Patient):
+        return 'patient', patient_record(target.id, target.first_name, target.last_name, target.is_active)
+    return None
+
+
+def _queue_change(action):
+    def listener(mapper, connection, target):
+        kind_record = _record_for(target)
+        if kind_record is None:
+            return
+        session = Session.object_session(target)
+        if session is not None:
+            session.info.setdefault('suggest_changes', []).append((action, *kind_record))
+    return listener
+
+
+for _model in (Doctor, Department, Patient):
+    event.listen(_model, 'after_insert', _queue_change('upsert'))
+    event.listen(_model, 'after_update', _queue_change('upsert'))
+    event.listen(_model, 'after_delete', _queue_change('delete'))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_suggest_changes(session):
+    changes = session.info.pop('suggest_changes', None)
+    if changes:
+        suggest_index.apply(changes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_suggest_changes(session):
+    session.info.pop('suggest_changes', None)
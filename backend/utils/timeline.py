@@ -0,0 +1,48 @@
+"""
+Patient timeline: per-patient history summary cache
+
+The timeline (GET /api/history/timeline) pages through a patient's
+appointments from both tiers with their treatment, doctor and patient rows
+eager-loaded (utils/archive.py). Its summary counts come from one grouped
+query, patient_summary(), cached in Redis under patient:summary:<id>.
+
+Writes drop the cached summary instead of waiting for the TTL:
+drop_summary_for_event() runs in the web process as an outbox consumer after
+every appointment change commits, and treatment writes call
+invalidate_patient_summary() directly. The cached row carries its date
+because the upcoming count moves at midnight without any write.
+"""
+import os
+from datetime import date
+
+from utils.archive import patient_summary
+from utils.cache import cache_get_json, cache_set_json, cache_delete
+
+PATIENT_SUMMARY_TTL = int(os.environ.get('PATIENT_SUMMARY_TTL', '300'))  # Bounds staleness from writes that emit no event
+
+
+def _summary_key(patient_id):
+    return f"patient:summary:{patient_id}"
+
+
+def get_patient_summary(patient_id):
+    """The patient's cached summary, recomputed on a miss or a new day"""
+    today = date.today()
+    cached = cache_get_json(_summary_key(patient_id))
+    if cached is not None and cached.get('date') == today.isoformat():
+        return cached
+
+    summary = patient_summary(patient_id, today)
+    cache_set_json(_summary_key(patient_id), summary, ttl=PATIENT_SUMMARY_TTL)
+    return summary
+
+
+def invalidate_patient_summary(patient_id):
+    cache_delete(_summary_key(patient_id))
+
+
+def drop_summary_for_event(message):
+    """In-process outbox consumer: the patient's counts changed with this appointment"""
+    patient_id = message['payload'].get('patient_id')
+    if patient_id:
+        invalidate_patient_summary(patient_id)
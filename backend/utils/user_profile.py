@@ -0,0 +1,110 @@
+"""
+Login lookup, JWT claims and the cached current-user profile
+
+Login reads the user, their profile id and their name in one indexed
+statement and puts role, profile id and display name into the token as
+claims, so the login response no longer serializes a Doctor/Patient (with
+its department and user lazy loads). The full profile is fetched lazily from
+GET /api/auth/me, which serves a copy cached in Redis under
+user:profile:<user_id> together with its ETag; clients that send the ETag
+back in If-None-Match get a 304.
+
+Routes that edit a user, doctor or patient call invalidate_user_profile();
+department edits drop every cached profile (doctor profiles carry the
+department name). USER_PROFILE_TTL bounds anything else.
+"""
+import hashlib
+import json
+import os
+
+from sqlalchemy import select
+
+from database import db
+from models import Doctor, Patient, User
+from utils.cache import cache_get_json, cache_set_json, cache_delete, cache_delete_pattern
+
+USER_PROFILE_TTL = int(os.environ.get('USER_PROFILE_TTL', '300'))
+
+
+def _profile_key(user_id):
+    return f"user:profile:{user_id}"
+
+
+def _find_user(condition):
+    row = db.session.execute(
+        select(User, Doctor.id, Doctor.first_name, Doctor.last_name, Patient.id, Patient.first_name, Patient.last_name)
+        .outerjoin(Doctor, Doctor.user_id == User.id)
+        .outerjoin(Patient, Patient.user_id == User.id)
+        .where(condition)
+    ).first()
+    if row is None:
+        return None, None, None
+    user, doctor_id, doctor_first, doctor_last, patient_id, patient_first, patient_last = row
+    if user.role == 'doctor' and doctor_id:
+        return user, doctor_id, f"{doctor_first} {doctor_last}"
+    if user.role == 'patient' and patient_id:
+        return user, patient_id, f"{patient_first} {patient_last}"
+    return user, None, user.username
+
+
+def find_login_user(username):
+    """(user, profile_id, display_name) for a username in one statement, or (None, None, None)"""
+    return _find_user(User.username == username)
+
+
+def find_token_user(user_id):
+    """(user, profile_id, display_name) by id, for refreshed tokens to carry current claims"""
+    return _find_user(User.id == user_id)
+
+
+def token_claims(user, profile_id, display_name):
+    """Claims carried by access and refresh tokens"""
+    return {'role': user.role, 'username': user.username, 'profile_id': profile_id, 'name': display_name}
+
+
+def _build_profile(user):
+    profile = None
+    if user.role == 'patient' and user.patient_profile:
+        profile = user.patient_profile.to_dict()
+    elif user.role == 'doctor' and user.doctor_profile:
+        profile = user.doctor_profile.to_dict()
+    elif user.role == 'admin':
+        profile = {
+            'id': user.id,
+            'username': user.username,
+            'email': user.email,
+            'role': 'admin'
+        }
+    return {
+        'user': {
+            'id': user.id,
+            'username': user.username,
+            'email': user.email,
+            'role': user.role,
+            'is_active': user.is_active,
+            'profile': profile
+        }
+    }
+
+
+def get_user_profile(user_id):
+    """(body, etag) of GET /api/auth/me for a user, or (None, None) if the user does not exist"""
+    cached = cache_get_json(_profile_key(user_id))
+    if cached is not None:
+        return cached['body'], cached['etag']
+
+    user = User.query.get(user_id)
+    if not user:
+        return None, None
+    body = _build_profile(user)
+    etag = hashlib.sha1(json.dumps(body, sort_keys=True, default=str).encode()).hexdigest()
+    cache_set_json(_profile_key(user_id), {'body': body, 'etag': etag}, ttl=USER_PROFILE_TTL)
+    return body, etag
+
+
+def invalidate_user_profile(user_id):
+    cache_delete(_profile_key(user_id))
+
+
+def invalidate_all_user_profiles():
+    cache_delete_pattern("user:profile:*")
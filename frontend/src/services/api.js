@@ -104,4 +104,13 @@ api.interceptors.response.use(
   }
 );
 
+// Run several GETs in one round trip (POST /api/batch).
+// paths: { key: '/patient/appointments', ... } relative to the API base URL.
+// Resolves to { key: { status, body } }; each entry succeeds or fails on its own.
+export const batchGet = async (paths) => {
+  const requests = Object.entries(paths).map(([id, path]) => ({ id, path: `/api${path}` }));
+  const { data } = await api.post('/batch', { requests });
+  return Object.fromEntries(data.responses.map(({ id, status, body }) => [id, { status, body }]));
+};
+
 export default api;